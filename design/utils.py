@@ -14,6 +14,8 @@ from design.models import ServiceConsists, MaterialRequirements, EquipmentRequir
 from design.script_file_header import ScriptFileHeader, get_master_field_script, get_admin_script, get_model_footer
 
 from kernel.models import Organization as kernel_Organization, Role as kernel_Role, Operator as kernel_Operator, Resource as kernel_Resource, Service as kernel_Service, Event as kernel_Event, Instruction as kernel_Instruction, ServiceRule as kernel_ServiceRule, WorkOrder as kernel_WorkOrder, Form as kernel_Form, SysParams as kernel_SysParams
+from kernel.rule_cache import rule_dispatch_table
+from kernel.metadata_cache import metadata_cache
 from applications.models import CLASS_MAPPING
 # Material as applications_Material, Equipment as applications_Equipment, Device as applications_Device, Capital as applications_Capital, Knowledge as applications_Knowledge
 
@@ -300,6 +302,10 @@ def generate_source_code(project):
             }
         )
 
+        # 定义已更新：使全部进程的元数据缓存失效，并重建本进程的运行时规则分派表
+        metadata_cache.bump()
+        rule_dispatch_table.rebuild()
+
     # 生成脚本
     def generate_script(data_item):
         def _generate_field_definitions(data_item):
@@ -24,4 +24,8 @@ app.conf.beat_schedule = {
         'task': 'kernel.tasks.task_backup_data',
         'schedule': 30,  # 30秒
     },
+    'compact-snapshots-daily': {
+        'task': 'kernel.tasks.compact_snapshots_task',
+        'schedule': crontab(hour=3, minute=0),  # 每天凌晨3点
+    },
 }
\ No newline at end of file
@@ -238,3 +238,55 @@ WECHAT_MCH_KEY = env('WECHAT_MCH_KEY')
 WECHAT_NOTIFY_URL = env('WECHAT_NOTIFY_URL')
 
 CUSTOMER_SITE_NAME = 'erp'
+
+# 内核定义元数据（服务、规则、工单等）缓存比对共享代数的间隔（秒），即其它进程修改定义后的最长生效延迟
+KERNEL_METADATA_CHECK_INTERVAL = 1.0
+
+# 进程上下文快照每隔多少个版本写一次全量关键帧，其余版本只写增量
+KERNEL_SNAPSHOT_KEYFRAME_INTERVAL = 10
+
+# 快照压缩时未终止进程保留的最新版本数（已终止进程只保留最终版本）
+KERNEL_SNAPSHOT_RETAIN_VERSIONS = 20
+
+# 工作进程内缓存的上下文堆栈数量与估算字节数上限
+KERNEL_CONTEXT_CACHE_SIZE = 256
+KERNEL_CONTEXT_CACHE_BYTES = 64 * 1024 * 1024
+
+# 任务列表推送合并窗口（秒）：窗口内同一推送目标只推送一次；0 表示同步推送
+KERNEL_BROADCAST_WINDOW = 0.2
+
+# 每个任务列表流保留的最近增量条数，供断线重连的客户端续传
+KERNEL_TASK_STREAM_BUFFER = 64
+
+# 任务列表流发布锁的有效期与等待上限（秒）：同一个流的并发发布串行执行
+KERNEL_TASK_STREAM_LOCK_TIMEOUT = 5
+
+# 内核调度运行队列：每批认领的进程数、每次时钟中断最多处理的批数
+KERNEL_SCHEDULER_BATCH_SIZE = 100
+KERNEL_SCHEDULER_MAX_BATCHES = 10
+# 调度策略：strict_priority（严格优先级）或 priority_aging（优先级老化，每等待 KERNEL_SCHEDULER_AGING_STEP 秒有效优先级加1）
+KERNEL_SCHEDULER_POLICY = 'strict_priority'
+KERNEL_SCHEDULER_AGING_STEP = 60
+
+# 多调度者集群：运行队列分区数、分区方式（id：进程id取模；organization：操作员所属组织取模）、调度者租约有效期（秒）
+KERNEL_SCHEDULER_PARTITIONS = 16
+KERNEL_SCHEDULER_PARTITION_BY = 'id'
+KERNEL_SCHEDULER_LEASE_TTL = 90
+# 常驻调度者（manage.py run_scheduler）空闲时两次调度的间隔（秒）
+KERNEL_SCHEDULER_TICK_INTERVAL = 1.0
+
+# 定时器引擎（manage.py run_timer_wheel）：内存中装载未来多少秒内到期的定时器、每批评估的定时器数、
+# 无到期定时器时的轮询间隔（秒，亦即计划变更的最长生效延迟）、租约有效期（秒）、整窗重新装载的间隔（秒）、
+# 过期定时器的补发期限（秒）
+KERNEL_TIMER_HORIZON = 300
+KERNEL_TIMER_BATCH_SIZE = 500
+KERNEL_TIMER_POLL_INTERVAL = 0.1
+KERNEL_TIMER_LEASE_TTL = 30
+KERNEL_TIMER_RELOAD_INTERVAL = 60
+KERNEL_TIMER_LATE_LIMIT = 3600
+
+# 系统调用执行模式：async（全部经Celery异步执行）或 inline（工作进程内产生的后续系统调用在本进程内联执行）；
+# 内联链路的最大嵌套深度与时间预算（秒），超出后其余调用交还 Celery
+KERNEL_SYS_CALL_MODE = 'async'
+KERNEL_SYS_CALL_INLINE_DEPTH = 16
+KERNEL_SYS_CALL_INLINE_BUDGET = 0.5
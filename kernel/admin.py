@@ -7,9 +7,12 @@ from django.conf import settings
 from django.http import JsonResponse
 from django.contrib.contenttypes.admin import GenericStackedInline
 
+import copy
+
 from kernel.models import *
 from kernel.sys_lib import search_profiles, get_entity_profile, get_program_entrypoints, ProcessCreator, ProcessExecutionContext, RuleEvaluator
 from kernel.views import CustomTokenObtainPairView, CustomTokenRefreshView
+from kernel.metadata_cache import metadata_cache
 
 admin.site.site_header = "..运营平台"
 admin.site.site_title = ".."
@@ -44,7 +47,8 @@ class ApplicationsSite(admin.AdminSite):
         context = {}
 
         # 实体类型
-        entity_types = SysParams.objects.get(label='实体类型').config
+        # 缓存的配置为各请求共享，复制后再追加入口点
+        entity_types = copy.deepcopy(metadata_cache.config(SysParams, '实体类型'))
         # 为每个实体类型添加其对应的服务入口点
         for entity_type in entity_types:
             model_str = entity_type['model'].lower()  # 转换为小写
@@ -139,7 +143,7 @@ class ApplicationsSite(admin.AdminSite):
 
         # 获取服务
         service_rule_id = kwargs.get('service_rule_id', None)
-        service_rule = ServiceRule.objects.get(erpsys_id = service_rule_id)
+        service_rule = metadata_cache.get(ServiceRule, erpsys_id=service_rule_id)
         
         # 获取服务对象类型
         service = service_rule.service
@@ -6,4 +6,9 @@ class KernelConfig(AppConfig):
 
     def ready(self):
         import kernel.scheduler
+        import kernel.rule_cache
+        import kernel.metadata_cache
+        import kernel.permission_cache
+        import kernel.resource_calendar
+        import kernel.timer_wheel
         import kernel.models  # 添加这行以确保信号被注册
@@ -0,0 +1,565 @@
+"""
+内核性能基准：通过 `python manage.py kernel_benchmark <name>` 运行。
+每个基准函数返回一个结果字典，由管理命令统一打印。
+"""
+from types import SimpleNamespace
+import json
+import time
+
+# 典型的事件表达式与评估上下文（取自 business_define.json）
+SAMPLE_EXPRESSIONS = [
+    "process_state=='TERMINATED'",
+    "process_state=='NEW'",
+    "process_state=='SUSPENDED'",
+    "batch_completed==True",
+    "process_state=='RUNNING' and process_priority > 0",
+]
+
+SAMPLE_CONTEXT = {
+    'process_id': '00000000-0000-0000-0000-000000000000',
+    'process_name': '基准进程',
+    'process_state': 'TERMINATED',
+    'process_service': 'benchmark',
+    'process_operator': None,
+    'process_priority': 0,
+    'batch_completed': False,
+}
+
+def _rate(count, seconds):
+    return round(count / seconds) if seconds > 0 else None
+
+def bench_rule_evaluation(iterations: int = 100000) -> dict:
+    """对比原始字符串eval与编译缓存的规则评估吞吐（次/秒）"""
+    from kernel.rule_cache import CompiledExpressionCache
+
+    n = len(SAMPLE_EXPRESSIONS)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        eval(SAMPLE_EXPRESSIONS[i % n], {}, dict(SAMPLE_CONTEXT))
+    raw_seconds = time.perf_counter() - start
+
+    cache = CompiledExpressionCache()
+    start = time.perf_counter()
+    for i in range(iterations):
+        cache.evaluate(i % n, SAMPLE_EXPRESSIONS[i % n], dict(SAMPLE_CONTEXT))
+    cached_seconds = time.perf_counter() - start
+
+    return {
+        'iterations': iterations,
+        'raw_eval_per_second': _rate(iterations, raw_seconds),
+        'cached_eval_per_second': _rate(iterations, cached_seconds),
+        'speedup': round(raw_seconds / cached_seconds, 2) if cached_seconds > 0 else None,
+        'cache_stats': cache.stats(),
+    }
+
+def _sample_stack(depth: int, vars_per_frame: int) -> dict:
+    """模拟ContextStack.to_dict()：每帧只保存自己的变量，以 parent 下标引用父帧"""
+    frames = []
+    for d in range(depth):
+        local_vars = {f'var_{d}_{i}': f'value_{d}_{i}' for i in range(vars_per_frame)}
+        frames.append({
+            'process_id': f'process-{d}',
+            'status': 'ACTIVE',
+            'parent': d - 1 if d else None,
+            'local_vars': local_vars,
+            'return_value': None,
+            'error_info': None,
+            'events_triggered_log': [],
+        })
+    return {'frames': frames}
+
+def _next_version(data: dict, version: int) -> dict:
+    """模拟一次上下文变更：栈顶帧修改一个变量并追加一条事件日志"""
+    data = json.loads(json.dumps(data))
+    top = data['frames'][-1]
+    top['local_vars']['process_state'] = f'STATE_{version}'
+    top['events_triggered_log'].append({'rule_id': f'rule-{version}', 'evaluated_at': f'2025-01-01T00:00:{version % 60:02d}'})
+    return data
+
+def bench_snapshot_storage(versions: int = 50, vars_per_frame: int = 20, depths=(1, 5, 20)) -> dict:
+    """对比全量快照与“关键帧+增量”快照的写入字节数和最新版本还原耗时"""
+    from kernel.snapshots import encode_snapshot, _replay, get_keyframe_interval, SNAPSHOT_FULL
+
+    results = {'keyframe_interval': get_keyframe_interval(), 'versions': versions}
+    for depth in depths:
+        data = _sample_stack(depth, vars_per_frame)
+        full_rows, delta_rows = [], []
+        base = None
+        for version in range(1, versions + 1):
+            data = _next_version(data, version)
+            full_rows.append(json.dumps(data))
+            encoded = encode_snapshot(version, data, base)
+            payload = encoded['context_data'] if encoded['snapshot_type'] == SNAPSHOT_FULL else encoded['context_delta']
+            delta_rows.append((encoded['snapshot_type'], json.dumps(payload)))
+            base = json.loads(json.dumps(data))
+
+        # 还原最新版本：全量直接解码；增量从最近关键帧开始回放
+        keyframe_index = max(i for i, row in enumerate(delta_rows) if row[0] == SNAPSHOT_FULL)
+        rounds = 200
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            json.loads(full_rows[-1])
+        full_restore = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            chain = []
+            for snapshot_type, payload in delta_rows[keyframe_index:]:
+                decoded = json.loads(payload)
+                chain.append(SimpleNamespace(
+                    snapshot_type=snapshot_type,
+                    context_data=decoded if snapshot_type == SNAPSHOT_FULL else None,
+                    context_delta=decoded if snapshot_type != SNAPSHOT_FULL else None,
+                ))
+            restored = _replay(chain)
+        delta_restore = (time.perf_counter() - start) / rounds
+        assert restored == data, "增量回放结果与全量不一致"
+
+        full_bytes = sum(len(row) for row in full_rows)
+        delta_bytes = sum(len(row[1]) for row in delta_rows)
+        results[f'depth_{depth}'] = {
+            'full_bytes_per_process': full_bytes,
+            'delta_bytes_per_process': delta_bytes,
+            'bytes_ratio': round(delta_bytes / full_bytes, 3),
+            'full_restore_ms': round(full_restore * 1000, 3),
+            'delta_restore_ms': round(delta_restore * 1000, 3),
+        }
+    return results
+
+def bench_context_exit(rounds: int = 200, sizes=((1, 10), (5, 20), (20, 50))) -> dict:
+    """
+    上下文退出时的序列化开销（毫秒/次）：
+    - legacy: to_dict + normalize + json.dumps + sha256，保存时再 to_dict + jsonschema.validate + 全量序列化；
+    - pipeline: 单次规范序列化 + 哈希，预编译校验器（可信写入跳过校验），文本直接写库。
+    """
+    import hashlib
+    import jsonschema
+    from kernel.types import CONTEXT_SCHEMA
+    from kernel.snapshots import serialize_context
+
+    def normalize(d):
+        if isinstance(d, dict):
+            return {k: normalize(v) for k, v in d.items()}
+        elif isinstance(d, list):
+            return [normalize(x) for x in d]
+        return d
+
+    results = {}
+    for depth, vars_per_frame in sizes:
+        data = _sample_stack(depth, vars_per_frame)
+        to_dict = lambda: json.loads(json.dumps(data))  # 模拟 ContextStack.to_dict() 的构建开销
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            hashlib.sha256(json.dumps(normalize(to_dict()), sort_keys=True).encode()).hexdigest()
+            context_data = to_dict()
+            jsonschema.validate(context_data, CONTEXT_SCHEMA)
+            json.dumps(context_data)
+        legacy = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            serialize_context(to_dict(), validate=True)
+        validated = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            serialize_context(to_dict())
+        trusted = (time.perf_counter() - start) / rounds
+
+        results[f'depth_{depth}_vars_{vars_per_frame}'] = {
+            'context_bytes': len(json.dumps(data)),
+            'legacy_ms': round(legacy * 1000, 3),
+            'pipeline_validated_ms': round(validated * 1000, 3),
+            'pipeline_trusted_ms': round(trusted * 1000, 3),
+        }
+    return results
+
+def _sample_task_rows(count: int, version: int = 0) -> list:
+    """模拟 get_represent_list 生成的任务行（含行键）"""
+    return [
+        {
+            '_key': f'00000000-0000-0000-0000-{i:012d}',
+            'pid': i,
+            'service_label': '会诊服务',
+            'entity_label': f'客户{i}',
+            'operator_label': f'医生{i % 20}',
+            'state': 'NEW',
+            'priority': i % 3,
+            'scheduled_time': '25-01-01 09:00',
+            'path': f'/erp/applications/huizhen/{i}/change/',
+        }
+        for i in range(count)
+    ]
+
+def bench_task_list_delta(rows: int = 300, changes: int = 1) -> dict:
+    """对比任务列表每次变更时全量推送与增量推送的消息字节数"""
+    from kernel.task_stream import _build_state, _diff_list
+
+    def task_lists(task_rows):
+        return [{'title': '今日安排', 'task_list': task_rows, 'task_head': []}]
+
+    old_rows = _sample_task_rows(rows)
+    cases = {}
+
+    # 1. 若干行状态变化
+    new_rows = [dict(row) for row in old_rows]
+    for row in new_rows[:changes]:
+        row['state'] = 'READY'
+    # 2. 新增一行
+    inserted = old_rows[:rows // 2] + _sample_task_rows(rows + 1)[rows:] + old_rows[rows // 2:]
+    # 3. 删除一行
+    removed = old_rows[1:]
+
+    for name, rows_after in (('update', new_rows), ('insert', inserted), ('remove', removed)):
+        old_state = _build_state(task_lists(old_rows), 1)
+        new_state = _build_state(task_lists(rows_after), 2)
+        change = _diff_list(0, old_state['lists'][0], new_state['lists'][0], rows_after)
+        full_bytes = len(json.dumps({'type': 'snapshot', 'seq': 2, 'lists': task_lists(rows_after)}))
+        delta_bytes = len(json.dumps({'type': 'delta', 'seq': 2, 'base': 1, 'lists': [change]}))
+        cases[name] = {
+            'snapshot_bytes': full_bytes,
+            'delta_bytes': delta_bytes,
+            'ratio': round(full_bytes / delta_bytes, 1),
+        }
+    return {'rows': rows, 'cases': cases}
+
+def _scheduler_bench_worker(partitions, partition_count, tag, work_ms, batch_size):
+    """调度扩展性基准的子进程：调度本分区内的基准进程直到队列取尽"""
+    from django.db.models.signals import post_save
+    import kernel.run_queue as run_queue
+    from kernel.models import Process
+    from kernel.run_queue import RunQueue, StrictPriorityPolicy
+    from kernel.scheduler_cluster import partition_queryset
+
+    # 基准进程不推送任务列表；每次资源分配模拟 work_ms 毫秒的调度工作
+    post_save.disconnect(sender=Process, dispatch_uid="post_save_process")
+    def allocate(process):
+        time.sleep(work_ms / 1000)
+        return True
+    run_queue.attempt_resource_allocation = allocate
+
+    queryset = partition_queryset(partitions, partition_count, 'id').filter(name=tag)
+    RunQueue(policy=StrictPriorityPolicy(), batch_size=batch_size, max_batches=10 ** 6, queryset=queryset, name=tag).dispatch()
+
+def bench_scheduler_scaling(processes: int = 2000, workers=(1, 2, 4), work_ms: float = 2.0, batch_size: int = 50) -> dict:
+    """
+    多调度者扩展性：N 个调度者子进程各自调度分配到的分区，比较调度吞吐（进程/秒）。
+    每次运行前批量创建就绪的基准进程，运行后删除；需使用支持并发写入的数据库（PostgreSQL）。
+    """
+    import multiprocessing
+    from django.db import connections
+    from kernel.models import Process
+    from kernel.types import ProcessState
+    from kernel.pid_allocator import reserve_pids
+    from kernel.scheduler_cluster import assign_partitions, get_partition_count
+
+    partition_count = get_partition_count()
+    context = multiprocessing.get_context('fork')
+    results = {}
+    baseline = None
+    for count in workers:
+        tag = f'benchmark-scheduler-{count}-{time.time_ns()}'
+        pids = reserve_pids(processes)
+        Process.objects.bulk_create(
+            [Process(name=tag, pid=pid, state=ProcessState.READY.name, priority=i % 3) for i, pid in enumerate(pids)],
+            batch_size=1000,
+        )
+        assignment = assign_partitions([f'{i:03d}' for i in range(count)], partition_count)
+
+        connections.close_all()  # 子进程各自建立数据库连接
+        children = [
+            context.Process(target=_scheduler_bench_worker, args=(parts, partition_count, tag, work_ms, batch_size))
+            for parts in assignment.values()
+        ]
+        start = time.perf_counter()
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        seconds = time.perf_counter() - start
+
+        dispatched = Process.objects.filter(name=tag, state=ProcessState.RUNNING.name).count()
+        Process.objects.filter(name=tag).delete()
+        rate = _rate(dispatched, seconds)
+        baseline = baseline or rate
+        results[f'workers_{count}'] = {
+            'dispatched': dispatched,
+            'seconds': round(seconds, 3),
+            'per_second': rate,
+            'speedup': round(rate / baseline, 2) if rate and baseline else None,
+        }
+    return {'processes': processes, 'partitions': partition_count, 'work_ms': work_ms, 'results': results}
+
+def _resource_bench_worker(resource_id, attempts, mode, counters):
+    """资源争用基准的子进程：反复占用并释放同一资源"""
+    from django.db import transaction
+    from django.db.models import F
+    from kernel.models import ResourceStatus
+    from kernel.resource_manage import try_acquire, release_units
+
+    acquired = rejected = 0
+    for _ in range(attempts):
+        if mode == 'conditional':
+            ok = try_acquire(resource_id, 1)
+        else:
+            # 原实现：事务内 select_for_update 读出、校验后写回
+            with transaction.atomic():
+                resource = ResourceStatus.objects.select_for_update().get(pk=resource_id)
+                ok = resource.current_usage + 1 <= resource.capacity
+                if ok:
+                    resource.current_usage = F('current_usage') + 1
+                    resource.save()
+        if ok:
+            acquired += 1
+            release_units(resource_id, 1)
+        else:
+            rejected += 1
+    with counters.get_lock():
+        counters[0] += acquired
+        counters[1] += rejected
+
+def bench_resource_contention(workers: int = 8, attempts: int = 200, capacity: int = 2) -> dict:
+    """
+    多个并发子进程争用同一分时资源（容量 capacity），对比原 select_for_update 读改写与条件UPDATE账本的吞吐（次/秒），
+    结束时使用量应归零。需使用支持并发写入的数据库（PostgreSQL）。
+    """
+    import multiprocessing
+    from django.db import connections
+    from kernel.models import ResourceStatus
+
+    context = multiprocessing.get_context('fork')
+    results = {}
+    for mode in ('select_for_update', 'conditional'):
+        resource = ResourceStatus.objects.create(label=f'基准资源{time.time_ns()}', capacity=capacity)
+        counters = context.Array('q', [0, 0])
+        connections.close_all()  # 子进程各自建立数据库连接
+        children = [
+            context.Process(target=_resource_bench_worker, args=(resource.id, attempts, mode, counters))
+            for _ in range(workers)
+        ]
+        start = time.perf_counter()
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        seconds = time.perf_counter() - start
+
+        resource.refresh_from_db()
+        results[mode] = {
+            'acquired': counters[0],
+            'rejected': counters[1],
+            'per_second': _rate(workers * attempts, seconds),
+            'final_usage': resource.current_usage,
+        }
+        resource.delete()
+    return {'workers': workers, 'attempts_per_worker': attempts, 'capacity': capacity, 'results': results}
+
+def bench_calendar_queries(resources: int = 50, windows: int = 2000, queries: int = 2000) -> dict:
+    """
+    资源日历查询耗时（微秒/次）：逐条扫描时段列表与区间索引对比，
+    查询为“某时刻是否可用”“某时刻后最早的空闲时段”“50个资源一周内的空闲时段”。
+    """
+    import random
+    from datetime import datetime, timedelta
+    from kernel.resource_calendar import IntervalIndex
+
+    rng = random.Random(0)
+    origin = datetime(2025, 1, 1)
+    calendars = []
+    for _ in range(resources):
+        cursor, intervals = origin, []
+        for _ in range(windows):
+            cursor += timedelta(minutes=rng.randint(10, 120))
+            length = timedelta(minutes=rng.choice((15, 30, 60, 240)))
+            intervals.append((cursor, cursor + length))
+            cursor += length
+        calendars.append(intervals)
+    horizon = (calendars[0][-1][1] - origin).total_seconds()
+    moments = [origin + timedelta(seconds=rng.uniform(0, horizon)) for _ in range(queries)]
+    duration = timedelta(minutes=180)
+
+    def scan_contains(intervals, t):
+        return any(start <= t < end for start, end in intervals)
+
+    def scan_earliest(intervals, t):
+        for start, end in intervals:
+            begin = max(start, t)
+            if end - begin >= duration:
+                return begin
+        return None
+
+    def scan_week(intervals, t):
+        week = t + timedelta(days=7)
+        return [(max(s, t), min(e, week)) for s, e in intervals if s < week and e > t]
+
+    start = time.perf_counter()
+    indexes = [IntervalIndex(intervals) for intervals in calendars]
+    build_ms = (time.perf_counter() - start) * 1000
+
+    results = {'resources': resources, 'windows_per_resource': windows, 'index_build_ms': round(build_ms, 2)}
+    cases = (
+        ('is_available', scan_contains, lambda index, t: index.contains(t)),
+        ('earliest_slot', scan_earliest, lambda index, t: index.earliest_slot(t, duration)),
+    )
+    for name, scan, indexed in cases:
+        start = time.perf_counter()
+        for i, t in enumerate(moments):
+            scan(calendars[i % resources], t)
+        scan_us = (time.perf_counter() - start) / queries * 1e6
+        start = time.perf_counter()
+        for i, t in enumerate(moments):
+            indexed(indexes[i % resources], t)
+        index_us = (time.perf_counter() - start) / queries * 1e6
+        results[name] = {'scan_us': round(scan_us, 2), 'index_us': round(index_us, 2)}
+
+    rounds = max(1, queries // resources)
+    start = time.perf_counter()
+    for t in moments[:rounds]:
+        for intervals in calendars:
+            scan_week(intervals, t)
+    scan_ms = (time.perf_counter() - start) / rounds * 1000
+    start = time.perf_counter()
+    for t in moments[:rounds]:
+        for index in indexes:
+            index.slots(t, t + timedelta(days=7))
+    index_ms = (time.perf_counter() - start) / rounds * 1000
+    results['week_free_slots'] = {'scan_ms': round(scan_ms, 3), 'index_ms': round(index_ms, 3)}
+    return results
+
+def bench_timer_queue(timers: int = 200000, reschedule_ratio: float = 0.1, batch_size: int = 500) -> dict:
+    """
+    定时器队列吞吐（次/秒）：装载、改期、按到期顺序分批弹出；
+    以及没有定时器到期时一次循环取最早到期时间的耗时（微秒）。
+    """
+    import random
+    from datetime import datetime, timedelta
+    from kernel.timer_wheel import TimerQueue, TIMER_SCHEDULED
+
+    rng = random.Random(0)
+    origin = datetime(2025, 1, 1)
+    horizon = 3600
+    deadlines = [origin + timedelta(seconds=rng.uniform(0, horizon)) for _ in range(timers)]
+    queue = TimerQueue()
+
+    start = time.perf_counter()
+    for process_id, due in enumerate(deadlines):
+        queue.schedule((process_id, TIMER_SCHEDULED), due)
+    schedule_seconds = time.perf_counter() - start
+
+    moved = int(timers * reschedule_ratio)
+    start = time.perf_counter()
+    for process_id in rng.sample(range(timers), moved):
+        queue.schedule((process_id, TIMER_SCHEDULED), origin + timedelta(seconds=rng.uniform(0, horizon)))
+    reschedule_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        queue.next_due()
+    idle_us = (time.perf_counter() - start) / 10000 * 1e6
+
+    popped, batches = 0, 0
+    start = time.perf_counter()
+    now = origin
+    while popped < timers:
+        now += timedelta(seconds=1)
+        while True:
+            due = queue.pop_due(now, batch_size)
+            if not due:
+                break
+            popped += len(due)
+            batches += 1
+    pop_seconds = time.perf_counter() - start
+
+    return {
+        'timers': timers,
+        'schedule_per_sec': _rate(timers, schedule_seconds),
+        'reschedule_per_sec': _rate(moved, reschedule_seconds),
+        'pop_per_sec': _rate(popped, pop_seconds),
+        'batches': batches,
+        'idle_next_due_us': round(idle_us, 3),
+    }
+
+def bench_sys_call_payload(calls: int = 20, depths=(1, 5, 20), vars_per_frame: int = 20) -> dict:
+    """
+    系统调用任务消息体字节数：整个评估上下文随消息传递，与只传标识和显式参数对比，
+    一个批次含 calls 个系统调用。
+    """
+    from collections import ChainMap
+    from kernel.sys_call_outbox import message_bytes
+
+    results = {}
+    for depth in depths:
+        frames = _sample_stack(depth, vars_per_frame)['frames']
+        context = ChainMap(dict(SAMPLE_CONTEXT), *[frame['local_vars'] for frame in reversed(frames)])
+        full = [['start_service', dict(context, service_rule_id=f'rule-{i}')] for i in range(calls)]
+        slim = [['start_service', {
+            'process_id': context['process_id'], 'service_rule_id': f'rule-{i}', 'snapshot_version': 12,
+        }] for i in range(calls)]
+        full_bytes, slim_bytes = message_bytes(full), message_bytes(slim)
+        results[f'depth_{depth}'] = {
+            'full_context_bytes': full_bytes,
+            'slim_bytes': slim_bytes,
+            'ratio': round(full_bytes / slim_bytes, 1),
+        }
+    return results
+
+def bench_sys_call_chain(steps: int = 5, rounds: int = 100, broker_ms: float = 5.0) -> dict:
+    """
+    系统调用链的分派开销：每一步执行后产生下一步的系统调用（如 start_service -> ... -> calling_return）。
+    inline 模式下整条链在本进程内执行；async 模式下每一步都发布一条任务消息。
+    这里以本进程取出执行代替消息中间件，每条消息按 broker_ms 毫秒计入往返延迟（不含数据库操作）。
+    """
+    from django.test import override_settings
+    from kernel.sys_lib import CALL_REGISTRY, SysCallInterface, SysCallResult, run_sys_calls
+    from kernel.sys_call_outbox import sys_call_outbox
+
+    class ChainStep(SysCallInterface):
+        def execute(self, **kwargs) -> SysCallResult:
+            step = kwargs['step']
+            if step < steps:
+                sys_call_outbox.publish([['benchmark_chain_step', {'process_id': kwargs['process_id'], 'step': step + 1}]])
+            return SysCallResult(True)
+
+    queue = []
+    original_publish = sys_call_outbox._publish
+    CALL_REGISTRY['benchmark_chain_step'] = ChainStep
+    sys_call_outbox._publish = queue.append
+    results = {'steps': steps}
+    try:
+        for mode in ('async', 'inline'):
+            messages = 0
+            with override_settings(KERNEL_SYS_CALL_MODE=mode):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    queue.append([['benchmark_chain_step', {'process_id': 'benchmark', 'step': 1}]])
+                    while queue:
+                        calls = queue.pop(0)
+                        messages += 1
+                        time.sleep(broker_ms / 1000)
+                        with sys_call_outbox.inline_chain():
+                            run_sys_calls(calls)
+                elapsed = time.perf_counter() - start
+            results[mode] = {
+                'chain_ms': round(elapsed / rounds * 1000, 3),
+                'broker_messages_per_chain': messages / rounds,
+            }
+    finally:
+        sys_call_outbox._publish = original_publish
+        CALL_REGISTRY.pop('benchmark_chain_step', None)
+    return results
+
+BENCHMARK_REGISTRY = {
+    "rule_evaluation": bench_rule_evaluation,
+    "snapshot_storage": bench_snapshot_storage,
+    "context_exit": bench_context_exit,
+    "task_list_delta": bench_task_list_delta,
+    "scheduler_scaling": bench_scheduler_scaling,
+    "resource_contention": bench_resource_contention,
+    "calendar_queries": bench_calendar_queries,
+    "timer_queue": bench_timer_queue,
+    "sys_call_payload": bench_sys_call_payload,
+    "sys_call_chain": bench_sys_call_chain,
+}
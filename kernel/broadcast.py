@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.db import transaction, close_old_connections
+
+from contextlib import contextmanager
+import atexit
+import threading
+import time
+
+class BroadcastCoalescer:
+    """
+    任务列表推送合并器：进程变更只把受影响的推送目标标记为脏，
+    由后台刷新线程在时间窗口（KERNEL_BROADCAST_WINDOW 秒）结束后统一推送，
+    同一窗口内同一目标无论变更多少次只推送一次。
+    推送目标：操作员私有任务列表、共享的公共任务列表（每次刷新只生成一次，订阅方按可办服务过滤）、实体作业任务清单。
+    - 标记在事务提交后生效，刷新时读到的是已提交数据；
+    - suppressed() 期间本线程的标记先暂存，退出最外层时一次并入，用于批量内核操作；
+    - 窗口为0时在标记处同步推送。
+    """
+    def __init__(self, window: float = None):
+        self.window = window if window is not None else getattr(settings, 'KERNEL_BROADCAST_WINDOW', 0.2)
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._thread = None
+        self._private, self._public, self._entities = {}, False, {}
+        self.marks = 0
+        self.flushes = 0
+        self.sends = 0
+        self.errors = 0
+
+    # ---------- 标记 ----------
+    def mark_process(self, process):
+        """
+        标记某进程影响的全部推送目标：进程操作员的私有任务列表、公共任务列表、进程实体的作业任务清单。
+        与原有行为一致，只有操作员为员工的进程变更才刷新任务列表。
+        """
+        operator = process.operator
+        if not (operator and operator.user and operator.user.is_staff):
+            return
+        entity = process.entity_content_object
+        entities = {(type(entity), entity.pk): entity} if entity is not None else {}
+        self._mark({operator.pk: operator}, True, entities)
+
+    def mark_processes(self, processes):
+        with self.suppressed():
+            for process in processes:
+                self.mark_process(process)
+
+    def mark_operator(self, operator, public: bool = True):
+        self._mark({operator.pk: operator}, public, {})
+
+    def mark_entity(self, entity):
+        self._mark({}, False, {(type(entity), entity.pk): entity})
+
+    def _mark(self, private: dict, public: bool, entities: dict):
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            batch[0].update(private)
+            batch[1] = batch[1] or public
+            batch[2].update(entities)
+            return
+        transaction.on_commit(lambda: self._enqueue(private, public, entities))
+
+    @contextmanager
+    def suppressed(self):
+        """暂停本线程的推送，退出最外层时把期间的全部标记合并为一次"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._local.batch = [{}, False, {}]
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                private, public, entities = self._local.batch
+                self._local.batch = None
+                if private or public or entities:
+                    transaction.on_commit(lambda: self._enqueue(private, public, entities))
+
+    # ---------- 刷新 ----------
+    def _enqueue(self, private: dict, public: bool, entities: dict):
+        with self._cond:
+            self._private.update(private)
+            self._public = self._public or public
+            self._entities.update(entities)
+            self.marks += 1
+            if self.window > 0:
+                # fork出的子进程中线程不会存活，需重新启动
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='broadcast-coalescer', daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        if self.window <= 0:
+            self.flush()
+
+    def _has_dirty(self) -> bool:
+        return bool(self._private or self._public or self._entities)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._has_dirty():
+                    self._cond.wait()
+            # 等待窗口结束，期间的后续标记合并进同一次推送
+            time.sleep(self.window)
+            self.flush()
+            close_old_connections()
+
+    def flush(self) -> int:
+        """立即推送全部脏目标，返回推送次数"""
+        from kernel.sys_lib import update_task_list, update_public_task_list, update_entity_task_group_list
+
+        with self._cond:
+            private, public, entities = self._private, self._public, self._entities
+            self._private, self._public, self._entities = {}, False, {}
+        if not (private or public or entities):
+            return 0
+
+        jobs = [(update_task_list, (operator, False)) for operator in private.values()]
+        if public:
+            jobs.append((update_public_task_list, ()))
+        jobs += [(update_entity_task_group_list, (entity,)) for entity in entities.values()]
+
+        sent = 0
+        for func, args in jobs:
+            try:
+                func(*args)
+                sent += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[BroadcastCoalescer] 推送任务列表异常: {e}")
+        self.flushes += 1
+        self.sends += sent
+        return sent
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'window': self.window,
+                'pending_private': len(self._private),
+                'pending_public': self._public,
+                'pending_entities': len(self._entities),
+                'marks': self.marks,
+                'flushes': self.flushes,
+                'sends': self.sends,
+                'errors': self.errors,
+            }
+
+# 进程内共享的推送合并器
+broadcast_coalescer = BroadcastCoalescer()
+# 进程退出前推送窗口内尚未推送的变更
+atexit.register(broadcast_coalescer.flush)
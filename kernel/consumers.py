@@ -1,10 +1,34 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
 
+from urllib.parse import parse_qs
 import json
 
 from kernel.models import Operator
-from kernel.sys_lib import update_task_list, update_entity_task_group_list
+from kernel.sys_lib import update_task_list, update_entity_task_group_list, update_public_task_list, public_task_stream, PUBLIC_TASK_GROUP
+from kernel.task_stream import TaskListStream, FilteredStreamView, ROW_SERVICE
+
+# 任务列表按增量推送（见 kernel.task_stream）：连接时单独下发全量，
+# 此后组内只推送增量；客户端失步时发送 {"action": "resync"} 重新取得全量。
+# 断线重连时客户端在查询参数中携带续传令牌 ?resume=epoch:seq，能衔接时只补发错过的增量，不再查库重算。
+def is_resync_request(text_data) -> bool:
+    try:
+        return json.loads(text_data).get('action') == 'resync'
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+async def send_missed_changes(consumer, group_name: str, message_type: str) -> bool:
+    """按续传令牌补发错过的增量；无令牌或无法衔接时返回 False，由调用方下发全量"""
+    query = parse_qs(consumer.scope.get('query_string', b'').decode())
+    token = query.get('resume', [None])[0]
+    if not token:
+        return False
+    missed = await sync_to_async(TaskListStream(group_name, message_type).missed_since)(token)
+    if missed is None:
+        return False
+    for message in missed:
+        await consumer.send(json.dumps(message))
+    return True
 
 # 个人任务列表
 class PrivateTaskListConsumer(AsyncWebsocketConsumer):
@@ -13,8 +37,18 @@ class PrivateTaskListConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_add(operator.erpsys_id, self.channel_name)
         await self.accept()
 
-        # 更新个人任务列表
-        await sync_to_async(update_task_list)(operator, False)
+        # 续传错过的增量，否则更新个人任务列表并向本连接下发全量
+        if not await send_missed_changes(self, operator.erpsys_id, 'send_private_task_list'):
+            await self.send_snapshot(operator)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if is_resync_request(text_data):
+            operator = await sync_to_async(Operator.objects.get)(user=self.scope['user'])
+            await self.send_snapshot(operator)
+
+    async def send_snapshot(self, operator):
+        snapshot = await sync_to_async(update_task_list)(operator, False)
+        await self.send(json.dumps(snapshot))
 
     async def disconnect(self, close_code):
         operator = await sync_to_async(Operator.objects.get)(user=self.scope['user'])
@@ -26,22 +60,41 @@ class PrivateTaskListConsumer(AsyncWebsocketConsumer):
         await self.send(json.dumps(new_data))
 
 # 公共任务列表
+# 全部连接共享同一份公共任务流（每次变更只生成一次），每个连接按其操作员的可办服务过滤后下发；
+# 连接与失步重取时直接读取缓存的全量，无需查库重算。
 class PublicTaskListConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.channel_layer.group_add('public_task_list', self.channel_name)
+        self.operator = await sync_to_async(Operator.objects.get)(user=self.scope['user'])
+        self.allowed_service_ids = frozenset()
+        self.view = FilteredStreamView(lambda row: row.get(ROW_SERVICE) in self.allowed_service_ids)
+        await self.channel_layer.group_add(PUBLIC_TASK_GROUP, self.channel_name)
         await self.accept()
+        await self.send_snapshot()
 
-        # 更新公共任务列表
-        operator = await sync_to_async(Operator.objects.get)(user=self.scope['user'])
-        await sync_to_async(update_task_list)(operator, True)
+    async def receive(self, text_data=None, bytes_data=None):
+        if is_resync_request(text_data):
+            await self.send_snapshot()
+
+    async def send_snapshot(self):
+        self.allowed_service_ids = await sync_to_async(self.operator.allowed_service_ids)()
+        snapshot = await sync_to_async(public_task_stream().snapshot)()
+        if snapshot is None:
+            snapshot = await sync_to_async(update_public_task_list)()
+        await self.send(json.dumps(self.view.apply(snapshot)))
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('public_task_list', self.channel_name)
+        await self.channel_layer.group_discard(PUBLIC_TASK_GROUP, self.channel_name)
         self.close()
 
     async def send_public_task_list(self, event):
-        new_data = event['data']
-        await self.send(json.dumps(new_data))
+        allowed_service_ids = await sync_to_async(self.operator.allowed_service_ids)()
+        if allowed_service_ids != self.allowed_service_ids:
+            # 可办服务已变化，按新权限重新下发全量
+            await self.send_snapshot()
+            return
+        message = self.view.apply(event['data'])
+        if message is not None:
+            await self.send(json.dumps(message))
 
 # 实体任务列表
 class EntityTaskListConsumer(AsyncWebsocketConsumer):
@@ -49,9 +102,19 @@ class EntityTaskListConsumer(AsyncWebsocketConsumer):
         entity_id = self.scope['url_route']['kwargs']['entity_id']
         await self.channel_layer.group_add(f'{entity_id}', self.channel_name)
         await self.accept()
-        # 初始化更新实体服务列表
+        # 续传错过的增量，否则初始化更新实体服务列表并向本连接下发全量
+        if not await send_missed_changes(self, f'{entity_id}', 'send_task_list'):
+            await self.send_snapshot()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if is_resync_request(text_data):
+            await self.send_snapshot()
+
+    async def send_snapshot(self):
+        entity_id = self.scope['url_route']['kwargs']['entity_id']
         entity = await sync_to_async(Operator.objects.get)(erpsys_id=entity_id)
-        await sync_to_async(update_entity_task_group_list)(entity)
+        snapshot = await sync_to_async(update_entity_task_group_list)(entity)
+        await self.send(json.dumps(snapshot))
 
     async def disconnect(self, close_code):
         entity_id = self.scope['url_route']['kwargs']['entity_id']
@@ -0,0 +1,89 @@
+from django.conf import settings
+
+from collections import OrderedDict, namedtuple
+from typing import Optional
+import threading
+
+# 缓存条目：反序列化后的上下文堆栈及其对应的快照版本、哈希、增量基准和估算字节数
+CachedContext = namedtuple('CachedContext', ['version', 'context_hash', 'stack', 'base_data', 'size'])
+
+class ContextStackCache:
+    """
+    工作进程内的上下文堆栈LRU缓存：process_id -> CachedContext。
+    - 取出(take)即移出缓存，保证同一堆栈同一时刻只被一个执行上下文持有和修改；
+    - 退出上下文时以新的版本/哈希放回(put)，条目始终与已保存的快照一致；
+    - 命中前须与数据库中最新快照的版本和哈希比对，不一致(其它worker已写入)即丢弃；
+    - 按条目数和估算字节数双重限制内存，并记录命中/未命中/过期/驱逐计数。
+    """
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'KERNEL_CONTEXT_CACHE_SIZE', 256)
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'KERNEL_CONTEXT_CACHE_BYTES', 64 * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def contains(self, process_id) -> bool:
+        return process_id in self._entries
+
+    def take(self, process_id, version: int, context_hash: str) -> Optional[CachedContext]:
+        """取出与给定快照版本/哈希一致的条目；不存在或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.pop(process_id, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.bytes -= entry.size
+            if entry.version != version or entry.context_hash != context_hash:
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, process_id, entry: CachedContext):
+        """放回条目；超出条目数或字节数上限时按LRU驱逐"""
+        if self.max_entries <= 0 or entry.size > self.max_bytes:
+            self.discard(process_id)
+            return
+        with self._lock:
+            old = self._entries.pop(process_id, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[process_id] = entry
+            self.bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+
+    def discard(self, process_id):
+        with self._lock:
+            entry = self._entries.pop(process_id, None)
+            if entry is not None:
+                self.bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+            }
+
+# 工作进程内共享的上下文堆栈缓存
+context_stack_cache = ContextStackCache()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from kernel.snapshots import compact_snapshots, vacuum_snapshots
+
+class Command(BaseCommand):
+    help = "压缩进程上下文快照：保留未终止进程的最新N个版本，已终止进程只保留最终版本"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retain', type=int, default=None, help="未终止进程保留的版本数，缺省取 KERNEL_SNAPSHOT_RETAIN_VERSIONS")
+        parser.add_argument('--chunk-size', type=int, default=200, help="每个事务处理的进程数")
+        parser.add_argument('--vacuum', action='store_true', help="完成后对快照表执行 VACUUM ANALYZE（仅PostgreSQL）")
+
+    def handle(self, *args, **options):
+        report = compact_snapshots(options['retain'], options['chunk_size'])
+        self.stdout.write(
+            f"已处理进程 {report['processes']} 个，删除快照 {report['rows_deleted']} 行，"
+            f"回收约 {report['bytes_reclaimed']} 字节，删除规则命中记录 {report['firings_deleted']} 行"
+        )
+        if options['vacuum'] and vacuum_snapshots():
+            self.stdout.write("已完成 VACUUM ANALYZE")
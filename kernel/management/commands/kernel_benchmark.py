@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import json
+
+from kernel.benchmarks import BENCHMARK_REGISTRY
+
+class Command(BaseCommand):
+    help = "运行内核性能基准测试"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"基准名称，可选: {', '.join(BENCHMARK_REGISTRY)}；缺省运行全部")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARK_REGISTRY)
+        for name in names:
+            bench = BENCHMARK_REGISTRY.get(name)
+            if not bench:
+                raise CommandError(f"未定义的基准: {name}")
+            self.stdout.write(f"== {name} ==")
+            self.stdout.write(json.dumps(bench(), ensure_ascii=False, indent=2))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from kernel.scheduler_cluster import SchedulerWorker
+
+class Command(BaseCommand):
+    help = "运行一个常驻调度者：加入调度集群，持续续租并调度分配给自己的运行队列分区；可启动多个实例并行调度"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default=None, help="调度者标识，缺省为 主机名:pid:随机后缀")
+        parser.add_argument('--interval', type=float, default=None, help="空闲时两次调度的间隔（秒），缺省取 KERNEL_SCHEDULER_TICK_INTERVAL")
+
+    def handle(self, *args, **options):
+        worker = SchedulerWorker(options['worker_id'])
+        try:
+            worker.run(interval=options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kernel.timer_wheel import TimerWheelWorker
+
+class Command(BaseCommand):
+    help = "运行定时器引擎：触发进程计划时间、时间窗结束等定时事件；多个实例中只有持有租约者触发"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default=None, help="工作者标识，缺省为 主机名:pid:随机后缀")
+        parser.add_argument('--horizon', type=float, default=None, help="装载窗口（秒），缺省取 KERNEL_TIMER_HORIZON")
+        parser.add_argument('--batch-size', type=int, default=None, help="每批评估的定时器数，缺省取 KERNEL_TIMER_BATCH_SIZE")
+
+    def handle(self, *args, **options):
+        worker = TimerWheelWorker(options['worker_id'], options['horizon'], options['batch_size'])
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(str(worker.stats()))
@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.core.cache import cache
+from django.conf import settings
+
+import threading
+import time
+
+from kernel.models import Service, ServiceRule, Event, Instruction, WorkOrder, Form, SysParams
+
+# ================ 内核定义元数据缓存 ================
+# 服务、规则、事件、指令、工单、表单、系统参数等定义模型在运行期间基本不变，
+# 热路径上反复按 label/erpsys_id 查询。每个进程（Web与Celery Worker）在内存中各保存一份，
+# 以共享缓存中的代数计数器（generation）实现全集群失效：
+#   - 定义模型保存/删除（含admin保存）及 copy_design_to_kernel 后递增代数；
+#   - 各进程最多每 KERNEL_METADATA_CHECK_INTERVAL 秒比对一次代数，不一致时丢弃本地副本，下次访问时重新加载；
+#   - Worker启动时预加载，首个请求无需承担冷启动查询。
+# 缓存的实例为各调用方共享，只读使用，不要修改或保存。
+DEFINITION_MODELS = (Service, ServiceRule, Event, Instruction, WorkOrder, Form, SysParams)
+GENERATION_KEY = 'kernel:metadata:generation'
+
+# 加载时一并取出的关联，使缓存实例访问外键时不再查询
+_SELECT_RELATED = {
+    ServiceRule: ('target_service', 'service', 'event', 'system_instruction', 'operand_service'),
+}
+
+class DefinitionTable:
+    """某个定义模型的全部记录及其索引"""
+    def __init__(self, model, instances: list):
+        self.model = model
+        self.instances = instances
+        self.by_pk = {instance.pk: instance for instance in instances}
+        self.by_erpsys_id = {instance.erpsys_id: instance for instance in instances if instance.erpsys_id}
+        self.by_label = {}
+        for instance in instances:
+            self.by_label.setdefault(instance.label, []).append(instance)
+
+    def get(self, **lookup):
+        """与 objects.get 语义一致：不存在抛出 DoesNotExist，按label匹配到多条抛出 MultipleObjectsReturned"""
+        if len(lookup) != 1:
+            raise TypeError("元数据缓存只支持按 pk、id、erpsys_id 或 label 单条件查找")
+        field, value = next(iter(lookup.items()))
+        if field in ('pk', 'id'):
+            instance = self.by_pk.get(value)
+        elif field == 'erpsys_id':
+            instance = self.by_erpsys_id.get(value)
+        elif field == 'label':
+            matches = self.by_label.get(value, [])
+            if len(matches) > 1:
+                raise self.model.MultipleObjectsReturned(f"{self.model.__name__} label={value} 存在多条记录")
+            instance = matches[0] if matches else None
+        else:
+            raise TypeError(f"元数据缓存不支持按 {field} 查找")
+        if instance is None:
+            raise self.model.DoesNotExist(f"{self.model.__name__} {field}={value} 不存在")
+        return instance
+
+class MetadataCache:
+    """进程内定义元数据缓存，按共享代数计数器失效"""
+    def __init__(self):
+        self._tables = {}
+        self._generation = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    # ---------- 代数 ----------
+    def _shared_generation(self) -> int:
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, 1, timeout=None)
+            generation = cache.get(GENERATION_KEY) or 1
+        return generation
+
+    def check(self):
+        """按间隔比对共享代数，其它进程修改过定义时丢弃本地副本"""
+        interval = getattr(settings, 'KERNEL_METADATA_CHECK_INTERVAL', 1.0)
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < interval:
+            return
+        generation = self._shared_generation()
+        self._checked_at = now
+        if generation != self._generation:
+            self._reset(generation)
+
+    def _reset(self, generation):
+        with self._lock:
+            had_tables = bool(self._tables)
+            self._tables = {}
+            self._generation = generation
+        if had_tables:
+            self.invalidations += 1
+        for listener in self._listeners:
+            listener()
+
+    def bump(self):
+        """递增共享代数，使全部进程的元数据副本失效"""
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            # 计数器尚不存在（缓存被清空）：从当前代数之后开始
+            generation = (self._generation or 1) + 1
+            cache.set(GENERATION_KEY, generation, timeout=None)
+        self._reset(generation)
+        self._checked_at = time.monotonic()
+
+    def add_listener(self, callback):
+        """注册失效回调，用于依赖定义模型的派生缓存（如规则分派表）"""
+        self._listeners.append(callback)
+
+    # ---------- 查询 ----------
+    def table(self, model) -> DefinitionTable:
+        self.check()
+        table = self._tables.get(model)
+        if table is not None:
+            self.hits += 1
+            return table
+        generation = self._generation
+        queryset = model.objects.all()
+        if model in _SELECT_RELATED:
+            queryset = queryset.select_related(*_SELECT_RELATED[model])
+        table = DefinitionTable(model, list(queryset))
+        with self._lock:
+            # 加载期间发生失效时，本次结果不缓存
+            if self._generation == generation:
+                self._tables[model] = table
+        self.loads += 1
+        return table
+
+    def get(self, model, **lookup):
+        """按 pk/id/erpsys_id/label 取定义实例"""
+        return self.table(model).get(**lookup)
+
+    def all(self, model) -> list:
+        """定义模型的全部实例，按模型默认排序"""
+        return self.table(model).instances
+
+    def config(self, model, label: str):
+        """按label取定义的config字段"""
+        return self.get(model, label=label).config
+
+    def preload(self):
+        """一次加载全部定义模型"""
+        for model in DEFINITION_MODELS:
+            self.table(model)
+
+    def stats(self) -> dict:
+        return {
+            'generation': self._generation,
+            'models': sorted(model.__name__ for model in self._tables),
+            'rows': sum(len(table.instances) for table in self._tables.values()),
+            'hits': self.hits,
+            'loads': self.loads,
+            'invalidations': self.invalidations,
+        }
+
+# 进程内共享的定义元数据缓存
+metadata_cache = MetadataCache()
+
+def on_definition_changed(sender, **kwargs):
+    """定义模型变更提交后递增代数"""
+    transaction.on_commit(metadata_cache.bump)
+
+for _model in DEFINITION_MODELS:
+    post_save.connect(on_definition_changed, sender=_model, dispatch_uid=f"bump_metadata_on_{_model.__name__.lower()}_save")
+    post_delete.connect(on_definition_changed, sender=_model, dispatch_uid=f"bump_metadata_on_{_model.__name__.lower()}_delete")
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processcontextsnapshot',
+            name='snapshot_type',
+            field=models.CharField(choices=[('FULL', '全量'), ('DELTA', '增量')], default='FULL', max_length=10, verbose_name='快照类型'),
+        ),
+        migrations.AddField(
+            model_name='processcontextsnapshot',
+            name='context_delta',
+            field=models.JSONField(blank=True, null=True, verbose_name='上下文增量'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import kernel.types
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0002_processcontextsnapshot_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processcontextsnapshot',
+            name='context_data',
+            field=models.JSONField(blank=True, encoder=kernel.types.CanonicalJSONEncoder, null=True, verbose_name='上下文数据'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+import kernel.models
+
+PID_SEQUENCE = 'kernel_process_pid_seq'
+PID_COUNTER = 'process_pid'
+
+
+def renumber_duplicate_pids(apps, schema_editor):
+    """旧的pid分配存在竞争，建唯一索引前为重复（或为0）的pid重新编号，保留每组最早的进程"""
+    Process = apps.get_model('kernel', 'Process')
+    next_pid = (Process.objects.aggregate(max_pid=Max('pid'))['max_pid'] or 0) + 1
+    duplicated = Process.objects.values('pid').annotate(rows=Count('id')).filter(rows__gt=1).values_list('pid', flat=True)
+    for pid in list(duplicated):
+        processes = Process.objects.filter(pid=pid).order_by('id')
+        if pid:
+            processes = processes[1:]
+        for process in processes:
+            Process.objects.filter(id=process.id).update(pid=next_pid)
+            next_pid += 1
+
+
+def init_pid_allocator(apps, schema_editor):
+    """PostgreSQL创建pid序列，其它数据库创建计数行，起点均为现有最大pid"""
+    Process = apps.get_model('kernel', 'Process')
+    SequenceCounter = apps.get_model('kernel', 'SequenceCounter')
+    max_pid = Process.objects.aggregate(max_pid=Max('pid'))['max_pid'] or 0
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {PID_SEQUENCE} OWNED BY kernel_process.pid')
+        schema_editor.execute(f"SELECT setval('{PID_SEQUENCE}', %s, false)", [max_pid + 1])
+    else:
+        SequenceCounter.objects.update_or_create(name=PID_COUNTER, defaults={'value': max_pid})
+
+
+def drop_pid_allocator(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {PID_SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0003_processcontextsnapshot_canonical_encoder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='名称')),
+                ('value', models.BigIntegerField(default=0, verbose_name='当前值')),
+            ],
+            options={
+                'verbose_name': '序列计数器',
+                'verbose_name_plural': '序列计数器',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(renumber_duplicate_pids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='process',
+            name='pid',
+            field=kernel.models.PidField(default=0, unique=True, verbose_name='进程id'),
+        ),
+        migrations.RunPython(init_pid_allocator, drop_pid_allocator),
+    ]
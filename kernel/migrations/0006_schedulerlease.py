@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0005_process_run_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='名称')),
+                ('owner', models.CharField(blank=True, max_length=100, null=True, verbose_name='持有者')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='到期时间')),
+                ('data', models.JSONField(blank=True, null=True, verbose_name='数据')),
+            ],
+            options={
+                'verbose_name': '调度租约',
+                'verbose_name_plural': '调度租约',
+                'ordering': ['id'],
+            },
+        ),
+    ]
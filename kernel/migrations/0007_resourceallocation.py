@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0006_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveIntegerField(default=1, verbose_name='占用量')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True, verbose_name='分配时间')),
+                ('process', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resource_allocations', to='kernel.process', verbose_name='进程')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='kernel.resourcestatus', verbose_name='资源')),
+            ],
+            options={
+                'verbose_name': '资源占用',
+                'verbose_name_plural': '资源占用',
+                'ordering': ['id'],
+                'unique_together': {('process', 'resource')},
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0007_resourceallocation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='resourcecalendar',
+            index=models.Index(fields=['resource', 'start_time', 'end_time'], name='resource_calendar_span_idx'),
+        ),
+    ]
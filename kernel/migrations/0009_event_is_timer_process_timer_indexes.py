@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0008_resourcecalendar_span_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='is_timer',
+            field=models.BooleanField(default=False, verbose_name='定时事件'),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(condition=models.Q(('scheduled_time__isnull', False)), fields=['scheduled_time'], name='process_timer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(condition=models.Q(('scheduled_time__isnull', False)), fields=['updated_at'], name='process_timer_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0009_event_is_timer_process_timer_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuleFiring',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(max_length=50, verbose_name='服务规则')),
+                ('snapshot_version', models.PositiveIntegerField(default=0, verbose_name='快照版本号')),
+                ('process_state', models.CharField(max_length=50, verbose_name='进程状态')),
+                ('fired_at', models.DateTimeField(auto_now_add=True, null=True, verbose_name='命中时间')),
+                ('process', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rule_firings', to='kernel.process', verbose_name='进程')),
+            ],
+            options={
+                'verbose_name': '规则命中记录',
+                'verbose_name_plural': '规则命中记录',
+                'ordering': ['id'],
+                'unique_together': {('process', 'rule', 'snapshot_version', 'process_state')},
+            },
+        ),
+    ]
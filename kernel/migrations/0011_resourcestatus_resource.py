@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kernel', '0010_rulefiring'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resourcestatus',
+            name='resource',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='status', to='kernel.resource', verbose_name='资源'),
+        ),
+    ]
@@ -10,7 +10,7 @@ import uuid
 import re
 from pypinyin import Style, lazy_pinyin
 
-from kernel.types import ProcessState, ChoiceType
+from kernel.types import ProcessState, ChoiceType, CanonicalJSONEncoder
 from kernel.app_types import app_types
 
 # ERPSys基类
@@ -71,8 +71,15 @@ class Operator(ERPSysBase):
         verbose_name_plural = verbose_name
         ordering = ['id']
 
+    def allowed_service_ids(self) -> frozenset:
+        """经角色获得的可办服务id集合，取自缓存的服务权限索引"""
+        from kernel.permission_cache import service_permissions
+        return service_permissions.service_ids_for(self.pk)
+
     def allowed_services(self):
-        return list(set(service for role in self.role.all() for service in role.services.all()))
+        from kernel.metadata_cache import metadata_cache
+        service_ids = self.allowed_service_ids()
+        return [service for service in metadata_cache.all(Service) if service.pk in service_ids]
 
     def get_task_list(self, state_set):
         return self.processes.filter(state__in=state_set)
@@ -113,6 +120,7 @@ class Service(ERPSysBase):
 class Event(ERPSysBase):
     description = models.TextField(max_length=255, blank=True, null=True, verbose_name="描述表达式")
     expression = models.CharField(max_length=255, blank=True, null=True, verbose_name="表达式")
+    is_timer = models.BooleanField(default=False, verbose_name="定时事件")
     parameters = models.JSONField(blank=True, null=True, verbose_name="事件参数")
 
     class Meta:
@@ -188,13 +196,41 @@ class Form(ERPSysBase):
         verbose_name_plural = verbose_name
         ordering = ['id']
 
+class SequenceCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="名称")
+    value = models.BigIntegerField(default=0, verbose_name="当前值")
+
+    class Meta:
+        verbose_name = "序列计数器"
+        verbose_name_plural = verbose_name
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="名称")
+    owner = models.CharField(max_length=100, blank=True, null=True, verbose_name="持有者")
+    expires_at = models.DateTimeField(blank=True, null=True, verbose_name="到期时间")
+    data = models.JSONField(blank=True, null=True, verbose_name="数据")
+
+    class Meta:
+        verbose_name = "调度租约"
+        verbose_name_plural = verbose_name
+        ordering = ['id']
+
+    def __str__(self):
+        return self.name
+
 class PidField(models.IntegerField):
+    """
+    进程pid字段：新增时由 kernel.pid_allocator 分配（PostgreSQL序列或计数行），并发安全。
+    已预留pid（如批量创建时整段预留）的实例保持原值。
+    """
     def pre_save(self, model_instance, add):
-        if add:
-            if Process.objects.all().count() == 0:
-                pid = 1
-            else:
-                pid = Process.objects.all().last().pid + 1
+        if add and not getattr(model_instance, self.attname):
+            from kernel.pid_allocator import next_pid
+            pid = next_pid()
             setattr(model_instance, self.attname, pid)
             return pid
         else:
@@ -203,7 +239,7 @@ class PidField(models.IntegerField):
 class Process(models.Model):
     name = models.CharField(max_length=255, blank=True, null=True, verbose_name="名称")
     erpsys_id = models.CharField(max_length=50, unique=True, null=True, blank=True, verbose_name="ERPSysID")
-    pid = PidField(default=0, verbose_name="进程id")
+    pid = PidField(default=0, unique=True, verbose_name="进程id")
     parent = models.ForeignKey("self", on_delete=models.SET_NULL, blank=True, null=True, related_name="child_instances", verbose_name="父进程")
     previous = models.ForeignKey("self", on_delete=models.SET_NULL, blank=True, null=True, related_name="next_instances", verbose_name="前一个进程")
     entity_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True, related_name="as_entity_process")
@@ -231,6 +267,16 @@ class Process(models.Model):
         verbose_name = "进程"
         verbose_name_plural = verbose_name
         ordering = ['id']
+        indexes = [
+            # 运行队列：按状态取出，优先级降序、先到先服务
+            models.Index(fields=['state', '-priority', 'created_at'], name='process_run_queue_idx'),
+            # 按状态分批巡检（id 游标）
+            models.Index(fields=['state', 'id'], name='process_state_id_idx'),
+            # 定时器装载：按计划时间范围取出即将到期的进程
+            models.Index(fields=['scheduled_time'], name='process_timer_idx', condition=models.Q(scheduled_time__isnull=False)),
+            # 定时器增量同步：按更新时间取出计划时间有变化的进程
+            models.Index(fields=['updated_at'], name='process_timer_sync_idx', condition=models.Q(scheduled_time__isnull=False)),
+        ]
 
     def __str__(self):
         return self.name if self.name else str(self.pid)
@@ -290,7 +336,9 @@ class ProcessContextSnapshot(models.Model):
     erpsys_id = models.CharField(max_length=50, unique=True, null=True, blank=True, verbose_name="ERPSysID")
     process = models.ForeignKey('Process', on_delete=models.CASCADE, verbose_name="进程")
     version = models.PositiveIntegerField(default=1, verbose_name="版本号")
-    context_data = models.JSONField(null=True, blank=True, verbose_name="上下文数据")
+    snapshot_type = models.CharField(max_length=10, choices=[('FULL', '全量'), ('DELTA', '增量')], default='FULL', verbose_name="快照类型")
+    context_data = models.JSONField(null=True, blank=True, encoder=CanonicalJSONEncoder, verbose_name="上下文数据")
+    context_delta = models.JSONField(null=True, blank=True, verbose_name="上下文增量")
     context_hash = models.CharField(max_length=64, null=True, blank=True, verbose_name="上下文哈希")
     created_at = models.DateTimeField(auto_now_add=True, null=True, verbose_name="创建时间")
     
@@ -305,6 +353,20 @@ class ProcessContextSnapshot(models.Model):
             self.erpsys_id = str(uuid.uuid1())
         super().save(*args, **kwargs)
 
+class RuleFiring(models.Model):
+    """规则对进程的一次命中（批量评估与上下文内评估共用），同一规则在同一快照版本、同一进程状态下只发出一次系统调用"""
+    process = models.ForeignKey(Process, on_delete=models.CASCADE, related_name='rule_firings', verbose_name="进程")
+    rule = models.CharField(max_length=50, verbose_name="服务规则")  # ServiceRule.erpsys_id
+    snapshot_version = models.PositiveIntegerField(default=0, verbose_name="快照版本号")
+    process_state = models.CharField(max_length=50, verbose_name="进程状态")
+    fired_at = models.DateTimeField(auto_now_add=True, null=True, verbose_name="命中时间")
+
+    class Meta:
+        verbose_name = "规则命中记录"
+        verbose_name_plural = verbose_name
+        ordering = ['id']
+        unique_together = ('process', 'rule', 'snapshot_version', 'process_state')
+
 class ResourceRequirement(ERPSysBase):
     resource_type = models.CharField(max_length=50, verbose_name="资源类型")
     capacity = models.PositiveIntegerField(default=1, verbose_name="容量")  # 表示该资源能同时支持多少个进程（如 1 表示独占，>1 表示可并发）
@@ -323,8 +385,12 @@ class ResourceCalendar(ERPSysBase):
         verbose_name = "资源日历"
         verbose_name_plural = verbose_name
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['resource', 'start_time', 'end_time'], name='resource_calendar_span_idx'),
+        ]
 
 class ResourceStatus(ERPSysBase):
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE, null=True, blank=True, related_name='status', verbose_name="资源")  # 受容量控制的资源，服务配置中的资源需求按其 erpsys_id 对应到本状态
     capacity = models.PositiveIntegerField(default=1, verbose_name="容量")  # 表示该资源能同时支持多少个进程（如 1 表示独占，>1 表示可并发）
     current_usage = models.PositiveIntegerField(default=0, verbose_name="当前使用量")  # 表示当前已被多少进程占用
     busy_until = models.DateTimeField(null=True, blank=True, verbose_name="忙碌到期时间")  # 如果有时间限制，例如某资源会在某个时间之前保持忙碌
@@ -334,6 +400,18 @@ class ResourceStatus(ERPSysBase):
         verbose_name_plural = verbose_name
         ordering = ['id']
 
+class ResourceAllocation(models.Model):
+    process = models.ForeignKey(Process, on_delete=models.CASCADE, related_name='resource_allocations', verbose_name="进程")
+    resource = models.ForeignKey(ResourceStatus, on_delete=models.CASCADE, related_name='allocations', verbose_name="资源")
+    units = models.PositiveIntegerField(default=1, verbose_name="占用量")
+    created_at = models.DateTimeField(auto_now_add=True, null=True, verbose_name="分配时间")
+
+    class Meta:
+        verbose_name = "资源占用"
+        verbose_name_plural = verbose_name
+        ordering = ['id']
+        unique_together = ('process', 'resource')
+
 class SysParams(ERPSysBase):
     config = models.JSONField(blank=True, null=True, verbose_name="配置")
     expires_in = models.PositiveIntegerField(default=8, verbose_name="过期时间")
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete
+
+import threading
+import time
+
+from kernel.models import Operator, Role
+from kernel.metadata_cache import metadata_cache
+from kernel.broadcast import broadcast_coalescer
+
+# ================ 操作员服务权限索引 ================
+# 操作员经角色获得可办服务：Operator.role 与 Role.services 两张多对多关联表。
+# 两张关联表各一次查询构建双向索引：
+#   - 操作员id -> 可办服务id集合，供任务列表、服务搜索等按权限过滤；
+#   - 服务id -> 可办该服务的操作员id集合，供推送时直接找到受某进程影响的操作员。
+# 关联变更时递增权限索引自己的共享代数，在全部进程失效，不牵连定义元数据与规则分派表；
+# 定义元数据失效（如服务被删除）时索引也随之失效。
+
+GENERATION_KEY = 'kernel:permissions:generation'
+
+class ServicePermissionIndex:
+    """操作员与可办服务的双向索引"""
+    def __init__(self):
+        self._services_by_operator = None
+        self._operators_by_service = None
+        self._generation = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    # ---------- 代数 ----------
+    def _shared_generation(self) -> int:
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, 1, timeout=None)
+            generation = cache.get(GENERATION_KEY) or 1
+        return generation
+
+    def check(self):
+        """按间隔比对共享代数，其它进程修改过权限关联时丢弃本地索引"""
+        interval = getattr(settings, 'KERNEL_METADATA_CHECK_INTERVAL', 1.0)
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked_at < interval:
+            return
+        generation = self._shared_generation()
+        self._checked_at = now
+        if generation != self._generation:
+            self._generation = generation
+            self.invalidate()
+
+    def bump(self):
+        """递增共享代数，使全部进程的权限索引失效"""
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            # 计数器尚不存在（缓存被清空）：从当前代数之后开始
+            generation = (self._generation or 1) + 1
+            cache.set(GENERATION_KEY, generation, timeout=None)
+        self._generation = generation
+        self._checked_at = time.monotonic()
+        self.invalidate()
+
+    # ---------- 索引 ----------
+    def _index(self) -> tuple:
+        metadata_cache.check()
+        self.check()
+        services_by_operator, operators_by_service = self._services_by_operator, self._operators_by_service
+        if services_by_operator is None:
+            services_by_operator, operators_by_service = self.rebuild()
+        return services_by_operator, operators_by_service
+
+    def rebuild(self) -> tuple:
+        """由两张多对多关联表重建索引"""
+        services_by_role = {}
+        for role_id, service_id in Role.services.through.objects.values_list('role_id', 'service_id'):
+            services_by_role.setdefault(role_id, set()).add(service_id)
+
+        services_by_operator = {}
+        for operator_id, role_id in Operator.role.through.objects.values_list('operator_id', 'role_id'):
+            services_by_operator.setdefault(operator_id, set()).update(services_by_role.get(role_id, ()))
+
+        operators_by_service = {}
+        for operator_id, service_ids in services_by_operator.items():
+            for service_id in service_ids:
+                operators_by_service.setdefault(service_id, set()).add(operator_id)
+
+        services_by_operator = {key: frozenset(value) for key, value in services_by_operator.items()}
+        operators_by_service = {key: frozenset(value) for key, value in operators_by_service.items()}
+        with self._lock:
+            self._services_by_operator = services_by_operator
+            self._operators_by_service = operators_by_service
+            self.builds += 1
+        return services_by_operator, operators_by_service
+
+    def invalidate(self):
+        with self._lock:
+            self._services_by_operator = None
+            self._operators_by_service = None
+
+    def service_ids_for(self, operator_id) -> frozenset:
+        """操作员可办的服务id集合"""
+        return self._index()[0].get(operator_id, frozenset())
+
+    def operator_ids_for(self, service_id) -> frozenset:
+        """可办某服务的操作员id集合"""
+        return self._index()[1].get(service_id, frozenset())
+
+    def stats(self) -> dict:
+        services_by_operator = self._services_by_operator
+        return {
+            'operators': len(services_by_operator) if services_by_operator is not None else None,
+            'services': len(self._operators_by_service) if self._operators_by_service is not None else None,
+            'builds': self.builds,
+            'generation': self._generation,
+        }
+
+# 进程内共享的服务权限索引，按自己的共享代数失效，定义元数据失效时也随之失效
+service_permissions = ServicePermissionIndex()
+metadata_cache.add_listener(service_permissions.invalidate)
+
+def on_permission_changed(sender, action=None, **kwargs):
+    """角色或服务关联变更提交后递增权限索引的共享代数"""
+    if action is not None and action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    transaction.on_commit(service_permissions.bump)
+    # 操作员的角色变更后，其私有任务列表随可办服务变化（公共任务列表由订阅方按新权限重新过滤）
+    instance = kwargs.get('instance')
+    if sender is Operator.role.through and isinstance(instance, Operator) and instance.user and instance.user.is_staff:
+        broadcast_coalescer.mark_operator(instance, public=False)
+
+m2m_changed.connect(on_permission_changed, sender=Operator.role.through, dispatch_uid="bump_permissions_on_operator_role_changed")
+m2m_changed.connect(on_permission_changed, sender=Role.services.through, dispatch_uid="bump_permissions_on_role_services_changed")
+post_delete.connect(on_permission_changed, sender=Role, dispatch_uid="bump_permissions_on_role_delete")
+post_delete.connect(on_permission_changed, sender=Operator, dispatch_uid="bump_permissions_on_operator_delete")
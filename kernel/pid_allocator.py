@@ -0,0 +1,41 @@
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from typing import List
+
+from kernel.models import Process, SequenceCounter
+
+# PostgreSQL 下分配进程pid的数据库序列（由迁移 0004 创建）
+PID_SEQUENCE = 'kernel_process_pid_seq'
+# 其它数据库下计数行的名称
+PID_COUNTER = 'process_pid'
+
+def reserve_pids(count: int = 1) -> List[int]:
+    """
+    一次往返预留 count 个进程pid，并发安全：
+    - PostgreSQL 使用数据库序列 nextval，各事务互不阻塞（并发时取得的号段可能不连续）；
+    - 其它数据库（SQLite）原子递增计数行，取得连续号段。
+    """
+    if count <= 0:
+        return []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT nextval('{PID_SEQUENCE}') FROM generate_series(1, %s)", [count])
+            return [row[0] for row in cursor.fetchall()]
+
+    with transaction.atomic():
+        # UPDATE 先取得写锁，同一事务内读回的值即本次号段的末尾
+        updated = SequenceCounter.objects.filter(name=PID_COUNTER).update(value=F('value') + count)
+        if not updated:
+            _init_counter()
+            SequenceCounter.objects.filter(name=PID_COUNTER).update(value=F('value') + count)
+        last = SequenceCounter.objects.filter(name=PID_COUNTER).values_list('value', flat=True).get()
+    return list(range(last - count + 1, last + 1))
+
+def next_pid() -> int:
+    return reserve_pids(1)[0]
+
+def _init_counter():
+    """计数行不存在时，以现有最大pid为起点创建"""
+    max_pid = Process.objects.aggregate(max_pid=Max('pid'))['max_pid'] or 0
+    SequenceCounter.objects.get_or_create(name=PID_COUNTER, defaults={'value': max_pid})
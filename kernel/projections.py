@@ -0,0 +1,221 @@
+from django.db import models
+from django.db.models import QuerySet, prefetch_related_objects
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.core.exceptions import FieldDoesNotExist
+
+from datetime import datetime
+from typing import List, Optional
+import json
+import threading
+
+from kernel.task_stream import ROW_KEY
+
+# ================ 工单投影计划 ================
+# WorkOrder.config 中每列的 value_expression 是以 '.' 分隔的属性链，
+# 如 'service.label'、'entity_content_object.property_set_Profile.dian_hua'。
+# 投影计划对每个 (模型, 工单列) 组合只编译一次：
+#   - 预先拆分好属性链；
+#   - 推导出需要的 select_related（正向外键链）与 prefetch_related（通用外键、反向关联）路径，
+#     在遍历前一次性加载，避免逐行逐列查询；
+#   - 全部列都是数据库列（可经正向外键）时，直接用 values() 取数，不实例化模型。
+
+def format_field_value(value):
+    """
+    格式化字段值，确保返回可序列化的类型
+    """
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    elif isinstance(value, datetime):
+        return value.strftime('%y-%m-%d %H:%M')
+    elif value is None:
+        return ''
+    else:
+        return str(value)
+
+def _first(manager):
+    """反向关联取第一个对象；使用预取缓存，排序规则与 .first() 一致"""
+    items = list(manager.all())
+    if not items:
+        return None
+    if manager.model._meta.ordering:
+        return items[0]
+    return min(items, key=lambda item: item.pk)
+
+def resolve_path(instance, parts: tuple):
+    """按属性链取值：反向关联管理器取第一个对象，中途为空则返回空值"""
+    value = instance
+    for part in parts:
+        value = getattr(value, part, None)
+        if isinstance(value, models.Manager):
+            value = _first(value)
+        if value is None:
+            break
+    return format_field_value(value)
+
+class ProjectionPlan:
+    """某个模型上一组工单列的已编译投影"""
+    def __init__(self, model, work_order: List[dict]):
+        self.model = model
+        self.columns = [(field['name'], tuple(field['value_expression'].split('.'))) for field in work_order]
+        self.head = [{k: v for k, v in item.items() if k != 'value_expression'} for item in work_order]
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.safe_prefetch_related = set()  # 模型已知、一定可以预取的路径
+        self.values_lookups = []            # 全部为数据库列时的 values() 查询路径
+        pure = model is not None
+        for _, parts in self.columns:
+            lookup = self._analyze(parts)
+            if lookup is None:
+                pure = False
+            else:
+                self.values_lookups.append(lookup)
+        self.use_values = pure
+
+    def _analyze(self, parts: tuple) -> Optional[str]:
+        """
+        分析一条属性链，登记其需要的关联加载路径；
+        若整条链是“正向外键 + 终端数据库列”，返回对应的 values() 查询路径，否则返回 None。
+        """
+        model = self.model
+        path = []
+        prefetching = False  # 已经过通用外键或反向关联，其后的关联只能预取
+        model_known = True   # 经过通用外键后目标模型未知，其后的预取路径不一定可行
+        values_ok = True
+
+        def add_prefetch(lookup):
+            self.prefetch_related.add(lookup)
+            if model_known:
+                self.safe_prefetch_related.add(lookup)
+
+        for index, part in enumerate(parts):
+            is_last = index == len(parts) - 1
+            if part.startswith('__'):
+                # 如 __class__.__name__：不涉及数据库
+                return None
+
+            field = None
+            if model is not None:
+                try:
+                    field = model._meta.get_field(part)
+                except FieldDoesNotExist:
+                    field = None
+
+            if field is None:
+                # 模型未知（经过通用外键）时，非末端的一段按关联尝试预取；其余为属性/方法
+                if model is None and model_known is False and not is_last:
+                    path.append(part)
+                    add_prefetch('__'.join(path))
+                    continue
+                return None
+
+            path.append(part)
+            lookup = '__'.join(path)
+            if isinstance(field, GenericForeignKey):
+                add_prefetch(lookup)
+                prefetching, model_known, model = True, False, None
+                values_ok = False
+            elif field.is_relation and (field.many_to_many or field.one_to_many):
+                add_prefetch(lookup)
+                prefetching, model = True, field.related_model
+                values_ok = False
+            elif field.is_relation:
+                # 正向外键/一对一，或反向一对一
+                if prefetching:
+                    add_prefetch(lookup)
+                else:
+                    self.select_related.add(lookup)
+                if is_last or field.auto_created:
+                    # 末端为关联对象本身（取其字符串表示），或反向一对一：需要实例
+                    values_ok = False
+                model = field.related_model
+            elif not is_last:
+                return None
+        return lookup if values_ok and path else None
+
+    def _load(self, instances) -> list:
+        """对查询集或实例列表应用关联加载，返回实例列表"""
+        lookups = set(self.prefetch_related)
+        if isinstance(instances, QuerySet) and instances._result_cache is None:
+            if self.select_related:
+                instances = instances.select_related(*sorted(self.select_related))
+        else:
+            # 已取出的实例无法再联表，正向外键也改为预取
+            lookups |= self.select_related
+        instances = list(instances)
+
+        if instances and lookups:
+            try:
+                prefetch_related_objects(instances, *sorted(lookups))
+            except (AttributeError, ValueError, TypeError):
+                # 经通用外键的路径在部分实体类型上不存在，退回为只预取确定可行的路径
+                safe = sorted(self.safe_prefetch_related | (lookups & self.select_related))
+                if safe:
+                    prefetch_related_objects(instances, *safe)
+        return instances
+
+    def render(self, instances, key: str = None, extras: dict = None) -> List[dict]:
+        """
+        生成工单内容行；key 为行键的属性名（如 'erpsys_id'），给出时写入每行的 ROW_KEY。
+        extras 为 {行字段: 模型字段名}，附加工单以外的隐藏字段（如供订阅方过滤的服务id）。
+        """
+        hidden = dict(extras or {})
+        if key:
+            hidden[ROW_KEY] = key
+
+        if self.use_values and isinstance(instances, QuerySet) and instances._result_cache is None:
+            lookups = list(self.values_lookups)
+            lookups += [attname for attname in hidden.values() if attname not in lookups]
+            rows = []
+            for values in instances.values(*lookups):
+                row = {name: format_field_value(values[lookup]) for (name, _), lookup in zip(self.columns, self.values_lookups)}
+                row.update({field: values[attname] for field, attname in hidden.items()})
+                rows.append(row)
+            return rows
+
+        rows = []
+        for instance in self._load(instances):
+            row = {name: resolve_path(instance, parts) for name, parts in self.columns}
+            row.update({field: getattr(instance, attname) for field, attname in hidden.items()})
+            rows.append(row)
+        return rows
+
+class ProjectionPlanCache:
+    """投影计划缓存：以 (模型, 工单列定义) 为键，配置内容变化后自然失配"""
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._plans = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model, work_order: List[dict]) -> ProjectionPlan:
+        key = (model, json.dumps(work_order, sort_keys=True, default=str))
+        plan = self._plans.get(key)
+        if plan is not None:
+            self.hits += 1
+            return plan
+        self.misses += 1
+        plan = ProjectionPlan(model, work_order)
+        with self._lock:
+            if len(self._plans) >= self.max_size:
+                self._plans.clear()
+            self._plans[key] = plan
+        return plan
+
+    def stats(self) -> dict:
+        return {'size': len(self._plans), 'hits': self.hits, 'misses': self.misses}
+
+# 进程内共享的投影计划缓存
+projection_plans = ProjectionPlanCache()
+
+def _model_of(instances):
+    if isinstance(instances, QuerySet):
+        return instances.model
+    if isinstance(instances, (list, tuple)) and instances:
+        return type(instances[0])
+    return None
+
+def render_work_order(instances, work_order: List[dict], key: str = None, extras: dict = None) -> tuple:
+    """按工单配置投影实例，返回 (内容行列表, 去除value_expression的表头)"""
+    plan = projection_plans.get(_model_of(instances), work_order)
+    return plan.render(instances, key=key, extras=extras), plan.head
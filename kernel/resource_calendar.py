@@ -0,0 +1,188 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.core.cache import cache
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+
+from kernel.models import ResourceCalendar
+
+# ================ 资源日历区间索引 ================
+# ResourceCalendar 的每条记录是资源的一个可用时段 [start_time, end_time)。
+# 每个资源在内存中保存合并后的有序不相交时段，查询均为对数时间：
+#   - 某时刻是否可用：二分查找所在时段；
+#   - 某时刻之后最早的长度不小于 d 的空闲时段：二分定位后，在时段长度的最大值线段树上查找第一个足够长的时段；
+#   - 一段时间内的空闲时段：二分定位起止，只遍历结果本身。
+# 资源日历变更时递增共享缓存中该资源的版本号，各进程访问时批量比对版本，过期的索引一次查询重建。
+VERSION_KEY_PREFIX = 'kernel:calendar:'
+
+Interval = Tuple[datetime, datetime]
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """合并重叠或相接的时段，丢弃空时段"""
+    merged = []
+    for start, end in sorted(interval for interval in intervals if interval[1] > interval[0]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+class IntervalIndex:
+    """单个资源的可用时段索引"""
+    def __init__(self, intervals: Iterable[Interval]):
+        merged = merge_intervals(intervals)
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+        # 时段长度的最大值线段树（叶子从 self._size 开始）
+        self._size = 1
+        while self._size < len(merged):
+            self._size *= 2
+        self._tree = [timedelta(0)] * (2 * self._size)
+        for i, (start, end) in enumerate(merged):
+            self._tree[self._size + i] = end - start
+        for node in range(self._size - 1, 0, -1):
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _locate(self, t: datetime) -> int:
+        """开始时间不晚于 t 的最后一个时段下标，没有时为 -1"""
+        return bisect_right(self.starts, t) - 1
+
+    def contains(self, t: datetime) -> bool:
+        i = self._locate(t)
+        return i >= 0 and t < self.ends[i]
+
+    def _first_long_enough(self, lo: int, duration: timedelta) -> int:
+        """下标不小于 lo 的第一个长度不小于 duration 的时段，没有时为 -1"""
+        if lo >= len(self.starts) or self._tree[1] < duration:
+            return -1
+        # 自叶子 lo 向上：找到右侧第一个最大长度足够的子树，再向下定位
+        node = self._size + lo
+        if self._tree[node] >= duration:
+            return lo
+        while node > 1:
+            if node % 2 == 0 and self._tree[node + 1] >= duration:
+                node += 1
+                break
+            node //= 2
+        else:
+            return -1
+        while node < self._size:
+            node = 2 * node if self._tree[2 * node] >= duration else 2 * node + 1
+        index = node - self._size
+        return index if index < len(self.starts) else -1
+
+    def earliest_slot(self, after: datetime, duration: timedelta) -> Optional[datetime]:
+        """不早于 after、可连续使用 duration 的最早开始时间"""
+        i = self._locate(after)
+        if i >= 0 and self.ends[i] - max(after, self.starts[i]) >= duration:
+            return max(after, self.starts[i])
+        j = self._first_long_enough(i + 1, duration)
+        return self.starts[j] if j >= 0 else None
+
+    def slots(self, start: datetime, end: datetime) -> List[Interval]:
+        """与 [start, end) 相交的可用时段（裁剪到查询范围内）"""
+        i = max(self._locate(start), 0)
+        result = []
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                result.append((max(self.starts[i], start), min(self.ends[i], end)))
+            i += 1
+        return result
+
+class CalendarIndex:
+    """全部资源的日历索引，按资源版本号失效"""
+    def __init__(self):
+        self._indexes = {}  # 资源id -> (版本号, IntervalIndex)
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    @staticmethod
+    def _version_key(resource_id) -> str:
+        return f'{VERSION_KEY_PREFIX}{resource_id}'
+
+    def indexes(self, resource_ids: Iterable) -> Dict[int, IntervalIndex]:
+        """取多个资源的索引：一次批量比对版本，过期或缺失的一次查询重建"""
+        resource_ids = list(dict.fromkeys(resource_ids))
+        versions = cache.get_many([self._version_key(resource_id) for resource_id in resource_ids])
+        result, stale = {}, []
+        for resource_id in resource_ids:
+            version = versions.get(self._version_key(resource_id), 0)
+            entry = self._indexes.get(resource_id)
+            if entry is not None and entry[0] == version:
+                result[resource_id] = entry[1]
+            else:
+                stale.append((resource_id, version))
+
+        if stale:
+            intervals = {resource_id: [] for resource_id, _ in stale}
+            for resource_id, start, end in ResourceCalendar.objects.filter(
+                resource_id__in=list(intervals)
+            ).values_list('resource_id', 'start_time', 'end_time'):
+                intervals[resource_id].append((start, end))
+            with self._lock:
+                for resource_id, version in stale:
+                    index = IntervalIndex(intervals[resource_id])
+                    self._indexes[resource_id] = (version, index)
+                    result[resource_id] = index
+            self.loads += 1
+        return result
+
+    def index(self, resource_id) -> IntervalIndex:
+        return self.indexes([resource_id])[resource_id]
+
+    def is_available(self, resource_id, t: datetime) -> bool:
+        """资源在 t 时刻是否处于可用时段"""
+        return self.index(resource_id).contains(t)
+
+    def earliest_free_slot(self, resource_id, after: datetime, duration: timedelta) -> Optional[datetime]:
+        """资源在 after 之后最早可连续使用 duration 的开始时间，没有时返回 None"""
+        return self.index(resource_id).earliest_slot(after, duration)
+
+    def free_slots(self, resource_ids: Iterable, start: datetime, end: datetime) -> Dict[int, List[Interval]]:
+        """多个资源在 [start, end) 内的可用时段"""
+        return {resource_id: index.slots(start, end) for resource_id, index in self.indexes(resource_ids).items()}
+
+    def invalidate(self, resource_id):
+        """递增资源版本号，使全部进程中该资源的索引失效"""
+        key = self._version_key(resource_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+        with self._lock:
+            self._indexes.pop(resource_id, None)
+
+    def stats(self) -> dict:
+        return {
+            'resources': len(self._indexes),
+            'intervals': sum(len(index) for _, index in self._indexes.values()),
+            'loads': self.loads,
+        }
+
+# 进程内共享的资源日历索引
+calendar_index = CalendarIndex()
+
+def remember_calendar_resource(sender, instance: ResourceCalendar, **kwargs):
+    """保存前记下日历原属的资源：日历改挂到其它资源时，原资源的索引同样失效"""
+    if instance.pk is not None:
+        instance._previous_resource_id = ResourceCalendar.objects.filter(pk=instance.pk).values_list(
+            'resource_id', flat=True
+        ).first()
+
+def on_calendar_changed(sender, instance: ResourceCalendar, **kwargs):
+    """资源日历变更提交后使相关资源（原资源与现资源）的索引失效"""
+    resource_ids = {instance.resource_id, getattr(instance, '_previous_resource_id', None)} - {None}
+    instance._previous_resource_id = None
+    for resource_id in resource_ids:
+        transaction.on_commit(lambda resource_id=resource_id: calendar_index.invalidate(resource_id))
+
+pre_save.connect(remember_calendar_resource, sender=ResourceCalendar, dispatch_uid="remember_calendar_resource")
+post_save.connect(on_calendar_changed, sender=ResourceCalendar, dispatch_uid="invalidate_calendar_on_save")
+post_delete.connect(on_calendar_changed, sender=ResourceCalendar, dispatch_uid="invalidate_calendar_on_delete")
@@ -1,44 +1,120 @@
-from django.db import transaction
-from django.db.models import F
+from django.db import transaction, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from typing import Dict
+
+from kernel.models import ResourceStatus, ResourceAllocation
+from kernel.resource_calendar import calendar_index
+
+# ================ 资源占用账本 ================
+# 资源容量的占用与释放都是单条条件UPDATE，不再先 select_for_update 读出再写回：
+#   UPDATE ... SET current_usage = current_usage + n WHERE id = r AND current_usage + n <= capacity
+# 受影响行数为1即分配成功；释放时 current_usage 在SQL中钳制为不小于0。
+# 进程级分配为全有或全无：按资源id顺序依次占用（顺序一致避免死锁），任一不足则整体回滚；
+# 每个进程对每个资源一条占用记录（ResourceAllocation），重复分配与重复释放都是幂等的。
+
+# 服务配置中的资源需求（见 copy_design_to_kernel 生成的 Service.config）
+REQUIREMENT_KEYS = (
+    'material_requirements', 'equipment_requirements', 'device_requirements',
+    'capital_requirements', 'knowledge_requirements',
+)
+
+class ResourceUnavailable(Exception):
+    """资源容量不足"""
+    pass
+
+def try_acquire(resource_id, units: int = 1) -> bool:
+    """条件占用资源容量，成功返回 True"""
+    return ResourceStatus.objects.filter(
+        pk=resource_id, current_usage__lte=F('capacity') - units
+    ).update(current_usage=F('current_usage') + units) == 1
+
+def release_units(resource_id, units: int = 1) -> bool:
+    """释放资源容量，使用量不低于0"""
+    return ResourceStatus.objects.filter(pk=resource_id).update(
+        current_usage=Greatest(F('current_usage') - units, Value(0))
+    ) == 1
 
 def can_allocate_resource(resource_id, units_needed=1):
     """
-    检查某资源是否能分配给本进程 
+    检查某资源是否能分配给本进程（只读，结果仅供参考，以分配时的条件更新为准）
     """
-    with transaction.atomic():
-        # 1. select_for_update() 保证行级锁
-        resource = ResourceStatus.objects.select_for_update().get(pk=resource_id)
-        # 2. 校验容量
-        if resource.current_usage + units_needed <= resource.capacity:
-            return True
-        else:
-            return False
+    return ResourceStatus.objects.filter(pk=resource_id, current_usage__lte=F('capacity') - units_needed).exists()
 
 def allocate_resource(resource_id, units_needed=1):
     """
     资源分配
     """
-    with transaction.atomic():
-        resource = ResourceStatus.objects.select_for_update().get(pk=resource_id)
-        # 再次检查并更新
-        if resource.current_usage + units_needed > resource.capacity:
-            raise RuntimeError("Resource capacity exceeded")
-        resource.current_usage = F('current_usage') + units_needed
-        resource.save()
+    if not try_acquire(resource_id, units_needed):
+        raise RuntimeError("Resource capacity exceeded")
 
 def release_resource(resource_id, units_released=1):
     """
     资源释放
     """
-    with transaction.atomic():
-        resource = ResourceStatus.objects.select_for_update().get(pk=resource_id)
-        # 避免出现负数
-        resource.current_usage = F('current_usage') - units_released
-        if resource.current_usage < 0:
-            resource.current_usage = 0
-        resource.save()
+    release_units(resource_id, units_released)
+
+# ---------- 进程级分配 ----------
+def process_requirements(process) -> Dict[int, int]:
+    """
+    解析进程所需的受控资源：服务配置中各类资源需求的 erpsys_id 即资源（Resource，由 copy_design_to_kernel
+    从设计复制，erpsys_id 不变）的 erpsys_id，经 ResourceStatus.resource 对应到资源状态，
+    返回 {资源状态id: 数量}；没有资源状态的资源不受容量控制。
+    """
+    config = (process.service.config if process.service else None) or {}
+    quantities = {}
+    for key in REQUIREMENT_KEYS:
+        for requirement in config.get(key) or []:
+            erpsys_id = requirement.get('erpsys_id')
+            if erpsys_id:
+                quantities[erpsys_id] = quantities.get(erpsys_id, 0) + (requirement.get('quantity') or 1)
+    if not quantities:
+        return {}
+    resources = ResourceStatus.objects.filter(resource__erpsys_id__in=quantities).values_list('id', 'resource__erpsys_id')
+    return {resource_id: quantities[erpsys_id] for resource_id, erpsys_id in resources}
+
+def allocate_for_process(process, requirements: Dict[int, int] = None) -> bool:
+    """
+    为进程一次占用全部所需资源，全有或全无；已分配过的进程直接返回 True。
+    requirements 缺省时按 process_requirements 解析。
+    """
+    if requirements is None:
+        requirements = process_requirements(process)
+    if not requirements:
+        return True
+    if ResourceAllocation.objects.filter(process=process).exists():
+        return True
+
+    try:
+        with transaction.atomic():
+            for resource_id in sorted(requirements):
+                if not try_acquire(resource_id, requirements[resource_id]):
+                    raise ResourceUnavailable(resource_id)
+            ResourceAllocation.objects.bulk_create([
+                ResourceAllocation(process=process, resource_id=resource_id, units=units)
+                for resource_id, units in requirements.items()
+            ])
+    except ResourceUnavailable:
+        return False
+    except IntegrityError:
+        # 同一进程被并发分配：以先提交者为准，本次占用已随事务回滚
+        return True
+    return True
+
+def release_for_process(process) -> int:
+    """释放进程占用的全部资源，返回释放的资源数；重复释放不会重复归还容量"""
+    released = 0
+    for allocation in ResourceAllocation.objects.filter(process=process):
+        with transaction.atomic():
+            # 以删除占用记录为准：并发释放时只有删除成功的一方归还容量
+            deleted, _ = ResourceAllocation.objects.filter(pk=allocation.pk).delete()
+            if deleted:
+                release_units(allocation.resource_id, allocation.units)
+                released += 1
+    return released
 
 def is_in_resource_schedule(resource, current_time):
-    # 对比 resource 的时间表，若 current_time 在 resource 的可用区间内则 True，否则 False
-    # 或者 resourceCalendar.objects.filter(resource=..., start__lte=current_time, end__gte=current_time) ...
-    return False
\ No newline at end of file
+    """current_time 是否在资源日历的可用时段内；resource 为资源需求（ResourceRequirement，日历挂在其上）实例或其id"""
+    resource_id = getattr(resource, 'pk', resource)
+    return calendar_index.is_available(resource_id, current_time)
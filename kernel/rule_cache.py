@@ -0,0 +1,212 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from collections import OrderedDict, namedtuple
+import ast
+import threading
+
+from kernel.models import Event, ServiceRule
+from kernel.metadata_cache import metadata_cache
+
+# ================ 事件表达式编译缓存 ================
+# 表达式中允许调用的内置函数，其余名称只能来自评估上下文
+SAFE_BUILTINS = {
+    'len': len, 'min': min, 'max': max, 'abs': abs, 'round': round,
+    'sum': sum, 'any': any, 'all': all,
+    'int': int, 'float': float, 'str': str, 'bool': bool,
+}
+
+# 表达式允许出现的语法节点：比较、布尔运算、算术、字面量、下标、白名单函数调用
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple, ast.Set, ast.Dict,
+    ast.Subscript, ast.Slice, ast.Attribute, ast.Call,
+)
+
+_EVAL_GLOBALS = {'__builtins__': SAFE_BUILTINS}
+
+class ExpressionError(Exception):
+    """事件表达式不合法（语法错误或包含受限语法）"""
+    pass
+
+def compile_expression(expression: str, filename: str = '<event>'):
+    """
+    将事件表达式编译为受限的code object：
+    - 只允许 _ALLOWED_NODES 中的语法节点；
+    - 禁止访问下划线开头的名称和属性；
+    - 函数调用只允许 SAFE_BUILTINS 中的内置函数。
+    """
+    try:
+        tree = ast.parse(expression.strip(), filename=filename, mode='eval')
+    except SyntaxError as e:
+        raise ExpressionError(f"表达式语法错误: {e}")
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError(f"表达式包含不允许的语法: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id.startswith('_'):
+            raise ExpressionError(f"表达式不允许访问名称: {node.id}")
+        if isinstance(node, ast.Attribute) and node.attr.startswith('_'):
+            raise ExpressionError(f"表达式不允许访问属性: {node.attr}")
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id in SAFE_BUILTINS):
+                raise ExpressionError("表达式只允许调用内置白名单函数")
+
+    return compile(tree, filename, 'eval')
+
+class CompiledExpressionCache:
+    """
+    事件表达式编译缓存：每个 Event.expression 只编译一次。
+    - 缓存键为 (event_id, hash(expression))，表达式变更后自然失配；
+    - Event 保存/删除时通过信号主动驱逐；
+    - 以LRU方式限制条目数，并记录命中/未命中/驱逐计数。
+    """
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (event_id, expr_hash) -> (expression, code)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, event_id, expression: str):
+        """获取编译后的code object；表达式不合法时抛出 ExpressionError"""
+        key = (event_id, hash(expression))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expression:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        code = compile_expression(expression, filename=f'<event:{event_id}>')
+
+        with self._lock:
+            self._entries[key] = (expression, code)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return code
+
+    def evaluate(self, event_id, expression: str, context: dict):
+        """在给定上下文中评估表达式"""
+        return eval(self.get(event_id, expression), _EVAL_GLOBALS, context)
+
+    def evict(self, event_id):
+        """驱逐某个Event的全部缓存条目"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == event_id]:
+                del self._entries[key]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+# 进程内共享的表达式缓存
+expression_cache = CompiledExpressionCache()
+
+@receiver(post_save, sender=Event, dispatch_uid="evict_event_expression_on_save")
+@receiver(post_delete, sender=Event, dispatch_uid="evict_event_expression_on_delete")
+def on_event_changed(sender, instance: Event, **kwargs):
+    """Event变更后驱逐其编译缓存"""
+    expression_cache.evict(instance.pk)
+
+# ================ 规则分派表 ================
+# 已完全解析的规则：评估与执行阶段无需再访问 ServiceRule/Event/Instruction
+RuleSpec = namedtuple('RuleSpec', [
+    'erpsys_id',           # ServiceRule.erpsys_id，作为 service_rule_id 传给系统调用
+    'label',
+    'event_id',
+    'expression',          # Event.expression
+    'sys_call',            # Instruction.sys_call，无系统指令时为 None
+    'operand_service_id',
+    'parameters',          # ServiceRule.parameter_values，作为显式参数随系统调用消息传递
+])
+
+class RuleDispatchTable:
+    """
+    规则分派表：(服务程序erpsys_id, 服务id) -> 有序的 RuleSpec 元组。
+    - 由元数据缓存中的规则（已 select_related 关联）构建全部索引，评估进程时不再产生元数据查询；
+    - 定义元数据失效（本进程或其它进程修改了规则相关模型）时随之失效，下一次访问时重建；
+    - copy_design_to_kernel 写入新规则后主动重建；
+    - 定时事件（Event.is_timer）的规则单独索引，只在进程的定时器到期时评估（见 kernel.timer_wheel）。
+    """
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _indexes(self) -> tuple:
+        metadata_cache.check()
+        indexes = self._index
+        if indexes is None:
+            indexes = self.rebuild()
+        return indexes
+
+    def rules_for(self, program_id: str, service_id) -> tuple:
+        """获取某服务程序下某服务的规则（不含定时事件规则），按 ServiceRule.Meta.ordering 排序"""
+        return self._indexes()[0].get((program_id, service_id), ())
+
+    def timer_rules_for(self, program_id: str, service_id) -> tuple:
+        """获取某服务程序下某服务的定时事件规则"""
+        return self._indexes()[1].get((program_id, service_id), ())
+
+    def rebuild(self) -> tuple:
+        """由缓存的规则重建分派索引，返回 (一般规则索引, 定时事件规则索引)"""
+        index, timer_index = {}, {}
+        for rule in metadata_cache.all(ServiceRule):
+            if rule.target_service is None or rule.event is None or not rule.event.expression:
+                continue
+            spec = RuleSpec(
+                erpsys_id=rule.erpsys_id,
+                label=rule.label,
+                event_id=rule.event_id,
+                expression=rule.event.expression,
+                sys_call=rule.system_instruction.sys_call if rule.system_instruction else None,
+                operand_service_id=rule.operand_service_id,
+                parameters=rule.parameter_values or None,
+            )
+            target = timer_index if rule.event.is_timer else index
+            target.setdefault((rule.target_service.erpsys_id, rule.service_id), []).append(spec)
+
+        indexes = (
+            {key: tuple(specs) for key, specs in index.items()},
+            {key: tuple(specs) for key, specs in timer_index.items()},
+        )
+        with self._lock:
+            self._index = indexes
+            self.builds += 1
+        return indexes
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def stats(self) -> dict:
+        indexes = self._index
+        return {
+            'keys': len(indexes[0]) if indexes is not None else None,
+            'rules': sum(len(specs) for specs in indexes[0].values()) if indexes is not None else None,
+            'timer_rules': sum(len(specs) for specs in indexes[1].values()) if indexes is not None else None,
+            'builds': self.builds,
+        }
+
+# 进程内共享的规则分派表，随定义元数据一同失效
+rule_dispatch_table = RuleDispatchTable()
+metadata_cache.add_listener(rule_dispatch_table.invalidate)
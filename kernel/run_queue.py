@@ -0,0 +1,218 @@
+from django.conf import settings
+from django.db import transaction
+from django.core.cache import cache
+from django.utils import timezone
+
+from typing import List
+import heapq
+
+from kernel.models import Process
+from kernel.types import ProcessState
+from kernel.broadcast import broadcast_coalescer
+from kernel.resource_manage import allocate_for_process, release_for_process
+
+# ================ 调度运行队列 ================
+# 就绪队列即 state=READY 的进程，依靠复合索引 (state, -priority, created_at) 按序取出；
+# 运行中进程按 (state, id) 索引分批巡检。每批在独立的短事务中：
+#   1. 调度策略按索引选出有界的候选进程id（不加锁）；
+#   2. SELECT ... FOR UPDATE SKIP LOCKED 认领其中仍为 READY 且未被其它调度者锁定的进程；
+#   3. 切换状态后立即提交，锁只持有一个批次。
+# 每次时钟中断最多处理 KERNEL_SCHEDULER_MAX_BATCHES 批，单次调度的开销与进程表总量无关。
+
+# 巡检游标在共享缓存中的有效期（秒）：长期无人使用的游标自动过期，过期后从头巡检
+REAP_CURSOR_TTL = 24 * 3600
+
+# ---------- 资源钩子 ----------
+def attempt_resource_allocation(process) -> bool:
+    """为进程一次占用全部所需资源（全有或全无），成功返回 True"""
+    return allocate_for_process(process)
+
+def check_if_process_done(process) -> bool:
+    """检查运行中进程是否已完成（或超时、出错）；默认由业务显式终止"""
+    return False
+
+def release_all_resources_for_process(process):
+    """释放进程占用的全部资源"""
+    release_for_process(process)
+
+# ---------- 调度策略 ----------
+class DispatchPolicy:
+    """调度策略：按索引选出下一批候选进程id，顺序即认领顺序"""
+    name = None
+
+    def candidates(self, queryset, limit: int) -> List[int]:
+        raise NotImplementedError
+
+class StrictPriorityPolicy(DispatchPolicy):
+    """严格优先级：优先级高者先调度，同优先级先到先服务"""
+    name = 'strict_priority'
+
+    def candidates(self, queryset, limit: int) -> List[int]:
+        return list(queryset.order_by('-priority', 'created_at', 'id').values_list('id', flat=True)[:limit])
+
+class PriorityAgingPolicy(DispatchPolicy):
+    """
+    优先级老化：有效优先级 = 优先级 + 等待秒数 / aging_step，避免低优先级进程长期饥饿。
+    同一优先级内等待越久有效优先级越高，各优先级按 (created_at, id) 的队列已按有效优先级降序排列，
+    因此对各优先级的队列做多路归并即得全局前 limit 个：
+      - 优先级逐级以索引跳跃扫描列出（每级一次索引定位），不扫描全部就绪行；
+      - 各级队头按块懒取，只有块被取尽且该级仍在归并前列时才取下一块，取出的行数约为 limit + 优先级数 × 块大小。
+    """
+    name = 'priority_aging'
+
+    def __init__(self, aging_step: float = None):
+        self.aging_step = aging_step or getattr(settings, 'KERNEL_SCHEDULER_AGING_STEP', 60)
+
+    @staticmethod
+    def levels(queryset) -> List[int]:
+        """就绪队列中的优先级（降序）：每次取严格低于上一级的最高优先级，走 (state, -priority) 索引"""
+        ordered = queryset.order_by('-priority').values_list('priority', flat=True)
+        levels = []
+        level = ordered.first()
+        while level is not None:
+            levels.append(level)
+            level = ordered.filter(priority__lt=level).first()
+        return levels
+
+    def candidates(self, queryset, limit: int) -> List[int]:
+        levels = self.levels(queryset)
+        if not levels or limit <= 0:
+            return []
+        now = timezone.now()
+        chunk = -(-limit // len(levels))
+
+        def effective(priority, created_at):
+            waited = (now - created_at).total_seconds() if created_at else 0
+            return priority + max(waited, 0) / self.aging_step
+
+        def fetch(level, offset):
+            return list(queryset.filter(priority=level).order_by('created_at', 'id').values_list(
+                'id', 'created_at'
+            )[offset:offset + chunk])
+
+        # 堆中每级一个队头：(-有效优先级, id, 优先级, 块内位置)
+        heads, rows, offsets = [], {}, {}
+        for level in levels:
+            rows[level], offsets[level] = fetch(level, 0), 0
+            if rows[level]:
+                id, created_at = rows[level][0]
+                heads.append((-effective(level, created_at), id, level, 0))
+        heapq.heapify(heads)
+
+        ids = []
+        while heads:
+            _, id, level, position = heapq.heappop(heads)
+            ids.append(id)
+            if len(ids) == limit:
+                break
+            position += 1
+            if position == len(rows[level]) and len(rows[level]) == chunk:
+                offsets[level] += chunk
+                rows[level], position = fetch(level, offsets[level]), 0
+            if position < len(rows[level]):
+                id, created_at = rows[level][position]
+                heapq.heappush(heads, (-effective(level, created_at), id, level, position))
+        return ids
+
+DISPATCH_POLICIES = {
+    StrictPriorityPolicy.name: StrictPriorityPolicy,
+    PriorityAgingPolicy.name: PriorityAgingPolicy,
+}
+
+def get_dispatch_policy(name: str = None) -> DispatchPolicy:
+    name = name or getattr(settings, 'KERNEL_SCHEDULER_POLICY', StrictPriorityPolicy.name)
+    policy_class = DISPATCH_POLICIES.get(name)
+    if policy_class is None:
+        raise ValueError(f"未知的调度策略: {name}")
+    return policy_class()
+
+# ---------- 运行队列 ----------
+class RunQueue:
+    """
+    内核运行队列：分批认领就绪进程并切换为运行/等待，分批巡检运行中进程。
+    queryset 可限定队列范围（如按分区过滤），默认为全部进程；name 区分各队列的巡检游标。
+    """
+    def __init__(self, policy: DispatchPolicy = None, batch_size: int = None, max_batches: int = None, queryset=None, name: str = 'default'):
+        self.policy = policy or get_dispatch_policy()
+        self.batch_size = batch_size or getattr(settings, 'KERNEL_SCHEDULER_BATCH_SIZE', 100)
+        self.max_batches = max_batches or getattr(settings, 'KERNEL_SCHEDULER_MAX_BATCHES', 10)
+        self.queryset = queryset if queryset is not None else Process.objects.all()
+        # 巡检游标保存在共享缓存中，每次时钟中断从上次停下的位置继续，扫到末尾后回绕
+        self.reap_cursor_key = f'kernel:run_queue:{name}:reap_cursor'
+
+    def _claim(self, ids: List[int]) -> List[Process]:
+        """锁定候选进程中仍为就绪、且未被其它调度者锁定的进程，保持候选顺序"""
+        locked = Process.objects.select_for_update(skip_locked=True, of=('self',)).select_related(
+            'service', 'operator'
+        ).filter(id__in=ids, state=ProcessState.READY.name)
+        by_id = {process.id: process for process in locked}
+        return [by_id[id] for id in ids if id in by_id]
+
+    def dispatch(self) -> List[Process]:
+        """分批调度就绪进程，返回状态发生变化的进程"""
+        ready = self.queryset.filter(state=ProcessState.READY.name)
+        changed = []
+        seen = []  # 本次已处理但仍为就绪的进程（如资源不足且已指定操作员），不再重复认领
+        for _ in range(self.max_batches):
+            candidates = ready.exclude(id__in=seen) if seen else ready
+            ids = self.policy.candidates(candidates, self.batch_size)
+            if not ids:
+                break
+            moved = set()
+            with transaction.atomic():
+                claimed = self._claim(ids)
+                for process in claimed:
+                    if attempt_resource_allocation(process):
+                        process.state = ProcessState.RUNNING.name
+                        process.start_time = timezone.now()
+                        process.save(update_fields=['state', 'start_time', 'updated_at'])
+                    elif process.operator is None:
+                        # 无法分配资源，进入 WAITING
+                        process.state = ProcessState.WAITING.name
+                        process.save(update_fields=['state', 'updated_at'])
+                    else:
+                        continue
+                    changed.append(process)
+                    moved.add(process.id)
+            # 已离开就绪状态的进程不会再被选中，只需排除仍为就绪的
+            seen += [id for id in ids if id not in moved]
+            # 候选不足一批：队列已取尽（被其它调度者锁定的候选已计入 seen，下一批跳过）
+            if len(ids) < self.batch_size:
+                break
+        return changed
+
+    def reap(self) -> List[Process]:
+        """按id分批巡检运行中进程，终止已完成的进程并释放资源，返回被终止的进程"""
+        running = self.queryset.filter(state=ProcessState.RUNNING.name).select_related('service', 'operator').order_by('id')
+        terminated = []
+        last_id = cache.get(self.reap_cursor_key, 0)
+        for _ in range(self.max_batches):
+            batch = list(running.filter(id__gt=last_id)[:self.batch_size])
+            if not batch:
+                last_id = 0
+                break
+            last_id = batch[-1].id
+            done_ids = [process.id for process in batch if check_if_process_done(process)]
+            if done_ids:
+                with transaction.atomic():
+                    for process in self._lock_running(done_ids):
+                        release_all_resources_for_process(process)
+                        process.state = ProcessState.TERMINATED.name
+                        process.end_time = timezone.now()
+                        process.save(update_fields=['state', 'end_time', 'updated_at'])
+                        terminated.append(process)
+            if len(batch) < self.batch_size:
+                last_id = 0
+                break
+        cache.set(self.reap_cursor_key, last_id, timeout=REAP_CURSOR_TTL)
+        return terminated
+
+    def _lock_running(self, ids: List[int]) -> List[Process]:
+        return list(Process.objects.select_for_update(skip_locked=True, of=('self',)).select_related(
+            'service', 'operator'
+        ).filter(id__in=ids, state=ProcessState.RUNNING.name).order_by('id'))
+
+    def tick(self) -> List[Process]:
+        """一次时钟中断的调度：调度就绪进程、巡检运行中进程，期间的推送合并为一次"""
+        with broadcast_coalescer.suppressed():
+            return self.dispatch() + self.reap()
@@ -2,13 +2,15 @@ from django.db.models.signals import post_save
 from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in
-from django.utils import timezone
 from django.conf import settings
 
 from kernel.signals import ux_input_signal
 from kernel.models import Process, ServiceRule, Operator, Service
 from kernel.types import ProcessState
-from kernel.sys_lib import ProcessCreator, update_task_list, update_entity_task_group_list
+from kernel.sys_lib import ProcessCreator, RuleEvaluator
+from kernel.broadcast import broadcast_coalescer
+from kernel.metadata_cache import metadata_cache
+from kernel.resource_manage import release_for_process
 
 @receiver(user_logged_in)
 def on_user_login(sender, user, request, **kwargs):
@@ -22,8 +24,14 @@ def on_user_login(sender, user, request, **kwargs):
         # 创建一个登录守候进程, state=RUNNING
         operator = Operator.objects.get(user=user)
         # 获取登录服务程序, 有bug -> sys_default
-        service_program = Service.objects.get(label='标准登录程序')
-        service_rule = ServiceRule.objects.get(target_service=service_program, service__name='user_login')
+        service_program = metadata_cache.get(Service, label='标准登录程序')
+        service_rule = next(
+            (rule for rule in metadata_cache.all(ServiceRule)
+             if rule.target_service_id == service_program.pk and rule.service and rule.service.name == 'user_login'),
+            None
+        )
+        if service_rule is None:
+            raise ServiceRule.DoesNotExist("标准登录程序未定义 user_login 规则")
         params = {
             "parent": None,
             "previous": None,
@@ -45,13 +53,12 @@ def on_user_login(sender, user, request, **kwargs):
 def on_process_save(sender, instance: Process, created: bool, **kwargs):
     """
     更新进程业务状态后，更新任务队列，输出刷新后的任务调度信号
+    推送由合并器在时间窗口内去重后异步执行：公共任务、操作员的今日安排、实体作业任务清单
+    进程终止后释放其占用的资源（幂等，已释放的不会重复归还）
     """
-    if instance.operator and instance.operator.user.is_staff:
-        update_task_list(instance.operator, True)
-        # 更新操作员的今日安排、紧要安排、本周安排
-        update_task_list(instance.operator, False)
-
-        update_entity_task_group_list(instance.entity_content_object)
+    broadcast_coalescer.mark_process(instance)
+    if instance.state == ProcessState.TERMINATED.name:
+        transaction.on_commit(lambda: release_for_process(instance))
 
 # @receiver(operand_finished)
 # def operand_finished_handler(sender, **kwargs):
@@ -73,56 +80,33 @@ def on_process_save(sender, instance: Process, created: bool, **kwargs):
 
 def on_timer_signal(**kwargs):
     # 将Celery的定时任务信号转译为业务事件
-    """接收定时信号调度"""
     """
-    操作系统时钟中断信号，
-    可检查各业务进程状态，启动提醒服务进程、分析报告服务进程等
-    优先级最低
+    接收定时信号调度（已停用，保留为空操作）。
+    运行队列的调度由常驻的调度者进程执行：manage.py run_scheduler（见 kernel.scheduler_cluster.SchedulerWorker.run），
+    进程定时器由 manage.py run_timer_wheel 触发。在此处加入集群的调度者不会继续续租，
+    会占住分到的分区直到租约到期，故不再在定时信号中调度。
     """
-    # ??? 每分钟执行一次，查询所有定时规则，检查是否满足条件，满足则执行SOP
-    print("timer_signal was received.", kwargs)
+    return None
 
+def reevaluate_open_processes(chunk_size: int = 1000) -> int:
     """
-    示例：定时任务，每隔一段时间（30秒），就执行一次调度过程。
+    按id分块批量重新评估所有未终止进程的规则，返回发出的系统调用数量。
     """
-    with transaction.atomic():
-        # 1. 搜集所有处于 READY 状态的进程
-        ready_processes = Process.objects.select_for_update().filter(
-            state=ProcessState.READY.name
-        ).order_by('-priority', 'created_at')
-
-        # 2. 根据资源可用情况，决定哪些进程能进入 RUNNING，哪些进程要保持 WAITING
-        for proc in ready_processes:
-            # 检查对应资源是否可用
-            if attempt_resource_allocation(proc):
-                # attempt_resource_allocation(proc) 内部会做：
-                # 解析 proc.control_context 里的资源需求；
-                # select_for_update() 获取锁；
-                # 判断剩余容量与排班；
-                # 成功则更新 current_usage 并返回 True，否则 False。
-
-                # 切换状态为 RUNNING
-                proc.state = ProcessState.RUNNING.name
-                proc.start_time = timezone.now()
-                proc.save()
-            elif proc.operator is None:
-                # 如果无法分配资源，则进入 WAITING
-                proc.state = ProcessState.WAITING.name
-                proc.save()
-
-        # 3. 对于已经 RUNNING 的进程，检查是否已经完成或需要释放资源
-        running_processes = Process.objects.filter(state=ProcessState.RUNNING.name)
-        for proc in running_processes:
-            # 如果满足某些完成条件(自己判断) or 超时 or 出错
-            if check_if_process_done(proc):
-                with transaction.atomic():
-                    release_all_resources_for_process(proc)
-                    proc.state = ProcessState.TERMINATED.name
-                    proc.end_time = timezone.now()
-                    proc.save()
-            # 否则继续保持 RUNNING
-
-        # 4. 其他额外逻辑（异常检测/重试等），省略...
+    evaluator = RuleEvaluator()
+    open_processes = Process.objects.select_related('service', 'operator').filter(
+        program_entrypoint__isnull=False
+    ).exclude(
+        state=ProcessState.TERMINATED.name
+    ).order_by('id')
+
+    last_id, issued = 0, 0
+    while True:
+        chunk = list(open_processes.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        issued += evaluator.evaluate_rules_batch(chunk)
+        last_id = chunk[-1].id
+    return issued
 
 @receiver(ux_input_signal)
 def on_ux_input(**kwargs):
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Q, Value
+from django.db.models.functions import Mod, Coalesce
+from django.utils import timezone
+
+from datetime import timedelta
+from typing import List
+import os
+import socket
+import time
+import uuid
+
+from kernel.models import Process, SchedulerLease
+from kernel.run_queue import RunQueue
+
+# ================ 多调度者集群 ================
+# 运行队列按分区（进程id取模，或操作员所属组织取模）分给多个调度者并行处理：
+#   - 每个调度者每次时钟中断续租自己的成员租约（SchedulerLease 'scheduler:member:<id>'）；
+#   - 领导者租约 'scheduler:leader' 以条件UPDATE抢占/续租，租约到期后由其它调度者接任；
+#     PostgreSQL 上抢占过程另以事务级咨询锁串行化，竞争者直接跳过而不在租约行上等待；
+#   - 领导者清理过期成员，按存活成员重新分配分区，分配表写入领导者租约的 data；
+#   - 各调度者只处理分配给自己的分区。调度者消失后其成员租约过期，下一次领导者巡视即重新分配。
+# 分配切换期间两个调度者可能短暂处理同一分区，认领使用 SKIP LOCKED 与状态复核，不会重复调度。
+# 每个调度者以独立的常驻进程运行（manage.py run_scheduler），按 KERNEL_SCHEDULER_TICK_INTERVAL 持续续租与调度，
+# 分到分区的调度者都在不停地处理各自的分区，吞吐随调度者数量扩展。
+LEADER_LEASE = 'scheduler:leader'
+MEMBER_PREFIX = 'scheduler:member:'
+# 领导者选举的PostgreSQL咨询锁键
+LEADER_ADVISORY_LOCK = 0x6b65726e  # 'kern'
+
+def get_partition_count() -> int:
+    return max(1, getattr(settings, 'KERNEL_SCHEDULER_PARTITIONS', 16))
+
+def get_lease_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'KERNEL_SCHEDULER_LEASE_TTL', 90))
+
+def partition_queryset(partitions: List[int], partition_count: int = None, partition_by: str = None):
+    """某些分区内的进程"""
+    partition_count = partition_count or get_partition_count()
+    partition_by = partition_by or getattr(settings, 'KERNEL_SCHEDULER_PARTITION_BY', 'id')
+    if partition_by == 'organization':
+        key = Mod(Coalesce('operator__organization_id', Value(0)), partition_count)
+    elif partition_by == 'id':
+        key = Mod('id', partition_count)
+    else:
+        raise ValueError(f"未知的分区方式: {partition_by}")
+    return Process.objects.annotate(partition=key).filter(partition__in=partitions)
+
+def assign_partitions(members: List[str], partition_count: int) -> dict:
+    """把分区轮流分给按id排序的存活成员"""
+    members = sorted(members)
+    assignment = {member: [] for member in members}
+    for partition in range(partition_count):
+        if members:
+            assignment[members[partition % len(members)]].append(partition)
+    return assignment
+
+def try_acquire_lease(name: str, owner: str, ttl: timedelta, advisory_lock: int = None) -> bool:
+    """
+    抢占或续租独占租约：租约无主、已过期或本就属于 owner 时以条件UPDATE取得，成功返回 True。
+    PostgreSQL 上可另以事务级咨询锁串行化抢占，竞争者直接跳过而不在租约行上等待。
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            if advisory_lock is not None and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [advisory_lock])
+                    if not cursor.fetchone()[0]:
+                        return False
+            SchedulerLease.objects.get_or_create(name=name)
+            updated = SchedulerLease.objects.filter(name=name).filter(
+                Q(owner=owner) | Q(owner__isnull=True) | Q(expires_at__isnull=True) | Q(expires_at__lt=now)
+            ).update(owner=owner, expires_at=now + ttl)
+    except IntegrityError:
+        # 租约行被并发创建
+        updated = 0
+    return updated == 1
+
+class SchedulerWorker:
+    """集群中的一个调度者"""
+    def __init__(self, worker_id: str = None):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.member_lease = f'{MEMBER_PREFIX}{self.worker_id}'
+        self.is_leader = False
+
+    # ---------- 租约 ----------
+    def heartbeat(self):
+        """续租成员租约"""
+        SchedulerLease.objects.update_or_create(
+            name=self.member_lease,
+            defaults={'owner': self.worker_id, 'expires_at': timezone.now() + get_lease_ttl()},
+        )
+
+    def try_lead(self) -> bool:
+        """抢占或续租领导者租约，成功返回 True"""
+        self.is_leader = try_acquire_lease(LEADER_LEASE, self.worker_id, get_lease_ttl(), LEADER_ADVISORY_LOCK)
+        return self.is_leader
+
+    def rebalance(self) -> dict:
+        """（领导者）清理过期成员，按存活成员重新分配分区；分配变化时递增 epoch"""
+        now = timezone.now()
+        SchedulerLease.objects.filter(name__startswith=MEMBER_PREFIX, expires_at__lt=now).delete()
+        members = list(SchedulerLease.objects.filter(
+            name__startswith=MEMBER_PREFIX, expires_at__gte=now
+        ).values_list('owner', flat=True))
+        partition_count = get_partition_count()
+        assignment = assign_partitions(members, partition_count)
+
+        with transaction.atomic():
+            leader = SchedulerLease.objects.select_for_update().get(name=LEADER_LEASE)
+            data = leader.data or {}
+            if data.get('assignment') != assignment or data.get('partitions') != partition_count:
+                data = {'epoch': data.get('epoch', 0) + 1, 'partitions': partition_count, 'assignment': assignment}
+                leader.data = data
+                leader.save(update_fields=['data'])
+                print(f"[Scheduler] 分区重新分配 epoch={data['epoch']}: {assignment}")
+        return data
+
+    def partitions(self) -> List[int]:
+        """当前分配给本调度者的分区"""
+        data = SchedulerLease.objects.filter(name=LEADER_LEASE).values_list('data', flat=True).first() or {}
+        if data.get('partitions') != get_partition_count():
+            return []
+        return data.get('assignment', {}).get(self.worker_id, [])
+
+    def resign(self):
+        """退出集群：删除成员租约，若为领导者则让出领导者租约"""
+        SchedulerLease.objects.filter(name=self.member_lease).delete()
+        SchedulerLease.objects.filter(name=LEADER_LEASE, owner=self.worker_id).update(expires_at=None)
+        self.is_leader = False
+
+    # ---------- 调度 ----------
+    def run_queue(self, partitions: List[int], **kwargs) -> RunQueue:
+        # 巡检游标按分区集合命名：重启或换人接手同一组分区时沿用原游标
+        name = f"partitions:{get_partition_count()}:{','.join(str(partition) for partition in sorted(partitions))}"
+        return RunQueue(queryset=partition_queryset(partitions), name=name, **kwargs)
+
+    def tick(self, **kwargs) -> list:
+        """一次时钟中断：续租、（领导者）重新分配、调度本调度者的分区，返回状态发生变化的进程"""
+        self.heartbeat()
+        if self.try_lead():
+            self.rebalance()
+        partitions = self.partitions()
+        if not partitions:
+            return []
+        return self.run_queue(partitions, **kwargs).tick()
+
+    def run(self, stop=None, interval: float = None):
+        """
+        常驻运行直到 stop（threading.Event）被置位或进程中断：每次时钟中断调度本调度者的分区，
+        并对状态变化的进程批量评估规则；本轮有进程状态变化时立即进入下一轮。退出时让出租约。
+        """
+        from kernel.sys_lib import RuleEvaluator
+
+        interval = interval or getattr(settings, 'KERNEL_SCHEDULER_TICK_INTERVAL', 1.0)
+        print(f"[Scheduler] {self.worker_id} 启动")
+        try:
+            while stop is None or not stop.is_set():
+                changed = self.tick()
+                if changed:
+                    RuleEvaluator().evaluate_rules_batch(changed)
+                else:
+                    time.sleep(interval)
+        finally:
+            self.resign()
+            print(f"[Scheduler] {self.worker_id} 退出")
@@ -0,0 +1,305 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, F, Count, Sum, OuterRef, Subquery, TextField
+from django.db.models.functions import Cast, Length
+
+from typing import Optional, List
+import hashlib
+import json
+
+from kernel.models import ProcessContextSnapshot, RuleFiring
+from kernel.types import ProcessState, CanonicalJSON, CONTEXT_VALIDATOR
+
+# ================ 1. JSON Patch（RFC 6902 子集：add/remove/replace） ================
+def _escape(token) -> str:
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+def _unescape(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+def make_patch(src, dst, path: str = '') -> List[dict]:
+    """
+    生成把 src 变换为 dst 的 JSON Patch 操作列表。
+    字典按键比较；列表按下标比较，尾部追加/删除分别生成 add/remove。
+    """
+    if isinstance(src, dict) and isinstance(dst, dict):
+        ops = []
+        for key in src:
+            if key not in dst:
+                ops.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+        for key, value in dst.items():
+            if key not in src:
+                ops.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+            else:
+                ops.extend(make_patch(src[key], value, f'{path}/{_escape(key)}'))
+        return ops
+
+    if isinstance(src, list) and isinstance(dst, list):
+        ops = []
+        common = min(len(src), len(dst))
+        for i in range(common):
+            ops.extend(make_patch(src[i], dst[i], f'{path}/{i}'))
+        for i in range(common, len(dst)):
+            ops.append({'op': 'add', 'path': f'{path}/{i}', 'value': dst[i]})
+        for i in range(len(src) - 1, common - 1, -1):
+            ops.append({'op': 'remove', 'path': f'{path}/{i}'})
+        return ops
+
+    # 标量或类型不同（注意 1 == True，需同时比较类型）
+    if type(src) is not type(dst) or src != dst:
+        return [{'op': 'replace', 'path': path, 'value': dst}]
+    return []
+
+def apply_patch(doc, patch: List[dict]):
+    """
+    将 JSON Patch 原地应用到 doc 上并返回结果（根路径 replace 时返回新值）。
+    """
+    for op in patch:
+        path = op['path']
+        if path == '':
+            doc = op['value']
+            continue
+
+        tokens = [_unescape(t) for t in path.split('/')[1:]]
+        target = doc
+        for token in tokens[:-1]:
+            target = target[int(token)] if isinstance(target, list) else target[token]
+
+        last = tokens[-1]
+        if isinstance(target, list):
+            index = int(last)
+            match op['op']:
+                case 'add':
+                    target.insert(index, op['value'])
+                case 'remove':
+                    target.pop(index)
+                case 'replace':
+                    target[index] = op['value']
+        else:
+            match op['op']:
+                case 'add' | 'replace':
+                    target[last] = op['value']
+                case 'remove':
+                    target.pop(last, None)
+    return doc
+
+# ================ 2. 关键帧 + 增量的快照存储 ================
+SNAPSHOT_FULL = 'FULL'
+SNAPSHOT_DELTA = 'DELTA'
+
+def get_keyframe_interval() -> int:
+    """每隔K个版本写一次全量关键帧"""
+    return max(1, getattr(settings, 'KERNEL_SNAPSHOT_KEYFRAME_INTERVAL', 10))
+
+_CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True)
+
+def serialize_context(context_data: dict, validate: bool = False) -> tuple:
+    """
+    上下文序列化管线：一次生成规范JSON文本（键排序），并对同一份字节计算sha256。
+    返回 (canonical_text, context_hash)；文本可直接作为快照内容写库，无需再次序列化。
+    validate=True 时用预编译校验器校验结构，内部可信写入方可跳过。
+    """
+    if validate:
+        CONTEXT_VALIDATOR.validate(context_data)
+    text = _CANONICAL_ENCODER.encode(context_data)
+    return text, hashlib.sha256(text.encode()).hexdigest()
+
+def encode_snapshot(version: int, context_data: dict, base_data: Optional[dict] = None, canonical_text: str = None) -> dict:
+    """
+    决定快照的存储形式，返回可直接用于创建 ProcessContextSnapshot 的字段：
+    - 第1、K+1、2K+1...个版本，或缺少上一版本内容时写全量关键帧；
+    - 其余版本写相对上一版本的JSON Patch；差量不小于全量时仍写全量。
+    canonical_text 为 serialize_context 产出的文本，全量快照直接存储该文本。
+    """
+    if canonical_text is None:
+        canonical_text = _CANONICAL_ENCODER.encode(context_data)
+
+    interval = get_keyframe_interval()
+    if base_data is not None and (version - 1) % interval != 0:
+        patch = make_patch(base_data, context_data)
+        if len(json.dumps(patch)) < len(canonical_text):
+            return {'snapshot_type': SNAPSHOT_DELTA, 'context_data': None, 'context_delta': patch}
+    return {'snapshot_type': SNAPSHOT_FULL, 'context_data': CanonicalJSON(canonical_text), 'context_delta': None}
+
+def _replay(rows: List[ProcessContextSnapshot]) -> Optional[dict]:
+    """rows按版本升序，首行须为关键帧；依次应用增量得到最后一行的完整内容"""
+    if not rows or rows[0].snapshot_type != SNAPSHOT_FULL:
+        return None
+    data = rows[0].context_data
+    for row in rows[1:]:
+        if row.snapshot_type == SNAPSHOT_FULL:
+            data = row.context_data
+        else:
+            data = apply_patch(data, row.context_delta)
+    return data
+
+def _keyframe_chain(process_id, version: int) -> List[ProcessContextSnapshot]:
+    """查询 version 所需的关键帧及其后的全部增量（升序）"""
+    keyframe_version = ProcessContextSnapshot.objects.filter(
+        process_id=process_id, version__lte=version, snapshot_type=SNAPSHOT_FULL
+    ).order_by('-version').values('version')[:1]
+    return list(ProcessContextSnapshot.objects.filter(
+        process_id=process_id, version__lte=version, version__gte=Subquery(keyframe_version)
+    ).order_by('version'))
+
+def restore_snapshot(process, version: int = None) -> Optional[tuple]:
+    """
+    还原某进程指定版本（缺省为最新版本）的完整上下文，
+    返回 (context_data, version, context_hash)；不存在时返回 None。
+    通常一次查询即可取到关键帧及其后的增量。
+    """
+    qs = ProcessContextSnapshot.objects.filter(process=process)  # process 可为实例或主键
+    if version:
+        qs = qs.filter(version__lte=version)
+    rows = list(qs.order_by('-version')[:get_keyframe_interval()])
+    if not rows or (version and rows[0].version != version):
+        return None
+
+    latest = rows[0]
+    keyframe_index = next((i for i, row in enumerate(rows) if row.snapshot_type == SNAPSHOT_FULL), None)
+    if keyframe_index is not None:
+        chain = list(reversed(rows[:keyframe_index + 1]))
+    else:
+        # 关键帧间隔被调大过，回退为按关键帧查询
+        chain = _keyframe_chain(latest.process_id, latest.version)
+
+    data = _replay(chain)
+    if data is None:
+        return None
+    return data, latest.version, latest.context_hash
+
+def load_latest_context_data(process_ids, with_versions: bool = False):
+    """
+    批量加载多个进程最新版本的完整上下文，返回 {process_id: context_data}；
+    with_versions 为 True 时返回 ({process_id: context_data}, {process_id: 版本号})。
+    一次查询取最新快照；其中的增量快照再用一次查询取回各自的关键帧链。
+    """
+    latest_version = ProcessContextSnapshot.objects.filter(
+        process=OuterRef('process')
+    ).order_by('-version').values('version')[:1]
+    latest_rows = ProcessContextSnapshot.objects.filter(
+        process_id__in=process_ids,
+        version=Subquery(latest_version)
+    )
+
+    result, pending, versions = {}, {}, {}
+    for row in latest_rows:
+        versions[row.process_id] = row.version
+        if row.snapshot_type == SNAPSHOT_FULL:
+            result[row.process_id] = row.context_data
+        else:
+            pending[row.process_id] = row.version
+    if not pending:
+        return (result, versions) if with_versions else result
+
+    # 按关键帧间隔推算每个增量所属关键帧的最小版本范围
+    interval = get_keyframe_interval()
+    condition = Q()
+    for process_id, version in pending.items():
+        condition |= Q(process_id=process_id, version__gte=version - (version - 1) % interval, version__lte=version)
+
+    chains = {}
+    for row in ProcessContextSnapshot.objects.filter(condition).order_by('process_id', 'version'):
+        chains.setdefault(row.process_id, []).append(row)
+
+    for process_id, version in pending.items():
+        chain = chains.get(process_id, [])
+        # 取链上最后一个关键帧开始回放
+        start = max((i for i, row in enumerate(chain) if row.snapshot_type == SNAPSHOT_FULL), default=None)
+        data = _replay(chain[start:]) if start is not None else _replay(_keyframe_chain(process_id, version))
+        if data is not None:
+            result[process_id] = data
+    return (result, versions) if with_versions else result
+
+# ================ 3. 快照压缩与保留 ================
+def _stored_bytes(qs) -> int:
+    """估算一组快照行存储的JSON字节数"""
+    totals = qs.aggregate(
+        data=Sum(Length(Cast('context_data', TextField()))),
+        delta=Sum(Length(Cast('context_delta', TextField()))),
+    )
+    return (totals['data'] or 0) + (totals['delta'] or 0)
+
+def _compact_process(process_id, retain_versions: int) -> tuple:
+    """
+    只保留某进程最新的 retain_versions 个快照，返回 (删除行数, 回收字节数, 删除的命中记录数)。
+    保留的最旧版本若是增量，先将其改写为全量关键帧，保证剩余版本仍可还原。
+    """
+    kept = ProcessContextSnapshot.objects.filter(process_id=process_id).order_by('-version')
+    oldest_kept = kept[retain_versions - 1:retain_versions].first()
+    if oldest_kept is None:
+        return 0, 0, 0
+    keep_from_version = oldest_kept.version
+
+    if oldest_kept.snapshot_type != SNAPSHOT_FULL:
+        restored = restore_snapshot(process_id, keep_from_version)
+        if restored is None:
+            return 0, 0, 0
+        oldest_kept.snapshot_type = SNAPSHOT_FULL
+        oldest_kept.context_data = restored[0]
+        oldest_kept.context_delta = None
+        oldest_kept.save(update_fields=['snapshot_type', 'context_data', 'context_delta'])
+
+    stale = ProcessContextSnapshot.objects.filter(process_id=process_id, version__lt=keep_from_version)
+    reclaimed_bytes = _stored_bytes(stale)
+    deleted, _ = stale.delete()
+    # 规则命中记录只在最新版本上比对，早于保留版本的不再需要
+    firings_deleted, _ = RuleFiring.objects.filter(process_id=process_id, snapshot_version__lt=keep_from_version).delete()
+    return deleted, reclaimed_bytes, firings_deleted
+
+def compact_snapshots(retain_versions: int = None, chunk_size: int = 200) -> dict:
+    """
+    快照压缩与保留：
+    - 未终止进程保留最新 retain_versions 个版本；
+    - 已终止(TERMINATED)进程只保留最终版本（改写为全量）；
+    - 规则命中记录（RuleFiring）随之清理：早于保留版本的删除，已终止进程的全部删除；
+    - 按进程id分块处理，每块一个短事务，避免长时间持锁。
+    返回处理的进程数、删除的快照行数、回收的字节数和删除的命中记录数。
+    """
+    if retain_versions is None:
+        retain_versions = getattr(settings, 'KERNEL_SNAPSHOT_RETAIN_VERSIONS', 20)
+    retain_versions = max(1, retain_versions)
+
+    candidates = ProcessContextSnapshot.objects.values('process_id').annotate(
+        rows=Count('id'),
+        state=F('process__state'),
+    ).filter(
+        Q(rows__gt=retain_versions) | Q(rows__gt=1, state=ProcessState.TERMINATED.name)
+    ).order_by('process_id')
+
+    report = {'processes': 0, 'rows_deleted': 0, 'bytes_reclaimed': 0, 'firings_deleted': 0}
+    last_process_id = 0
+    while True:
+        chunk = list(candidates.filter(process_id__gt=last_process_id)[:chunk_size])
+        if not chunk:
+            break
+
+        with transaction.atomic():
+            for item in chunk:
+                keep = 1 if item['state'] == ProcessState.TERMINATED.name else retain_versions
+                deleted, reclaimed_bytes, firings_deleted = _compact_process(item['process_id'], keep)
+                if deleted:
+                    report['processes'] += 1
+                    report['rows_deleted'] += deleted
+                    report['bytes_reclaimed'] += reclaimed_bytes
+                report['firings_deleted'] += firings_deleted
+
+        last_process_id = chunk[-1]['process_id']
+
+    # 已终止进程不再参与批量评估，其命中记录按进程id分块删除
+    terminated = RuleFiring.objects.filter(process__state=ProcessState.TERMINATED.name)
+    while True:
+        ids = list(terminated.order_by('id').values_list('id', flat=True)[:chunk_size * 10])
+        if not ids:
+            break
+        deleted, _ = RuleFiring.objects.filter(id__in=ids).delete()
+        report['firings_deleted'] += deleted
+    return report
+
+def vacuum_snapshots():
+    """PostgreSQL下回收快照表及其索引的膨胀空间（须在事务外执行）"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'VACUUM (ANALYZE) {ProcessContextSnapshot._meta.db_table}')
+    return True
@@ -0,0 +1,223 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import json
+import threading
+import time
+import weakref
+
+# ================ 系统调用发件箱 ================
+# 规则命中产生的系统调用消息只携带标识（process_id 即进程erpsys_id、service_rule_id、snapshot_version）
+# 与显式参数，执行端按标识从数据库取进程与规则，不再随消息传递整个评估上下文。
+# 消息不在评估时立即发布：
+#   - 在进程执行上下文（ProcessExecutionContext）内产生的，待上下文快照保存后补上快照版本号再交出；
+#   - 在事务内产生的，每次发布登记一个 transaction.on_commit 回调，事务或保存点回滚则随之丢弃；
+#     最外层事务提交后各回调把消息并入一个批次，由最后一个回调发布，同一事务（含已释放的保存点）合并为一条批量任务消息；
+#   - 不在事务内的立即发布。
+# 每条任务消息的消息体字节数计入统计，见 stats()。
+#
+# 执行模式（KERNEL_SYS_CALL_MODE）：
+#   - async：全部经 Celery 异步执行；
+#   - inline：在工作进程内执行系统调用（inline_chain）期间产生的后续系统调用，直接在本进程内执行，
+#     省去每一步经消息中间件往返的延迟；链路的内联嵌套深度超过 KERNEL_SYS_CALL_INLINE_DEPTH，
+#     或自链路开始已耗时超过 KERNEL_SYS_CALL_INLINE_BUDGET 秒后，其余调用交还 Celery。
+#     标记为异步的调用（系统调用类的 run_async，或规则参数 run_async）总是交给 Celery。
+#   Web请求等工作进程之外产生的系统调用仍经 Celery 执行，不阻塞请求。
+SYS_CALL_MODE_ASYNC = 'async'
+SYS_CALL_MODE_INLINE = 'inline'
+
+def message_bytes(calls: list) -> int:
+    """任务消息体的估算字节数（JSON编码）"""
+    return len(json.dumps(calls, ensure_ascii=False, default=str).encode('utf-8'))
+
+class SysCallOutbox:
+    """按线程收集系统调用消息，提交后合并发布或内联执行"""
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.calls = 0
+        self.bytes = 0
+        self.max_bytes = 0
+        self.inline_calls = 0
+
+    def _buffers(self) -> list:
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = []
+        return buffers
+
+    # ---------- 进程执行上下文 ----------
+    def begin(self) -> list:
+        """开始收集（进入进程执行上下文时），返回本层的缓冲"""
+        buffer = []
+        self._buffers().append(buffer)
+        return buffer
+
+    def _pop(self, buffer: list):
+        buffers = self._buffers()
+        if buffers and buffers[-1] is buffer:
+            buffers.pop()
+        else:
+            self._local.buffers = [item for item in buffers if item is not buffer]
+
+    def end(self, buffer: list, process_id: str = None, snapshot_version: Optional[int] = None):
+        """结束收集（上下文快照保存后）：为本进程的消息补上快照版本号并交出"""
+        self._pop(buffer)
+        if snapshot_version:
+            for _, kwargs in buffer:
+                if kwargs.get('process_id') == process_id:
+                    kwargs.setdefault('snapshot_version', snapshot_version)
+        self.publish(buffer)
+
+    def discard(self, buffer: list):
+        """放弃收集（上下文保存失败时），本层消息不发布"""
+        self._pop(buffer)
+
+    # ---------- 发布 ----------
+    def publish(self, calls: List[list]):
+        """
+        交出系统调用消息 [sys_call_name, kwargs]：
+        在上下文内时并入外层缓冲，在事务内时并入本事务的待发布批次，否则立即发布。
+        """
+        if not calls:
+            return
+        buffers = self._buffers()
+        if buffers:
+            buffers[-1].extend(calls)
+        elif connection.in_atomic_block:
+            self._defer(list(calls))
+        else:
+            self._send(list(calls))
+
+    def _defer(self, calls: List[list]):
+        """
+        事务内：为本次发布登记一个提交回调，保存点或事务回滚时 Django 丢弃其间登记的回调，消息随之丢弃。
+        最外层事务提交后各回调依次把消息并入本线程的待发布批次，最后一个仍登记着的回调发布整个批次。
+        """
+        registered = self._registered()
+        # 随回滚丢弃的回调已被回收
+        while registered and registered[-1][1]() is None:
+            registered.pop()
+        if not registered:
+            self._local.batch = []
+        self._local.token = getattr(self._local, 'token', 0) + 1
+        callback = _CommitCallback(self, self._local.token, calls)
+        registered.append((callback.token, weakref.ref(callback)))
+        transaction.on_commit(callback)
+
+    def _registered(self) -> list:
+        registered = getattr(self._local, 'registered', None)
+        if registered is None:
+            registered = self._local.registered = []
+        return registered
+
+    def _committed(self, callback: '_CommitCallback'):
+        """提交回调：并入待发布批次；其后没有仍登记着的回调时发布"""
+        batch = getattr(self._local, 'batch', None)
+        if batch is None:
+            batch = self._local.batch = []
+        batch.extend(callback.calls)
+        registered = self._registered()
+        for token, ref in reversed(registered):
+            if token <= callback.token:
+                break
+            if ref() is not None:
+                return
+        registered.clear()
+        self._local.batch = []
+        self._send(batch)
+
+    def _send(self, calls: List[list]):
+        """交出一个批次：内联部分在本进程执行，其余发布为一条任务消息"""
+        if not calls:
+            return
+        inline, deferred = self._split_inline(calls)
+        if deferred:
+            self._publish(deferred)
+        if inline:
+            self._run_inline(inline)
+
+    def _publish(self, calls: List[list]):
+        size = message_bytes(calls)
+        with self._lock:
+            self.messages += 1
+            self.calls += len(calls)
+            self.bytes += size
+            self.max_bytes = max(self.max_bytes, size)
+        from kernel.tasks import execute_sys_call_batch_task
+        execute_sys_call_batch_task.delay(calls)
+
+    # ---------- 内联执行 ----------
+    @contextmanager
+    def inline_chain(self):
+        """在工作进程内执行系统调用；最外层开始计时，期间产生的后续调用可按内联模式执行"""
+        outermost = getattr(self._local, 'chain_started', None) is None
+        if outermost:
+            self._local.chain_started = time.monotonic()
+            self._local.depth = 0
+        try:
+            yield
+        finally:
+            if outermost:
+                self._local.chain_started = None
+
+    def _split_inline(self, calls: List[list]) -> Tuple[List[list], List[list]]:
+        """按执行模式与预算把一批调用分为 (本进程内联执行, 交给Celery)"""
+        if getattr(settings, 'KERNEL_SYS_CALL_MODE', SYS_CALL_MODE_ASYNC) != SYS_CALL_MODE_INLINE:
+            return [], calls
+        chain_started = getattr(self._local, 'chain_started', None)
+        if chain_started is None:
+            return [], calls
+        if self._local.depth >= getattr(settings, 'KERNEL_SYS_CALL_INLINE_DEPTH', 16):
+            return [], calls
+        if time.monotonic() - chain_started >= getattr(settings, 'KERNEL_SYS_CALL_INLINE_BUDGET', 0.5):
+            return [], calls
+
+        from kernel.sys_lib import CALL_REGISTRY
+        inline, deferred = [], []
+        for call in calls:
+            sys_call_name, kwargs = call
+            call_class = CALL_REGISTRY.get(sys_call_name)
+            if kwargs.get('run_async') or getattr(call_class, 'run_async', False):
+                deferred.append(call)
+            else:
+                inline.append(call)
+        return inline, deferred
+
+    def _run_inline(self, calls: List[list]):
+        from kernel.sys_lib import run_sys_calls
+        with self._lock:
+            self.inline_calls += len(calls)
+        self._local.depth += 1
+        try:
+            run_sys_calls(calls)
+        finally:
+            self._local.depth -= 1
+
+    def stats(self) -> dict:
+        return {
+            'messages': self.messages,
+            'calls': self.calls,
+            'bytes': self.bytes,
+            'bytes_per_message': round(self.bytes / self.messages) if self.messages else None,
+            'max_bytes': self.max_bytes,
+            'inline_calls': self.inline_calls,
+        }
+
+class _CommitCallback:
+    """一次发布的提交回调；只由 Django 的提交回调列表引用，随保存点回滚丢弃后即被回收"""
+    __slots__ = ('outbox', 'token', 'calls', '__weakref__')
+
+    def __init__(self, outbox: SysCallOutbox, token: int, calls: List[list]):
+        self.outbox = outbox
+        self.token = token
+        self.calls = calls
+
+    def __call__(self):
+        self.outbox._committed(self)
+
+# 进程内共享的系统调用发件箱
+sys_call_outbox = SysCallOutbox()
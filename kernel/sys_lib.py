@@ -1,23 +1,31 @@
 from django.db.models import Q, Manager
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 
 from abc import ABC, abstractmethod
+from collections import ChainMap
 from typing import Dict, Any, Optional, List
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from datetime import datetime
+from pypinyin import Style, lazy_pinyin
 import json
-import jsonschema
-import hashlib
 import re
+import uuid
 
 from kernel.models import (
     Service, ServiceRule, ProcessContextSnapshot,
-    Process, Operator, WorkOrder
+    Process, Operator, WorkOrder, RuleFiring
 )
-from kernel.types import ProcessState, CONTEXT_SCHEMA
+from kernel.types import ProcessState, CONTEXT_VALIDATOR
+from kernel.rule_cache import expression_cache, rule_dispatch_table, RuleSpec
+from kernel.metadata_cache import metadata_cache
+from kernel.context_cache import context_stack_cache, CachedContext
+from kernel.pid_allocator import reserve_pids
+from kernel.broadcast import broadcast_coalescer
+from kernel.task_stream import TaskListStream, FilteredStreamView, ROW_SERVICE
+from kernel.projections import render_work_order, resolve_path
+from kernel.snapshots import restore_snapshot, encode_snapshot, serialize_context, load_latest_context_data
+from kernel.sys_call_outbox import sys_call_outbox
 
 from applications.models import *
 
@@ -26,33 +34,56 @@ class ContextFrame:
     """
     上下文帧：表示某个Process的执行上下文，含局部变量、调用日志等。
     支持嵌套时，child frame 的 parent_frame 即为父Process对应的frame。
+    继承的变量不做复制：通过父帧链上 local_vars 的分层视图读取，写入只落在本帧（写时复制）。
     """
+    __slots__ = (
+        'process', 'parent_frame', 'status', 'local_vars', 'return_value',
+        'events_triggered_log', 'error_info', 'stack', 'base_version',
+    )
+
     def __init__(self, process: Process, parent_frame: 'ContextFrame' = None):
         self.process = process
         self.parent_frame = parent_frame  # 父帧
         self.status = 'ACTIVE'
         self.local_vars = {}  # 任务执行过程中的局部变量
         self.return_value = None  # 任务（服务函数）的返回值
-        self.inherited_context = parent_frame.get_inheritable_context() if parent_frame else {}
         self.events_triggered_log = []  # 记录任务触发的事件日志
         self.error_info = None  # 任务出错时存储信息
-
-    def get_inheritable_context(self) -> dict:
+        self.stack: Optional['ContextStack'] = None  # 所属的上下文堆栈，由ContextStack入栈时设置
+        self.base_version: Optional[int] = None  # 本帧上下文所基于的快照版本号（规则命中去重用，不持久化）
+
+    @property
+    def context(self) -> ChainMap:
+        """本帧可见的全部变量：本帧 local_vars 优先，其次逐级回溯父帧"""
+        maps = []
+        frame = self
+        while frame is not None:
+            maps.append(frame.local_vars)
+            frame = frame.parent_frame
+        return ChainMap(*maps)
+
+    @property
+    def inherited_context(self) -> ChainMap:
+        """从父帧链继承的变量视图（不含本帧）"""
+        return self.parent_frame.context if self.parent_frame else ChainMap()
+
+    def get_inheritable_context(self) -> ChainMap:
         """
-        获取可从父帧继承的上下文。默认父帧的 local_vars 为可继承部分,
+        获取可传给子帧的上下文。默认本帧及祖先帧的 local_vars 均可继承,
         这里可根据业务需要做细粒度筛选。
         """
-        if self.parent_frame:
-            return dict(self.parent_frame.local_vars)  # 浅拷贝一份即可
-        return {}
+        return self.context
 
-    def to_dict(self) -> dict:
-        """将当前帧序列化为字典，供持久化用。"""
+    def to_dict(self, parent_index: Optional[int] = None) -> dict:
+        """
+        将当前帧序列化为字典，供持久化用。
+        只保存本帧自己的变量，继承关系以父帧在栈中的下标 parent 记录。
+        """
         return {
             "process_id": self.process.erpsys_id,
             "status": self.status,
+            "parent": parent_index,
             "local_vars": self.local_vars,
-            "inherited_context": self.inherited_context,
             "return_value": self.return_value,
             "error_info": self.error_info,
             "events_triggered_log": self.events_triggered_log
@@ -62,12 +93,12 @@ class ContextFrame:
     def from_dict(cls, data: dict, process_lookup) -> 'ContextFrame':
         """
         从字典创建帧实例。process_lookup: 通过erpsys_id定位Process实例的回调。
+        旧版快照中的 inherited_context 是父帧变量的副本，可由父帧链重新得到，故忽略。
         """
         process = process_lookup(data["process_id"])
         frame = cls(process, parent_frame=None)
         frame.status = data["status"]
         frame.local_vars = data["local_vars"]
-        frame.inherited_context = data["inherited_context"]
         frame.return_value = data.get("return_value")
         frame.error_info = data.get("error_info")
         frame.events_triggered_log = data.get("events_triggered_log", [])
@@ -90,6 +121,7 @@ class ContextStack:
             parent_frame = self.frames[-1]
 
         frame = ContextFrame(process, parent_frame)
+        frame.stack = self
         self.frames.append(frame)
         return frame
 
@@ -103,8 +135,23 @@ class ContextStack:
 
     def to_dict(self) -> dict:
         """将整个上下文栈序列化为可JSON化的字典结构"""
+        index = {id(frame): i for i, frame in enumerate(self.frames)}
         return {
-            "frames": [f.to_dict() for f in self.frames],
+            "frames": [
+                f.to_dict(index.get(id(f.parent_frame)) if f.parent_frame is not None else None)
+                for f in self.frames
+            ],
+        }
+
+    def lineage_to_dict(self, frame: ContextFrame) -> dict:
+        """只序列化某帧及其祖先帧（自底向上），不含兄弟帧；用于批量创建子进程时写初始快照"""
+        lineage = []
+        while frame is not None:
+            lineage.append(frame)
+            frame = frame.parent_frame
+        lineage.reverse()
+        return {
+            "frames": [f.to_dict(i - 1 if i else None) for i, f in enumerate(lineage)],
         }
 
     @classmethod
@@ -113,22 +160,40 @@ class ContextStack:
         反序列化生成ContextStack对象。
         需要借助process_lookup(process_id)来从erpsys_id恢复真实的Process对象。
         """
-        # 先做结构校验
-        jsonschema.validate(instance=data, schema=CONTEXT_SCHEMA)
+        # 先做结构校验（使用预编译校验器）
+        CONTEXT_VALIDATOR.validate(data)
 
         stack = cls()
         # frames按顺序还原，假设下标0是底层
         for frame_data in data["frames"]:
             frame = ContextFrame.from_dict(frame_data, process_lookup)
+            frame.stack = stack
             # 先暂存
             stack.frames.append(frame)
 
-        # 第二遍遍历，重新关联parent_frame（如果同一堆栈内）
-        for i in range(len(stack.frames)):
-            if i > 0:
+        # 第二遍遍历，按 parent 下标重新关联parent_frame；旧版快照无该字段，沿用相邻帧关联
+        for i, frame_data in enumerate(data["frames"]):
+            if "parent" in frame_data:
+                parent_index = frame_data["parent"]
+                if parent_index is not None and 0 <= parent_index < i:
+                    stack.frames[i].parent_frame = stack.frames[parent_index]
+            elif i > 0:
                 stack.frames[i].parent_frame = stack.frames[i - 1]
         return stack
 
+def get_process_info(process: Process) -> dict:
+    """进程自身信息，带process_前缀，供规则表达式访问"""
+    return {
+        'process_id': process.erpsys_id,
+        'process_name': process.name,
+        'process_state': process.state,
+        'process_service': process.service.name if process.service else None,
+        'process_operator': str(process.operator) if process.operator else None,
+        'process_priority': process.priority,
+        'process_created_at': process.created_at.isoformat() if process.created_at else None,
+        'process_updated_at': process.updated_at.isoformat() if process.updated_at else None,
+    }
+
 class ProcessExecutionContext:
     """
     进程执行上下文管理器：
@@ -141,68 +206,99 @@ class ProcessExecutionContext:
         self.parent_frame = parent_frame
         self.version = version
         self.stack: ContextStack = None
-        self._previous_context_hash = self._get_last_context_hash(process) if process else None
+        # 上下文由ContextStack.to_dict()生成，结构可信；调试模式下仍做校验
+        self.validate_on_save = settings.DEBUG
+        self._base_data: Optional[dict] = None  # 最近一次恢复/保存的完整上下文，作为增量基准
+        self._previous_context_hash: Optional[str] = None
+        self._cached_size = 0  # 上下文的估算字节数，用于缓存的内存限制
+        self._sys_calls = None  # 本上下文内收集的系统调用消息
+        self._frame: Optional[ContextFrame] = None  # 本上下文压入的帧
+
+    # 并发写入者抢占同一版本号时的最大重试次数
+    max_save_retries = 5
 
     def __enter__(self) -> ContextFrame:
         # 若父帧存在，则沿用其stack，否则从DB中加载或新建stack
+        # 版本号与哈希随上下文一起向前传递，保存时无需再查询最新版本
         if self.parent_frame:
             self.stack = self.parent_frame.stack
+            self.version, self._previous_context_hash = self._get_last_snapshot_state(self.process)
         else:
-            # 先尝试从DB恢复最新上下文
-            restored = self._restore_context(self.process)
+            # 优先复用工作进程内缓存的堆栈；未命中时从DB恢复最新上下文：一次查询取得快照内容、版本号和哈希
+            restored = self._restore_cached_context(self.process) or self._restore_context(self.process)
             if restored:
                 self.stack, self.version = restored
             else:
                 self.stack = ContextStack()
                 self.version = 0
+                self._previous_context_hash = None
 
         # push新的frame
         new_frame = self.stack.push(self.process, parent_frame=self.parent_frame)
+        new_frame.base_version = self.version
+        self._frame = new_frame
         # 把Process本身信息放到local_vars，做评估时可访问
-        process_info = {
-            'process_id': self.process.erpsys_id,
-            'process_name': self.process.name,
-            'process_state': self.process.state,
-            'process_service': self.process.service.name if self.process.service else None,
-            'process_operator': str(self.process.operator) if self.process.operator else None,
-            'process_priority': self.process.priority,
-            'process_created_at': self.process.created_at.isoformat() if self.process.created_at else None,
-            'process_updated_at': self.process.updated_at.isoformat() if self.process.updated_at else None,
-        }
-        new_frame.local_vars.update(process_info)
+        new_frame.local_vars.update(get_process_info(self.process))
 
+        # 上下文内命中规则产生的系统调用，待快照保存后带上版本号再发布
+        self._sys_calls = sys_call_outbox.begin()
         return new_frame
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
         退出上下文时，将stack序列化并保存至DB(若有变化)。
         """
-        current_hash = self._calculate_context_hash(self.stack)
-        if current_hash != self._previous_context_hash:
-            self.version = self._save_context(self.stack, self.process, current_hash)
-            self._previous_context_hash = current_hash
-
-        # 在正常结束时，如需清理资源或进行收尾，可在此添加逻辑
+        # 异常信息先记入栈顶帧，随快照一起保存
         if exc_type is not None:
             current_frame = self.stack.current_frame()
             if current_frame:
                 current_frame.error_info = str(exc_val)
             print(f"ProcessExecutionContext: 捕获异常 {exc_val} (process={self.process})")
 
-    def _calculate_context_hash(self, stack: ContextStack) -> str:
+        # 单次序列化：同一份规范文本既用于哈希比较，也直接作为快照内容写库
+        try:
+            context_data = self.stack.to_dict()
+            canonical_text, current_hash = serialize_context(context_data, validate=self.validate_on_save)
+            if current_hash != self._previous_context_hash:
+                self.version = self._save_context(context_data, canonical_text, self.process, current_hash)
+                self._previous_context_hash = current_hash
+                self._cached_size = len(canonical_text)
+                # 本上下文内命中的规则按保存的版本号记录，批量评估不再重复发出
+                RuleEvaluator.record_firings(self.process, self._frame.events_triggered_log, self.version)
+        except Exception:
+            sys_call_outbox.discard(self._sys_calls)
+            raise
+
+        # 堆栈与已保存的快照一致，放回缓存供同一进程的下一次执行复用；
+        # 共享父帧堆栈的子上下文不缓存，避免同一堆栈对象挂在多个进程下
+        if not self.parent_frame and self.version and self._base_data is not None:
+            context_stack_cache.put(self.process.pk, CachedContext(
+                self.version, self._previous_context_hash, self.stack, self._base_data, self._cached_size
+            ))
+
+        # 最后交出系统调用：内联执行时后续调用可直接复用上面缓存的堆栈
+        sys_call_outbox.end(self._sys_calls, self.process.erpsys_id, self.version)
+
+    def _restore_cached_context(self, process: Process) -> Optional[tuple]:
         """
-        计算当前上下文的哈希值，用于判断上下文是否有更新。
+        从工作进程内缓存取回堆栈：只查询最新快照的版本和哈希做校验，
+        命中时跳过快照回放、JSON解码和进程查询。
         """
-        def normalize(d):
-            if isinstance(d, dict):
-                return {k: normalize(v) for k, v in d.items()}
-            elif isinstance(d, list):
-                return [normalize(x) for x in d]
-            return d
+        if not context_stack_cache.contains(process.pk):
+            return None
+        version, context_hash = self._get_last_snapshot_state(process)
+        entry = context_stack_cache.take(process.pk, version, context_hash)
+        if entry is None:
+            return None
 
-        context_dict = stack.to_dict()
-        normalized_dict = normalize(context_dict)
-        return hashlib.sha256(json.dumps(normalized_dict, sort_keys=True).encode()).hexdigest()
+        # 当前进程可能已被更新（状态等），帧改为引用调用方传入的实例
+        for frame in entry.stack.frames:
+            if frame.process.erpsys_id == process.erpsys_id:
+                frame.process = process
+        self._previous_context_hash = entry.context_hash
+        self._base_data = entry.base_data
+        self._cached_size = entry.size
+        return entry.stack, entry.version
 
     def _restore_context(self, process: Process, version: int = None) -> Optional[tuple]:
         """
@@ -210,52 +306,71 @@ class ProcessExecutionContext:
         - 如果指定version，则加载对应版本；
         - 否则加载最新版本。
         """
-        qs = ProcessContextSnapshot.objects.filter(process=process)
-        if version:
-            qs = qs.filter(version=version)
-        else:
-            qs = qs.order_by('-version')
-
-        snapshot = qs.first()
-        if not snapshot:
+        # 快照以“关键帧+增量”存储，由 restore_snapshot 透明回放为完整内容
+        restored = restore_snapshot(process, version)
+        if not restored:
             return None
 
-        data = snapshot.context_data
+        data, snapshot_version, context_hash = restored
+        self._previous_context_hash = context_hash
+        # 保留一份独立副本作为下次保存时计算增量的基准（帧会直接引用data中的字典）
+        data_text = json.dumps(data)
+        self._base_data = json.loads(data_text)
+        self._cached_size = len(data_text)
+
+        # 一次 in_bulk 解析全部帧所属的进程，当前进程无需再查
+        process_ids = {frame["process_id"] for frame in data.get("frames", [])}
+        process_ids.discard(process.erpsys_id)
+        processes = Process.objects.in_bulk(process_ids, field_name='erpsys_id') if process_ids else {}
+        processes[process.erpsys_id] = process
 
         def process_lookup(pid):
-            return Process.objects.get(erpsys_id=pid)
+            try:
+                return processes[pid]
+            except KeyError:
+                raise Process.DoesNotExist(f"上下文帧引用的进程不存在: {pid}")
 
         stack = ContextStack.from_dict(data, process_lookup)
-        return stack, snapshot.version
-
-    def _save_context(self, stack: ContextStack, process: Process, current_hash: str) -> int:
-        """
-        将当前stack序列化保存为新的ProcessContextSnapshot，并返回新的version号。
-        """
-        context_data = stack.to_dict()
-        # 验证结构
-        jsonschema.validate(context_data, CONTEXT_SCHEMA)
-
-        # 获取最新version
-        latest_version = (
-            ProcessContextSnapshot.objects.filter(process=process)
-            .order_by('-version')
-            .first()
-        )
-        new_version = latest_version.version + 1 if latest_version else 1
-
-        ProcessContextSnapshot.objects.create(
-            process=process,
-            version=new_version,
-            context_data=context_data,
-            context_hash=current_hash
-        )
+        return stack, snapshot_version
+
+    def _save_context(self, context_data: dict, canonical_text: str, process: Process, current_hash: str) -> int:
+        """
+        将已序列化的上下文保存为新的ProcessContextSnapshot，并返回新的version号。
+        每K个版本写一次全量关键帧，其余版本只写相对上一版本的增量。
+        新版本号由恢复时的版本号推出；(process, version) 唯一约束冲突说明有并发写入者
+        抢先写入，此时重新读取最新版本号并改写全量快照（增量基准已过期）后重试。
+        """
+        new_version = (self.version or 0) + 1
+        base_data = self._base_data
+        for attempt in range(self.max_save_retries):
+            try:
+                # 保存点隔离冲突，外层事务在重试后仍可继续使用
+                with transaction.atomic():
+                    ProcessContextSnapshot.objects.create(
+                        process=process,
+                        version=new_version,
+                        context_hash=current_hash,
+                        **encode_snapshot(new_version, context_data, base_data, canonical_text)
+                    )
+                break
+            except IntegrityError:
+                if attempt == self.max_save_retries - 1:
+                    raise
+                latest_version, _ = self._get_last_snapshot_state(process)
+                print(f"ProcessExecutionContext: 版本号 {new_version} 已被占用，改写为版本 {latest_version + 1} (process={process})")
+                new_version = latest_version + 1
+                base_data = None
+
+        # 由规范文本还原出独立副本作为下一次的增量基准，比深拷贝更快
+        self._base_data = json.loads(canonical_text)
         return new_version
 
-    def _get_last_context_hash(self, process: Process) -> Optional[str]:
-        """获取上次保存的快照哈希"""
-        last_snapshot = ProcessContextSnapshot.objects.filter(process=process).order_by('-version').first()
-        return last_snapshot.context_hash if last_snapshot else None
+    def _get_last_snapshot_state(self, process: Process) -> tuple:
+        """获取最新快照的 (version, context_hash)，无快照时为 (0, None)"""
+        last_snapshot = ProcessContextSnapshot.objects.filter(
+            process=process
+        ).order_by('-version').values_list('version', 'context_hash').first()
+        return last_snapshot if last_snapshot else (0, None)
 
 class ProcessCreator:
     """
@@ -274,6 +389,7 @@ class ProcessCreator:
           - state: 初始状态 (可选，默认NEW)
           - entity_content_object: 业务实体 (可选)
           - parent_frame: 父进程上下文帧 (可选)
+          - scheduled_time / time_window: 计划时间与时间窗 (可选，由定时器引擎按其触发定时事件)
         """        
         service_rule = kwargs.get('service_rule')
         if not service_rule:
@@ -301,6 +417,8 @@ class ProcessCreator:
             'state': kwargs.get('state', ProcessState.NEW.name),
             'operator': operator,
             'priority': kwargs.get('priority', 0),
+            'scheduled_time': kwargs.get('scheduled_time', None),
+            'time_window': kwargs.get('time_window', None),
             'program_entrypoint': service_program.erpsys_id
         }
         process = Process.objects.create(**process_params)
@@ -333,10 +451,118 @@ class ProcessCreator:
 
         return process
 
-    def _create_business_record(self, process):
+    def create_processes_bulk(self, common: dict, variants: List[dict]) -> List[Process]:
+        """
+        批量创建同一服务规则下的多个子进程（循环/并行服务的批量派生）。
+        common 与 create_process 的参数相同，为各子进程共享；variants 为每个子进程各自的
+        覆盖参数（如 operator、init_params）。与逐个 create_process 相比：
+          - 一次预留全部pid，bulk_create 进程、业务记录和初始快照；
+          - 父进程自指与表单信息合并为一次 bulk_update；
+          - 每组（服务程序, 服务）只取一次规则，命中的系统调用合并为一个批次发出；
+          - 不逐个触发 post_save 广播，全部子进程合并标记给推送合并器；
+            设置了计划时间的，提交后一次通知定时器引擎同步。
+        调用方应预先解析好 operator（如用 in_bulk），此处不再逐个查询。
+        """
+        if not variants:
+            return []
+
+        service_rule = common.get('service_rule')
+        if not service_rule:
+            raise ValueError("service_rule is required")
+        service_program = service_rule.target_service
+        service = common.get('service')
+        if not service:
+            raise ValueError("service is required")
+        parent_frame = common.get('parent_frame', None)
+
+        items = [dict(common, **variant) for variant in variants]
+        for item in items:
+            if not item.get('operator'):
+                raise ValueError("operator is required")
+
+        with transaction.atomic():
+            # 1. 预留pid并批量插入进程（不经过Process.save，在此复现其命名与erpsys_id规则）
+            pids = reserve_pids(len(items))
+            processes = []
+            for pid, item in zip(pids, items):
+                operator = item['operator']
+                processes.append(Process(
+                    erpsys_id=str(uuid.uuid1()),
+                    pid=pid,
+                    name=f"{service} - {operator}",
+                    parent=item.get('parent', None),
+                    previous=item.get('previous', None),
+                    service=service,
+                    entity_content_object=item.get('entity_content_object', None),
+                    state=item.get('state', ProcessState.NEW.name),
+                    operator=operator,
+                    priority=item.get('priority', 0),
+                    scheduled_time=item.get('scheduled_time', None),
+                    time_window=item.get('time_window', None),
+                    program_entrypoint=service_program.erpsys_id,
+                ))
+            processes = Process.objects.bulk_create(processes)
+
+            # 2. 批量创建业务记录，并与父进程自指一起回写进程
+            update_fields = []
+            if any(process.parent_id is None for process in processes):
+                update_fields.append('parent')
+                for process in processes:
+                    if process.parent_id is None:
+                        process.parent = process
+            if self.need_business_record:
+                records = self._create_business_records_bulk(processes)
+                if records:
+                    model_name = service.config.get('subject')['name']
+                    for process, record in zip(processes, records):
+                        process.form_content_object = record
+                        process.form_url = f"/{settings.CUSTOMER_SITE_NAME}/applications/{model_name.lower()}/{record.id}/change/"
+                    update_fields += ['form_content_type', 'form_object_id', 'form_url']
+            if update_fields:
+                Process.objects.bulk_update(processes, update_fields)
+
+            # 3. 建立子进程帧：有父帧时压入父进程的上下文栈
+            frames = []
+            for process, item in zip(processes, items):
+                stack = parent_frame.stack if parent_frame else ContextStack()
+                frame = stack.push(process, parent_frame=parent_frame)
+                frame.local_vars.update(get_process_info(process))
+                frame.local_vars.update(item.get('init_params', {}))
+                frame.local_vars.update({
+                    'service_program_id': service_program.erpsys_id,
+                    'service_rule_id': service_rule.erpsys_id
+                })
+                frames.append(frame)
+
+            # 4. 按组评估规则（命中日志写入帧内，随初始快照保存；系统调用在事务提交后发布）
+            RuleEvaluator().evaluate_frames(frames, snapshot_version=1)
+
+            # 5. 批量写入初始快照：每个子进程只保存自身及祖先帧
+            snapshots = []
+            for process, frame in zip(processes, frames):
+                canonical_text, context_hash = serialize_context(frame.stack.lineage_to_dict(frame))
+                snapshots.append(ProcessContextSnapshot(
+                    erpsys_id=str(uuid.uuid1()),
+                    process=process,
+                    version=1,
+                    context_hash=context_hash,
+                    **encode_snapshot(1, None, None, canonical_text)
+                ))
+            ProcessContextSnapshot.objects.bulk_create(snapshots)
+
+            # bulk_create 不发出 post_save，在此代为通知定时器引擎
+            if any(process.scheduled_time is not None for process in processes):
+                from kernel.timer_wheel import notify_timer_changed
+                transaction.on_commit(notify_timer_changed)
+
+        # 6. 合并标记受影响的任务列表，由推送合并器统一推送
+        broadcast_coalescer.mark_processes(processes)
+        return processes
+
+    def _build_business_record(self, process):
         """
-        根据service.config['subject']中的模型名，为此Process创建业务表单实例。
-        如果该模型定义了master字段，则自动关联 process.entity_content_object。        
+        根据service.config['subject']中的模型名，为此Process构建（未保存的）业务表单实例。
+        如果该模型定义了master字段，则自动关联 process.entity_content_object。
         """
         if not process.service or not process.service.config:
             return
@@ -355,7 +581,35 @@ class ProcessCreator:
         if hasattr(model_class, 'master'):
             params['master'] = process.entity_content_object
 
-        return model_class.objects.create(**params)
+        return model_class(**params)
+
+    def _create_business_record(self, process):
+        """为此Process创建业务表单实例"""
+        record = self._build_business_record(process)
+        if record is not None:
+            record.save()
+        return record
+
+    def _create_business_records_bulk(self, processes: List[Process]) -> list:
+        """
+        为同一服务的多个进程批量创建业务表单实例，返回与processes一一对应的记录列表。
+        bulk_create 不调用模型的 save，这里按业务模型 save 的规则补齐 erpsys_id、name 和拼音码。
+        """
+        records = [self._build_business_record(process) for process in processes]
+        if not records or records[0] is None:
+            return []
+
+        label = records[0].label
+        name = pym = None
+        if label:
+            label = re.sub(r'[^\w\u4e00-\u9fa5]', '', label)
+            pym = ''.join(lazy_pinyin(label, style=Style.FIRST_LETTER))
+            name = "_".join(lazy_pinyin(label[:10]))
+        for record in records:
+            record.erpsys_id = str(uuid.uuid1())
+            if label:
+                record.label, record.name, record.pym = label, name, pym
+        return type(records[0]).objects.bulk_create(records)
 
 class RuleEvaluator:
     """
@@ -368,40 +622,185 @@ class RuleEvaluator:
         if not service_program_id:
             return
 
-        try:
-            sp = Service.objects.get(erpsys_id=service_program_id)
-        except Service.DoesNotExist:
+        # 从分派表取出与当前Process匹配的所有规则（已预解析事件表达式和系统指令）
+        rules = rule_dispatch_table.rules_for(service_program_id, process.service_id)
+        if not rules:
             return
-
-        # 找到与当前Process匹配的所有规则
-        rules = ServiceRule.objects.filter(
-            target_service=sp,
-            service=process.service
-        )
         eval_context = self._build_evaluation_context(frame)
+        # 在本帧所基于的快照版本、进程当前状态下已命中过的规则（如已由批量评估发出）不再发出
+        fired = self._fired_keys([process.id]) if frame.base_version else set()
 
         for rule in rules:
-            if rule.event and rule.event.expression:
-                if self._evaluate_condition(rule, eval_context):
-                    # 命中后执行系统指令
-                    frame.events_triggered_log.append({
-                        'rule_id': rule.erpsys_id,
-                        'rule_label': rule.label,
-                        'event_expression': rule.event.expression,
-                        'evaluated_at': timezone.now().isoformat()
-                    })
-                    # frame.local_vars['operand_process_id'] = frame.process.parent.erpsys_id
-                    self._execute_action(rule, eval_context)
+            if (process.id, rule.erpsys_id, frame.base_version or 0, process.state) in fired:
+                continue
+            if self._evaluate_condition(rule, eval_context):
+                # 命中后执行系统指令
+                frame.events_triggered_log.append(self._log_entry(rule, process))
+                # frame.local_vars['operand_process_id'] = frame.process.parent.erpsys_id
+                self._execute_action(rule, eval_context)
+
+    def evaluate_frames(self, frames: List[ContextFrame], snapshot_version: int = None) -> int:
+        """
+        评估一组帧（如批量派生的子进程），返回发出的系统调用数量。
+        同一分派键的规则只取一次，命中记入各帧日志，系统调用合并为一个批次发出。
+        snapshot_version 为这些帧随后保存的快照版本号（如批量派生的初始快照为1），给出时按此版本记录命中。
+        """
+        groups = {}
+        for frame in frames:
+            process = frame.process
+            if not process.program_entrypoint:
+                continue
+            groups.setdefault((process.program_entrypoint, process.service_id), []).append(frame)
+
+        calls, firings = [], []
+        for (program_id, service_id), group in groups.items():
+            rules = rule_dispatch_table.rules_for(program_id, service_id)
+            if not rules:
+                continue
+            contexts = [self._build_evaluation_context(frame) for frame in group]
+            for rule in rules:
+                for frame, context in zip(group, contexts):
+                    if not self._evaluate_condition(rule, context):
+                        continue
+                    entry = self._log_entry(rule, frame.process)
+                    frame.events_triggered_log.append(entry)
+                    firings.append((frame.process, entry))
+                    if rule.sys_call:
+                        calls.append(self._sys_call_message(rule, context, snapshot_version))
+
+        if snapshot_version and firings:
+            RuleFiring.objects.bulk_create([
+                RuleFiring(process=process, rule=entry['rule_id'], snapshot_version=snapshot_version, process_state=entry['process_state'])
+                for process, entry in firings
+            ], ignore_conflicts=True)
+        sys_call_outbox.publish(calls)
+        return len(calls)
+
+    def evaluate_rules_batch(self, processes) -> int:
+        """
+        批量评估多个进程的规则，返回命中并发出的系统调用数量：
+        1. 一次查询加载所有进程的最新上下文快照；
+        2. 按分派键 (服务程序, 服务) 分组；
+        3. 每条规则的编译表达式在整组上下文上依次执行；
+        4. 命中产生的系统调用合并为一个批次发出。
+        批量评估只读取上下文，不写入新的快照版本。
+        同一规则在同一 (进程, 快照版本, 进程状态) 下只发出一次（RuleFiring，与上下文内评估共用），
+        因此定期重新评估不会重复启动后续服务；进程状态变化或上下文保存了新版本后可再次命中。
+        调用方应对processes做 select_related('service', 'operator')，以免逐行查询。
+        """
+        return self._evaluate_batch([(process, None) for process in processes], rule_dispatch_table.rules_for, once=True)
+
+    def evaluate_timers(self, timers) -> int:
+        """
+        定时器到期：timers 为 [(进程, 定时器变量)]，以定时事件规则批量评估，返回发出的系统调用数量。
+        定时器变量（timer、timer_due 等）叠加在进程上下文之上，供事件表达式访问。
+        """
+        return self._evaluate_batch(timers, rule_dispatch_table.timer_rules_for)
+
+    def _evaluate_batch(self, items, rules_for, once: bool = False) -> int:
+        groups = {}
+        for process, extra in items:
+            if not process.program_entrypoint:
+                continue
+            groups.setdefault((process.program_entrypoint, process.service_id), []).append((process, extra))
+        if not groups:
+            return 0
+
+        process_ids = list({p.id for group in groups.values() for p, _ in group})
+        contexts_data, versions = load_latest_context_data(process_ids, with_versions=True)
+
+        # 已命中过的 (进程, 规则, 快照版本号, 进程状态)
+        fired = self._fired_keys(process_ids) if once else set()
+
+        calls, firings = [], []
+        for (program_id, service_id), group in groups.items():
+            rules = rules_for(program_id, service_id)
+            if not rules:
+                continue
+
+            contexts = []
+            for process, extra in group:
+                context_data = contexts_data.get(process.id)
+                context = self._build_snapshot_evaluation_context(process, context_data)
+                contexts.append((process, context.new_child(extra) if extra else context, versions.get(process.id)))
+            for rule in rules:
+                if not rule.sys_call:
+                    continue
+                for process, context, version in contexts:
+                    if once:
+                        key = (process.id, rule.erpsys_id, version or 0, process.state)
+                        if key in fired:
+                            continue
+                    if self._evaluate_condition(rule, context):
+                        calls.append(self._sys_call_message(rule, context, version))
+                        if once:
+                            fired.add(key)
+                            firings.append(RuleFiring(
+                                process=process, rule=rule.erpsys_id, snapshot_version=version or 0, process_state=process.state
+                            ))
+
+        # 命中记录与系统调用一同提交；一个批次只发布一条异步任务消息
+        with transaction.atomic():
+            if firings:
+                RuleFiring.objects.bulk_create(firings, ignore_conflicts=True)
+            sys_call_outbox.publish(calls)
+        return len(calls)
+
+    @staticmethod
+    def _log_entry(rule: RuleSpec, process: Process) -> dict:
+        """帧 events_triggered_log 的一条命中记录"""
+        return {
+            'rule_id': rule.erpsys_id,
+            'rule_label': rule.label,
+            'event_expression': rule.expression,
+            'process_state': process.state,
+            'evaluated_at': timezone.now().isoformat()
+        }
+
+    @staticmethod
+    def _fired_keys(process_ids) -> set:
+        """进程已命中过的 (进程id, 规则, 快照版本号, 进程状态)"""
+        return set(RuleFiring.objects.filter(process_id__in=process_ids).values_list(
+            'process_id', 'rule', 'snapshot_version', 'process_state'
+        ))
+
+    @staticmethod
+    def record_firings(process: Process, entries: List[dict], snapshot_version: int):
+        """把帧日志中的命中按保存的快照版本号记为 RuleFiring，供批量评估与后续上下文去重"""
+        if not entries or not snapshot_version:
+            return
+        RuleFiring.objects.bulk_create([
+            RuleFiring(process=process, rule=entry['rule_id'], snapshot_version=snapshot_version,
+                       process_state=entry.get('process_state') or process.state)
+            for entry in entries
+        ], ignore_conflicts=True)
+
+    def _build_snapshot_evaluation_context(self, process: Process, context_data: Optional[dict]) -> Dict[str, Any]:
+        """
+        由快照栈顶帧构建评估上下文，并以进程当前状态覆盖快照中的进程信息。
+        与 ContextFrame.context 相同，沿 parent 下标逐级叠加父帧变量而不复制。
+        """
+        maps = [get_process_info(process)]
+        frames = context_data.get('frames') if context_data else None
+        if frames:
+            index = len(frames) - 1
+            while index is not None and 0 <= index < len(frames):
+                frame_data = frames[index]
+                maps.append(frame_data.get('local_vars') or {})
+                if 'parent' not in frame_data:
+                    # 旧版快照：继承的变量已复制在 inherited_context 中
+                    maps.append(frame_data.get('inherited_context') or {})
+                    break
+                parent_index = frame_data['parent']
+                index = parent_index if parent_index is not None and parent_index < index else None
+        return ChainMap(*maps)
 
     def _build_evaluation_context(self, frame: ContextFrame) -> Dict[str, Any]:
         """
-        构建规则评估上下文。默认把frame.local_vars和父帧(inherited_context)的变量进行合并。
+        构建规则评估上下文：frame.local_vars 与父帧链变量的分层视图，不做合并复制。
         """
         # 也可加入更多业务信息
-        ctx = {}
-        ctx.update(frame.inherited_context)
-        ctx.update(frame.local_vars)
-        return ctx
+        return frame.context
 
         # """构建扁平化的规则评估上下文"""
         # # 1. 直接使用frame.local_vars中已有的进程信息
@@ -432,14 +831,14 @@ class RuleEvaluator:
 
         # return context
 
-    def _evaluate_condition(self, rule: ServiceRule, context: Dict[str, Any]) -> bool:
+    def _evaluate_condition(self, rule: RuleSpec, context: Dict[str, Any]) -> bool:
         """
-        评估 rule.event.expression 中的条件表达式。
+        评估 rule.expression（即 Event.expression）中的条件表达式。
         注意：表达式中会使用 process_state, process_name 等专门加了process前缀的进程对象字段。
         """
         try:
-            expression = rule.event.expression
-            return eval(expression, {}, context)
+            # 表达式按 (event_id, 表达式哈希) 编译一次后缓存复用
+            return expression_cache.evaluate(rule.event_id, rule.expression, context)
         except Exception as e:
             print(f"[RuleEvaluator] 条件评估异常: {e}")
             return False
@@ -469,15 +868,29 @@ class RuleEvaluator:
         #     print(f"规则条件评估错误: {e}")
         #     return False
 
-    def _execute_action(self, rule: ServiceRule, context: Dict[str, Any]):
-        if not rule.system_instruction:
+    def _execute_action(self, rule: RuleSpec, context: Dict[str, Any]):
+        if not rule.sys_call:
             return
+        # 经发件箱在快照保存、事务提交后异步发布
+        sys_call_outbox.publish([self._sys_call_message(rule, context)])
 
-        sys_call_name = rule.system_instruction.sys_call
-        context['service_rule_id'] = rule.erpsys_id
-        from kernel.tasks import execute_sys_call_task
-        # 异步调用 Celery 任务
-        execute_sys_call_task.delay(sys_call_name, context)
+    def _sys_call_message(self, rule: RuleSpec, context: Dict[str, Any], snapshot_version: int = None) -> list:
+        """
+        系统调用消息 [sys_call_name, kwargs]：只含进程erpsys_id、规则id、快照版本号，
+        以及系统调用声明的参数（取自评估上下文）和规则的参数值，不复制整个评估上下文。
+        """
+        kwargs = {}
+        sys_call_class = CALL_REGISTRY.get(rule.sys_call)
+        for name in getattr(sys_call_class, 'parameters', ()):
+            if name in context:
+                kwargs[name] = context[name]
+        if rule.parameters:
+            kwargs.update(rule.parameters)
+        kwargs['process_id'] = context.get('process_id')
+        kwargs['service_rule_id'] = rule.erpsys_id
+        if snapshot_version:
+            kwargs['snapshot_version'] = snapshot_version
+        return [rule.sys_call, kwargs]
 
 # ================ 2. 系统指令实现（SysCall） ================
 class SysCallResult:
@@ -492,7 +905,12 @@ class SysCallResult:
 class SysCallInterface(ABC):
     """
     系统调用抽象接口
+    parameters：除 process_id、service_rule_id 外需要从评估上下文取值的参数名，随消息传递
+    run_async：为 True 时总是交给 Celery 异步执行，不在内联模式下于本进程执行
     """
+    parameters = ()
+    run_async = False
+
     @abstractmethod
     def execute(self, **kwargs) -> SysCallResult:
         pass
@@ -509,7 +927,7 @@ class StartService(SysCallInterface):
             if not service_rule_id:
                 return SysCallResult(False, "缺少 service_rule_id 参数")
 
-            sr = ServiceRule.objects.get(erpsys_id=service_rule_id)
+            sr = metadata_cache.get(ServiceRule, erpsys_id=service_rule_id)
             operand_service = sr.operand_service
             if not operand_service:
                 return SysCallResult(False, "当前规则未指定 operand_service")
@@ -557,7 +975,7 @@ class CallSubService(SysCallInterface):
             if not service_rule_id:
                 return SysCallResult(False, "缺少 service_rule_id 参数")
 
-            sr = ServiceRule.objects.get(erpsys_id=service_rule_id)
+            sr = metadata_cache.get(ServiceRule, erpsys_id=service_rule_id)
             operand_service = sr.operand_service
             if not operand_service:
                 return SysCallResult(False, "当前规则未指定 operand_service")
@@ -647,6 +1065,8 @@ class StartIterationService(SysCallInterface):
     启动循环服务：同一个Service重复执行N次或直到条件终止
     在业务中常用于“一系列相同流程的多次重复”场景
     """
+    parameters = ('iterations',)
+
     def execute(self, **kwargs) -> SysCallResult:
         """
         参数约定：
@@ -659,7 +1079,7 @@ class StartIterationService(SysCallInterface):
             if not service_rule_id:
                 return SysCallResult(False, "缺少 service_rule_id")
 
-            sr = ServiceRule.objects.get(erpsys_id=service_rule_id)
+            sr = metadata_cache.get(ServiceRule, erpsys_id=service_rule_id)
             operand_service = sr.operand_service
             if not operand_service:
                 return SysCallResult(False, "当前规则未指定 operand_service")
@@ -677,21 +1097,18 @@ class StartIterationService(SysCallInterface):
                 return SysCallResult(False, f"非法循环次数: {iterations}")
 
             with ProcessExecutionContext(parent_process) as parent_frame:
-                created_ids = []
-                creator = ProcessCreator()
-                for i in range(iterations):
-                    params = {
-                        "parent": parent_process,
-                        "previous": parent_process,
-                        "service_rule": sr,
-                        "service": operand_service,
-                        "operator": operator,
-                        "entity_content_object": entity,
-                        "init_params": {"iteration_index": i + 1},
-                        "parent_frame": parent_frame
-                    }
-                    child_proc = creator.create_process(params)
-                    created_ids.append(child_proc.erpsys_id)
+                common = {
+                    "parent": parent_process,
+                    "previous": parent_process,
+                    "service_rule": sr,
+                    "service": operand_service,
+                    "operator": operator,
+                    "entity_content_object": entity,
+                    "parent_frame": parent_frame
+                }
+                variants = [{"init_params": {"iteration_index": i + 1}} for i in range(iterations)]
+                children = ProcessCreator().create_processes_bulk(common, variants)
+                created_ids = [child.erpsys_id for child in children]
 
             return SysCallResult(
                 True,
@@ -706,6 +1123,8 @@ class StartParallelService(SysCallInterface):
     启动并行服务：同一个Service并发生成多个子进程，如会诊调度给多位医生。
     业务侧可等到全部完成后再做后续处理。
     """
+    parameters = ('threads', 'operators')
+
     def execute(self, **kwargs) -> SysCallResult:
         """
         参数约定：
@@ -718,7 +1137,7 @@ class StartParallelService(SysCallInterface):
             if not service_rule_id:
                 return SysCallResult(False, "缺少 service_rule_id")
 
-            sr = ServiceRule.objects.get(erpsys_id=service_rule_id)
+            sr = metadata_cache.get(ServiceRule, erpsys_id=service_rule_id)
             operand_service = sr.operand_service
             if not operand_service:
                 return SysCallResult(False, "当前规则未指定 operand_service")
@@ -740,23 +1159,27 @@ class StartParallelService(SysCallInterface):
             if not operators_list:
                 operators_list = [parent_process.operator.erpsys_id] * threads
 
+            # 一次查询取回全部操作员
+            operators = Operator.objects.select_related('user').in_bulk(set(operators_list), field_name='erpsys_id')
+            missing = set(operators_list) - set(operators)
+            if missing:
+                return SysCallResult(False, f"操作员不存在: {', '.join(sorted(missing))}")
+
             with ProcessExecutionContext(parent_process) as parent_frame:
-                child_ids = []
-                creator = ProcessCreator()
-                for index, op_id in enumerate(operators_list, start=1):
-                    op = Operator.objects.get(erpsys_id=op_id)
-                    params = {
-                        "parent": parent_process,
-                        "previous": parent_process,
-                        "service_rule": sr,
-                        "service": operand_service,
-                        "operator": op,
-                        "entity_content_object": entity,
-                        "init_params": {"parallel_index": index},
-                        "parent_frame": parent_frame
-                    }
-                    proc = creator.create_process(params)
-                    child_ids.append(proc.erpsys_id)
+                common = {
+                    "parent": parent_process,
+                    "previous": parent_process,
+                    "service_rule": sr,
+                    "service": operand_service,
+                    "entity_content_object": entity,
+                    "parent_frame": parent_frame
+                }
+                variants = [
+                    {"operator": operators[op_id], "init_params": {"parallel_index": index}}
+                    for index, op_id in enumerate(operators_list, start=1)
+                ]
+                children = ProcessCreator().create_processes_bulk(common, variants)
+                child_ids = [child.erpsys_id for child in children]
 
             return SysCallResult(
                 True,
@@ -788,40 +1211,75 @@ def sys_call(sys_call_name: str, **kwargs) -> SysCallResult:
     except Exception as e:
         return SysCallResult(False, f"Exception in sys_call '{sys_call_name}': {e}")
 
-# 更新操作员任务列表
-def update_task_list(operator, is_public):
-    # 当前操作员有权限操作的服务列表
-    allowed_services = operator.allowed_services()
+def run_sys_calls(calls: list) -> list:
+    """依次执行一批系统调用 [sys_call_name, kwargs]，期间的进程变更合并为一次任务列表推送"""
+    results = []
+    with broadcast_coalescer.suppressed():
+        for sys_call_name, kwargs in calls:
+            result = sys_call(sys_call_name, **kwargs)
+            results.append({
+                "success": result.success,
+                "message": result.message,
+                "data": result.data
+            })
+    return results
+
+# 公共任务流：全部操作员共享同一份列表，订阅方按各自可办服务过滤后下发
+PUBLIC_TASK_GROUP = 'public_task_list'
+PUBLIC_TASK_MESSAGE = 'send_public_task_list'
 
+def public_task_stream() -> TaskListStream:
+    return TaskListStream(PUBLIC_TASK_GROUP, PUBLIC_TASK_MESSAGE, keep_snapshot=True)
+
+def update_public_task_list() -> dict:
+    """
+    发布共享的公共任务列表：每次变更只生成一次（不按操作员权限过滤），行内附带服务id，
+    向组内推送增量并缓存全量；返回未过滤的全量消息。
+    """
     processes = Process.objects.filter(
         state=ProcessState.NEW.name,  # 状态: '新建'
-        service__in=allowed_services, # 服务作业进程的服务在allowed_services中
+        operator__isnull=True,
     )
-    processes = processes.filter(operator__isnull=True) if is_public else processes.filter(operator=operator)
+    work_order = metadata_cache.config(WorkOrder, '公共任务')
+    task_list, work_order_head_filtered = get_represent_list(processes, work_order, key='erpsys_id', extras={ROW_SERVICE: 'service_id'})
+    task_list = [{'title': '公共任务', 'task_list': task_list, 'task_head': work_order_head_filtered}]
+    return public_task_stream().publish(task_list)
 
-    label = '公共任务' if is_public else '私有任务'
-    work_order = WorkOrder.objects.get(label=label).config
+def filter_public_task_list(snapshot: dict, operator) -> dict:
+    """按操作员可办服务过滤公共任务全量"""
+    allowed_service_ids = operator.allowed_service_ids()
+    return FilteredStreamView(lambda row: row.get(ROW_SERVICE) in allowed_service_ids).apply(snapshot)
 
-    task_list, work_order_head_filtered = get_represent_list(processes, work_order)
+# 更新操作员任务列表
+def update_task_list(operator, is_public) -> dict:
+    """
+    发布操作员的私有/公共任务列表：向组内推送相对上次的增量，返回当前全量消息（供新连接下发）
+    公共任务为共享列表，返回按该操作员可办服务过滤后的全量。
+    """
+    if is_public:
+        return filter_public_task_list(update_public_task_list(), operator)
+
+    # 当前操作员有权限操作的服务id集合
+    allowed_service_ids = operator.allowed_service_ids()
+
+    processes = Process.objects.filter(
+        state=ProcessState.NEW.name,  # 状态: '新建'
+        service_id__in=allowed_service_ids, # 服务作业进程的服务在可办服务中
+        operator=operator,
+    )
+    work_order = metadata_cache.config(WorkOrder, '私有任务')
+
+    task_list, work_order_head_filtered = get_represent_list(processes, work_order, key='erpsys_id')
 
     # 构造channel_message
-    if is_public:
-        channel_group_name = 'public_task_list'
-        channel_message_type = 'send_public_task_list'
-        task_list = [{'title': '公共任务', 'task_list': task_list, 'task_head': work_order_head_filtered}]
-    else:
-        channel_group_name = operator.erpsys_id
-        channel_message_type = 'send_private_task_list'
-        # 根据schedule_time是否为当天分组：今日安排/本周安排
-        task_list = [{'title': '今日安排', 'task_list': task_list, 'task_head': work_order_head_filtered}]
+    # 根据schedule_time是否为当天分组：今日安排/本周安排
+    task_list = [{'title': '今日安排', 'task_list': task_list, 'task_head': work_order_head_filtered}]
 
-    message = {'type': channel_message_type, 'data': task_list}
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(channel_group_name, message)
+    return TaskListStream(operator.erpsys_id, 'send_private_task_list').publish(task_list)
 
-def update_entity_task_group_list(entity):
+def update_entity_task_group_list(entity) -> dict:
     """
-    更新实体作业任务分组列表
+    更新实体作业任务分组列表：向组内推送增量，返回当前全量消息
     """
     # 任务分组条件
     group_condition = [
@@ -831,12 +1289,12 @@ def update_entity_task_group_list(entity):
         {"group_title": "已完成", "state_set": {ProcessState.TERMINATED.name}}        
     ]
 
-    work_order = WorkOrder.objects.get(label='实体作业任务清单').config
+    work_order = metadata_cache.config(WorkOrder, '实体作业任务清单')
 
     task_list = []
     for condition in group_condition:
         processes = entity.get_task_list(condition['state_set'])
-        group_tasks, work_order_head_filtered = get_represent_list(processes, work_order)
+        group_tasks, work_order_head_filtered = get_represent_list(processes, work_order, key='erpsys_id')
 
         task_list.append({
             'group_title': condition['group_title'],
@@ -845,16 +1303,7 @@ def update_entity_task_group_list(entity):
         })
 
     # 发送channel_message给操作员
-    channel_message_type = 'send_task_list'
-    message = {
-        'type': channel_message_type,
-        'data': {
-            'task_list': task_list,
-        }
-    }
-    channel_group_name = entity.erpsys_id
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(channel_group_name, message)
+    return TaskListStream(entity.erpsys_id, 'send_task_list').publish(task_list)
 
 # 搜索基本信息列表
 def search_profiles(search_content, search_text, operator):
@@ -866,7 +1315,7 @@ def search_profiles(search_content, search_text, operator):
                 Q(name__icontains=search_text) |
                 Q(pym__icontains=search_text)
             ) if search_text else operators
-            work_order = WorkOrder.objects.get(label='搜索个人表头').config
+            work_order = metadata_cache.config(WorkOrder, '搜索个人表头')
         case 'service':
             allowed_services = operator.allowed_services()
             services = Service.objects.all()
@@ -875,7 +1324,7 @@ def search_profiles(search_content, search_text, operator):
                 Q(name__icontains=search_text) |
                 Q(pym__icontains=search_text)
             ) if search_text else services
-            work_order = WorkOrder.objects.get(label='搜索服务表头').config
+            work_order = metadata_cache.config(WorkOrder, '搜索服务表头')
 
     # 构造work-order represent list
     return get_represent_list(instances, work_order)
@@ -887,7 +1336,7 @@ def get_entity_profile(entity):
     """
     # 如果entity是Operator实例
     if isinstance(entity, Operator):
-        work_order = WorkOrder.objects.get(label='客户Profile表头').config
+        work_order = metadata_cache.config(WorkOrder, '客户Profile表头')
     else:
         raise ValueError("实体类型不支持")
 
@@ -895,55 +1344,25 @@ def get_entity_profile(entity):
     return {'profile_content': work_order_content[0], 'profile_header': work_order_head_filtered}
 
 # 根据工单配置返回内容列表和表头
-def get_represent_list(instances, work_order):
-    represent_list = []
-    for instance in instances:
-        work_order_content = {}
-        for work_order_field in work_order:
-            work_order_content[work_order_field['name']] = get_nested_field_value(instance, work_order_field['value_expression'])
-
-        represent_list.append(work_order_content)
-
-    # 剔除 work_order 列表中每个字典元素中的value_expression键值对，以免传到前端
-    work_order_head_filtered = [{k: v for k, v in item.items() if k != 'value_expression'} for item in work_order]
-
-    return represent_list, work_order_head_filtered
+def get_represent_list(instances, work_order, key: str = None, extras: dict = None):
+    """
+    按工单配置生成内容列表和表头（表头已剔除value_expression，以免传到前端）。
+    工单配置编译为投影计划后缓存复用：遍历前按计划一次性 select_related/prefetch_related，
+    纯数据库列直接用 values() 取数，渲染行数不再影响查询次数。
+    key 给出时，以实例的该属性作为每行的行键；extras 附加工单以外的隐藏字段。
+    """
+    return render_work_order(instances, work_order, key=key, extras=extras)
 
 def get_nested_field_value(instance, value_expression):
     """
-    递归获取由 '.' 分隔的字段路径中的最末端字段值。
+    获取由 '.' 分隔的字段路径中的最末端字段值。
+    反向关联（如Profile）取第一个对象；字段链中途为空时返回空值。
     
     :param instance: Django 模型实例
     :param value_expression: 字符串，django Field字段名的级联组合，使用 '.' 作为分隔符
     :return: 最末端字段的值
     """
-    # 分离当前字段和后续字段
-    fields = value_expression.split('.', 1)
-    current_field = fields[0]
-    
-    # 获取当前字段的值:
-    # 1. 处理Profile反向关联字段, 取第一个对象
-    # 2. 如果字段链中还有"."，且当前字段是外键对象，则递归处理
-    value = getattr(instance, current_field, None)
-    if isinstance(value, models.Manager):
-        value = value.all().first()
-    if len(fields) > 1 and value is not None:
-        return get_nested_field_value(value, fields[1])
-    
-    return format_field_value(value)
-
-def format_field_value(value):
-    """
-    格式化字段值，确保返回可序列化的类型
-    """
-    if isinstance(value, (str, int, float, bool)):
-        return value
-    elif isinstance(value, datetime):
-        return value.strftime('%y-%m-%d %H:%M')
-    elif value is None:
-        return ''
-    else:
-        return str(value)
+    return resolve_path(instance, tuple(value_expression.split('.')))
 
 def get_program_entrypoints(model_str):
     '''
@@ -955,11 +1374,16 @@ def get_program_entrypoints(model_str):
         {'title': '入口点名称', 'service_rule_id': '入口点erpsys_id'}
     ]
     '''
-    # 使用model_str过滤entity_content_type
-    programs = Service.objects.filter(manual_start=True, serve_content_type__model=model_str)
+    # 使用model_str过滤entity_content_type（服务与规则均取自元数据缓存）
+    programs = [
+        service for service in metadata_cache.all(Service)
+        if service.manual_start and service.serve_content_type_id
+        and ContentType.objects.get_for_id(service.serve_content_type_id).model == model_str
+    ]
+    rules = metadata_cache.all(ServiceRule)
     program_entrypoints = []
     for program in programs:
-        first_rule = program.servicerule_set.all().order_by('order').first()
+        first_rule = min((rule for rule in rules if rule.service_id == program.pk), key=lambda rule: rule.order, default=None)
         if first_rule:
             program_entrypoints.append({'title': first_rule.service.label, 'service_rule_id': first_rule.erpsys_id})
     print("program_entrypoints: ", program_entrypoints, "model_str: ", model_str, "programs: ", programs, "first_rule:")
@@ -0,0 +1,266 @@
+from django.core.cache import cache
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from contextlib import contextmanager
+from typing import List, Optional
+import hashlib
+import json
+import threading
+import uuid
+
+# 任务列表流：每个推送组（操作员、公共、实体）维护一个序号递增的任务列表状态。
+# 消息格式（均经由原有的 group_send 消息类型发送）：
+#   全量 {"type": "snapshot", "epoch": e, "seq": n, "lists": [...]}
+#   增量 {"type": "delta", "epoch": e, "seq": n, "base": n-1, "lists": [{"list": 下标, "upsert": [{"index": i, "row": {...}}],
+#         "remove": [键...], "order": [键...](仅相对顺序变化时)}]}
+# 每行以 "_key"（进程erpsys_id）为键。客户端只在连接时或序号不连续（失步）时取得全量。
+# 每个流保留最近的增量环形缓冲：客户端断线重连时携带续传令牌 "epoch:seq"，
+# 只补发错过的增量；缓冲已溢出、期间发生过全量或状态已重置（epoch不同）时才回退为全量。
+# 同一个流可能由多个进程同时发布（推送合并器、Celery、调度者、定时器引擎、连接时的全量下发），
+# 读取状态、比较、写回与发送在流锁内串行执行，保证序号不重复、增量按序号顺序发出。
+ROW_KEY = '_key'
+ROW_SERVICE = '_service'  # 公共任务行的服务id，供订阅方按可办服务过滤
+STATE_KEY_PREFIX = 'kernel:task_stream:'
+
+# 不支持锁的缓存后端（如开发环境的本地内存缓存）退回为进程内的锁
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+@contextmanager
+def stream_lock(key: str):
+    """
+    流的发布锁：缓存后端提供 lock()（django-redis）时使用跨进程的分布式锁，
+    否则使用进程内的锁。锁的有效期与等待上限为 KERNEL_TASK_STREAM_LOCK_TIMEOUT 秒。
+    """
+    timeout = getattr(settings, 'KERNEL_TASK_STREAM_LOCK_TIMEOUT', 5)
+    if hasattr(cache, 'lock'):
+        with cache.lock(key, timeout=timeout, blocking_timeout=timeout):
+            yield
+        return
+    with _local_locks_guard:
+        lock = _local_locks.setdefault(key, threading.Lock())
+    if not lock.acquire(timeout=timeout):
+        raise TimeoutError(f'任务列表流锁等待超时: {key}')
+    try:
+        yield
+    finally:
+        lock.release()
+
+def get_buffer_size() -> int:
+    """每个流保留的最近增量条数"""
+    return max(0, getattr(settings, 'KERNEL_TASK_STREAM_BUFFER', 64))
+
+def parse_resume_token(token) -> Optional[tuple]:
+    """解析续传令牌 "epoch:seq"，不合法时返回 None"""
+    try:
+        epoch, seq = str(token).rsplit(':', 1)
+        return epoch, int(seq)
+    except (TypeError, ValueError):
+        return None
+
+def _digest(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _list_signature(task_list: dict) -> str:
+    """列表结构（标题、表头等除行以外的部分）的签名，结构变化时改发全量"""
+    return _digest({k: v for k, v in task_list.items() if k != 'task_list'})
+
+def _build_state(lists: List[dict], seq: int, epoch: str = None, recent: List[dict] = None) -> dict:
+    return {
+        'epoch': epoch,
+        'seq': seq,
+        'recent': recent or [],  # 最近的增量消息，按序号升序
+        'signatures': [_list_signature(task_list) for task_list in lists],
+        'lists': [
+            {
+                'keys': [row[ROW_KEY] for row in task_list['task_list']],
+                'digests': {row[ROW_KEY]: _digest(row) for row in task_list['task_list']},
+            }
+            for task_list in lists
+        ],
+    }
+
+def _diff_list(index: int, old: dict, new: dict, rows: List[dict]) -> Optional[dict]:
+    """比较某个列表前后两次的行，返回增量；无变化时返回 None"""
+    old_keys, old_digests = old['keys'], old['digests']
+    new_keys, new_digests = new['keys'], new['digests']
+    remove = [key for key in old_keys if key not in new_digests]
+    upsert = [
+        {'index': i, 'row': rows[i]}
+        for i, key in enumerate(new_keys)
+        if old_digests.get(key) != new_digests[key]
+    ]
+    change = {'list': index, 'upsert': upsert, 'remove': remove}
+    # 客户端按序删除、原位更新、按下标插入；仅当保留行的相对顺序变化时才需要下发完整顺序
+    if [key for key in old_keys if key in new_digests] != [key for key in new_keys if key in old_digests]:
+        change['order'] = new_keys
+    if not (upsert or remove or 'order' in change):
+        return None
+    return change
+
+class TaskListStream:
+    """
+    某个推送组的任务列表流。状态保存在Django缓存中，多个Web/Worker进程共享同一序号。
+    并发发布时可能出现基于旧状态的增量，客户端按 base 序号检测失步后请求全量。
+    状态与增量环形缓冲同存于缓存，任何Daphne/Worker进程都可为重连的客户端补发增量。
+    """
+    def __init__(self, group_name: str, message_type: str, keep_snapshot: bool = False):
+        self.group_name = group_name
+        self.message_type = message_type
+        self.state_key = f'{STATE_KEY_PREFIX}{group_name}'
+        # 共享流（如公共任务）同时缓存全量，新连接与失步重取直接读缓存，无需重算
+        self.keep_snapshot = keep_snapshot
+        self.snapshot_key = f'{self.state_key}:snapshot'
+        self.lock_key = f'{self.state_key}:lock'
+
+    def publish(self, lists: List[dict]) -> dict:
+        """
+        发布最新任务列表：与上次状态比较后向组内发送增量（结构变化时发送全量，无变化不发送）。
+        返回当前全量消息，供新连接直接下发。
+        """
+        with stream_lock(self.lock_key):
+            return self._publish(lists)
+
+    def _publish(self, lists: List[dict]) -> dict:
+        old_state = cache.get(self.state_key)
+        if old_state is None or 'epoch' not in old_state:
+            old_state = None
+        seq = old_state['seq'] if old_state else 0
+        epoch = old_state['epoch'] if old_state else uuid.uuid4().hex[:12]
+
+        message = None
+        recent = []
+        if old_state is None or old_state['signatures'] != [_list_signature(l) for l in lists]:
+            # 发生全量后，之前的增量无法再衔接，缓冲清空
+            seq += 1
+            message = {'type': 'snapshot', 'epoch': epoch, 'seq': seq, 'lists': lists}
+        else:
+            probe = _build_state(lists, seq)
+            changes = [
+                change for change in (
+                    _diff_list(i, old, new, task_list['task_list'])
+                    for i, (old, new, task_list) in enumerate(zip(old_state['lists'], probe['lists'], lists))
+                ) if change
+            ]
+            recent = old_state['recent']
+            if changes:
+                seq += 1
+                message = {'type': 'delta', 'epoch': epoch, 'seq': seq, 'base': seq - 1, 'lists': changes}
+                recent = (recent + [message])[-get_buffer_size():] if get_buffer_size() else []
+
+        snapshot = {'type': 'snapshot', 'epoch': epoch, 'seq': seq, 'lists': lists}
+        if message is not None:
+            cache.set(self.state_key, _build_state(lists, seq, epoch, recent), timeout=None)
+        if self.keep_snapshot:
+            cache.set(self.snapshot_key, snapshot, timeout=None)
+        if message is not None:
+            channel_layer = get_channel_layer()
+            async_to_sync(channel_layer.group_send)(self.group_name, {'type': self.message_type, 'data': message})
+
+        return snapshot
+
+    def snapshot(self) -> Optional[dict]:
+        """读取缓存的全量（仅 keep_snapshot 的流），不存在或与流状态不一致时返回 None"""
+        snapshot = cache.get(self.snapshot_key)
+        state = cache.get(self.state_key)
+        if snapshot is None or state is None or (state.get('epoch'), state.get('seq')) != (snapshot['epoch'], snapshot['seq']):
+            return None
+        return snapshot
+
+    def missed_since(self, token) -> Optional[List[dict]]:
+        """
+        按续传令牌取客户端错过的增量（可能为空列表）；无法衔接时返回 None，调用方应改发全量。
+        """
+        parsed = parse_resume_token(token)
+        state = cache.get(self.state_key)
+        if parsed is None or state is None or state.get('epoch') != parsed[0]:
+            return None
+        epoch, seq = parsed
+        if seq > state['seq']:
+            return None
+        if seq == state['seq']:
+            return []
+        missed = [message for message in state['recent'] if message['seq'] > seq]
+        # 缓冲已溢出或中间发生过全量：错过的增量不完整
+        if not missed or missed[0]['base'] != seq:
+            return None
+        return missed
+
+class FilteredStreamView:
+    """
+    共享流的订阅方视图：同一份全量/增量按订阅方的行过滤条件改写后再下发。
+    视图保存完整列表的行键顺序与各行可见性，将增量中的下标换算为过滤后的下标；
+    过滤后无变化的增量仍以空列表下发，保持客户端序号连续。
+    视图与流失步（base 不衔接）时下发空增量，客户端据 base 检测失步后请求全量。
+    """
+    def __init__(self, visible):
+        self.visible = visible  # 行 -> 是否可见
+        self.epoch = None
+        self.seq = None
+        self._keys = []         # 各列表完整的行键顺序
+        self._shown = []        # 各列表 行键 -> 是否可见
+
+    def apply(self, message: dict) -> Optional[dict]:
+        """改写一条全量或增量消息；已应用过的旧消息返回 None，不必下发"""
+        if message['type'] == 'snapshot':
+            return self._apply_snapshot(message)
+        if self.seq is not None and message['epoch'] == self.epoch and message['seq'] <= self.seq:
+            return None
+        if self.seq is None or message['epoch'] != self.epoch or message['base'] != self.seq:
+            self.seq = None
+            return dict(message, lists=[])
+        changes = [change for change in (self._apply_change(change) for change in message['lists']) if change]
+        self.seq = message['seq']
+        return dict(message, lists=changes)
+
+    def _apply_snapshot(self, message: dict) -> dict:
+        self.epoch, self.seq = message['epoch'], message['seq']
+        self._keys, self._shown, lists = [], [], []
+        for task_list in message['lists']:
+            rows = task_list['task_list']
+            self._keys.append([row[ROW_KEY] for row in rows])
+            self._shown.append({row[ROW_KEY]: bool(self.visible(row)) for row in rows})
+            lists.append(dict(task_list, task_list=[row for row in rows if self._shown[-1][row[ROW_KEY]]]))
+        return dict(message, lists=lists)
+
+    def _apply_change(self, change: dict) -> Optional[dict]:
+        index = change['list']
+        if index >= len(self._keys):
+            return None
+        keys, shown = self._keys[index], self._shown[index]
+        old_visible = [key for key in keys if shown[key]]
+
+        # 与客户端相同的应用顺序：删除、原位更新、按下标插入、整体排序
+        removed = set(change['remove'])
+        keys = [key for key in keys if key not in removed]
+        for key in removed:
+            shown.pop(key, None)
+        present = set(keys)
+        for item in change['upsert']:
+            key = item['row'][ROW_KEY]
+            if key not in present:
+                keys.insert(item['index'], key)
+                present.add(key)
+            shown[key] = bool(self.visible(item['row']))
+        if 'order' in change:
+            keys = list(change['order'])
+        self._keys[index] = keys
+
+        new_visible = [key for key in keys if shown[key]]
+        new_positions = {key: i for i, key in enumerate(new_visible)}
+        old_set = set(old_visible)
+        filtered = {
+            'list': index,
+            'upsert': [
+                {'index': new_positions[item['row'][ROW_KEY]], 'row': item['row']}
+                for item in change['upsert'] if item['row'][ROW_KEY] in new_positions
+            ],
+            'remove': [key for key in old_visible if key not in new_positions],
+        }
+        if [key for key in old_visible if key in new_positions] != [key for key in new_visible if key in old_set]:
+            filtered['order'] = new_visible
+        if not (filtered['upsert'] or filtered['remove'] or 'order' in filtered):
+            return None
+        return filtered
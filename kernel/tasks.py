@@ -1,9 +1,25 @@
 from celery import shared_task
-from django_celery_beat.models import PeriodicTask
+from celery.signals import worker_process_init
+from django.db import close_old_connections
 
 import subprocess
 
-from kernel.sys_lib import sys_call
+from kernel.sys_lib import sys_call, run_sys_calls
+from kernel.sys_call_outbox import sys_call_outbox
+from kernel.metadata_cache import metadata_cache
+from kernel.rule_cache import rule_dispatch_table
+
+@worker_process_init.connect
+def preload_kernel_metadata(**kwargs):
+    """Worker子进程启动时预加载定义元数据与规则分派表，首个任务无需承担冷启动查询"""
+    try:
+        metadata_cache.preload()
+        rule_dispatch_table.rebuild()
+        print(f"[Worker] 已预加载内核定义元数据: {metadata_cache.stats()}")
+    except Exception as e:
+        print(f"[Worker] 预加载内核定义元数据失败: {e}")
+    finally:
+        close_old_connections()
 
 @shared_task
 def task_backup_data():
@@ -14,7 +30,8 @@ def execute_sys_call_task(sys_call_name: str, context: dict) -> dict:
     """仅作为异步执行入口"""
     print('执行异步任务：execute_sys_call_task')
     # 这里简化处理，直接将 context 传给 sys_call
-    result = sys_call(sys_call_name, **context)  # 调用同步实现
+    with sys_call_outbox.inline_chain():
+        result = sys_call(sys_call_name, **context)  # 调用同步实现
     print('异步任务执行结果：', result)
     return {
         "success": result.success,
@@ -23,14 +40,33 @@ def execute_sys_call_task(sys_call_name: str, context: dict) -> dict:
     }
 
 @shared_task
-def timer_interrupt(task_name):
-    # get timer.pid
-    # get pid.stack
-    # get pid.stack.pc
-    # execute pid.stack.pc
-    try:
-        task = PeriodicTask.objects.get(name=task_name)
-        print("Task arguments:", task.args)
-    except PeriodicTask.DoesNotExist:
-        print("Task not found")    
-    return task
+def execute_sys_call_batch_task(calls: list) -> list:
+    """批量执行系统调用，calls为 [sys_call_name, kwargs] 列表（消息格式见 kernel.sys_call_outbox）"""
+    # 内联模式下，执行中产生的后续系统调用在预算内直接于本进程执行
+    with sys_call_outbox.inline_chain():
+        results = run_sys_calls(calls)
+    print(f'批量异步任务执行完成：{len(calls)} 个系统调用')
+    return results
+
+@shared_task
+def evaluate_open_processes_task(chunk_size: int = 1000) -> int:
+    """分批重新评估所有未终止进程的规则"""
+    from kernel.scheduler import reevaluate_open_processes
+    return reevaluate_open_processes(chunk_size)
+
+@shared_task
+def compact_snapshots_task(retain_versions: int = None, chunk_size: int = 200) -> dict:
+    """定期压缩进程上下文快照"""
+    from kernel.snapshots import compact_snapshots
+    report = compact_snapshots(retain_versions, chunk_size)
+    print('快照压缩完成：', report)
+    return report
+
+@shared_task
+def timer_interrupt(task_name=None):
+    """
+    已废弃：定时器不再对应 Celery beat 的 PeriodicTask，由常驻定时器引擎（manage.py run_timer_wheel）触发。
+    保留任务名，使尚未清理的旧 PeriodicTask 行触发时不报未注册任务。
+    """
+    print(f"[timer_interrupt] 已废弃，忽略 {task_name}；定时器由 run_timer_wheel 触发")
+    return None
@@ -0,0 +1,18 @@
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+# 测试不依赖 Redis：缓存与通道层改用进程内后端
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+@pytest.fixture(scope='session', autouse=True)
+def in_memory_backends():
+    with override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS):
+        yield
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """共享缓存中的代数、水位线与流状态不跨用例残留"""
+    cache.clear()
+    yield
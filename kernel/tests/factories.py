@@ -0,0 +1,23 @@
+from kernel.models import Service, Event, Instruction, ServiceRule, Operator, Process
+
+# 测试用的内核定义与进程
+
+def make_service(label: str, **kwargs) -> Service:
+    return Service.objects.create(label=label, **kwargs)
+
+def make_operator(label: str = '张三', **kwargs) -> Operator:
+    return Operator.objects.create(label=label, **kwargs)
+
+def make_rule(program: Service, service: Service, expression: str, sys_call: str = 'start_service',
+              order: int = 0, is_timer: bool = False, label: str = '规则', **kwargs) -> ServiceRule:
+    """program 下 service 的一条规则：事件表达式命中后执行系统调用 sys_call"""
+    event = Event.objects.create(label=f'{label}事件', expression=expression, is_timer=is_timer)
+    instruction = Instruction.objects.create(label=f'{label}指令', sys_call=sys_call) if sys_call else None
+    return ServiceRule.objects.create(
+        label=label, target_service=program, service=service, event=event,
+        system_instruction=instruction, order=order, **kwargs
+    )
+
+def make_process(**kwargs) -> Process:
+    kwargs.setdefault('name', '测试进程')
+    return Process.objects.create(**kwargs)
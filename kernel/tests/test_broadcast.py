@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from kernel.broadcast import BroadcastCoalescer
+
+from types import SimpleNamespace
+import time
+
+def operator(pk: int, is_staff: bool = True):
+    return SimpleNamespace(pk=pk, user=SimpleNamespace(is_staff=is_staff))
+
+def process(operator, entity=None):
+    return SimpleNamespace(operator=operator, entity_content_object=entity)
+
+class BroadcastCoalescerTests(TestCase):
+    def setUp(self):
+        self.pushed = []
+        for name in ('update_task_list', 'update_public_task_list', 'update_entity_task_group_list'):
+            patcher = mock.patch(f'kernel.sys_lib.{name}', side_effect=lambda *args, name=name: self.pushed.append((name, args)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def targets(self) -> list:
+        return sorted((name, tuple(getattr(arg, 'pk', arg) for arg in args)) for name, args in self.pushed)
+
+    def test_zero_window_pushes_on_commit(self):
+        coalescer = BroadcastCoalescer(window=0)
+        alice = operator(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            coalescer.mark_operator(alice)
+            self.assertEqual(self.pushed, [])
+        self.assertEqual(self.targets(), [('update_public_task_list', ()), ('update_task_list', (1, False))])
+
+    def test_marks_within_window_push_each_target_once(self):
+        # 窗口足够长，由测试手动刷新
+        coalescer = BroadcastCoalescer(window=60)
+        alice, bob = operator(1), operator(2)
+        entity = SimpleNamespace(pk=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                coalescer.mark_process(process(alice, entity))
+            coalescer.mark_operator(bob, public=False)
+            coalescer.mark_operator(alice)
+        self.assertEqual(self.pushed, [])
+        stats = coalescer.stats()
+        self.assertEqual((stats['pending_private'], stats['pending_public'], stats['pending_entities']), (2, True, 1))
+
+        self.assertEqual(coalescer.flush(), 4)
+        self.assertEqual(self.targets(), [
+            ('update_entity_task_group_list', (7,)),
+            ('update_public_task_list', ()),
+            ('update_task_list', (1, False)),
+            ('update_task_list', (2, False)),
+        ])
+        self.assertEqual(coalescer.flush(), 0)
+
+    def test_background_flush_after_window(self):
+        coalescer = BroadcastCoalescer(window=0.05)
+        with self.captureOnCommitCallbacks(execute=True):
+            coalescer.mark_operator(operator(1), public=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            coalescer.mark_operator(operator(1), public=False)
+        deadline = time.monotonic() + 5
+        while coalescer.stats()['flushes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.targets(), [('update_task_list', (1, False))])
+        self.assertEqual(coalescer.stats()['marks'], 2)
+
+    def test_suppressed_merges_marks_until_outermost_exit(self):
+        coalescer = BroadcastCoalescer(window=0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with coalescer.suppressed():
+                coalescer.mark_operator(operator(1), public=False)
+                with coalescer.suppressed():
+                    coalescer.mark_operator(operator(2))
+                    coalescer.mark_entity(SimpleNamespace(pk=7))
+                self.assertEqual(callbacks, [])
+                coalescer.mark_operator(operator(1), public=False)
+            self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.targets(), [
+            ('update_entity_task_group_list', (7,)),
+            ('update_public_task_list', ()),
+            ('update_task_list', (1, False)),
+            ('update_task_list', (2, False)),
+        ])
+        self.assertEqual(coalescer.stats()['marks'], 1)
+
+    def test_only_staff_operated_processes_mark_task_lists(self):
+        coalescer = BroadcastCoalescer(window=0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            coalescer.mark_processes([
+                process(None),
+                process(operator(1, is_staff=False)),
+                process(SimpleNamespace(pk=2, user=None)),
+            ])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.pushed, [])
+
+    def test_failed_push_does_not_block_others(self):
+        coalescer = BroadcastCoalescer(window=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            coalescer.mark_operator(operator(1))
+        with mock.patch('kernel.sys_lib.update_public_task_list', side_effect=RuntimeError('通道层不可用')):
+            self.assertEqual(coalescer.flush(), 1)
+        self.assertEqual(self.targets(), [('update_task_list', (1, False))])
+        self.assertEqual(coalescer.stats()['errors'], 1)
@@ -0,0 +1,86 @@
+from django.test import SimpleTestCase, TestCase
+
+from kernel.context_cache import CachedContext, ContextStackCache, context_stack_cache
+from kernel.models import ProcessContextSnapshot
+from kernel.sys_lib import ProcessExecutionContext
+from kernel.tests.factories import make_process
+
+def entry(version: int = 1, context_hash: str = 'h1', size: int = 10) -> CachedContext:
+    return CachedContext(version, context_hash, stack=object(), base_data={}, size=size)
+
+class ContextStackCacheTests(SimpleTestCase):
+    def test_take_removes_entry(self):
+        cache = ContextStackCache(max_entries=4, max_bytes=100)
+        cached = entry()
+        cache.put('p1', cached)
+        self.assertIs(cache.take('p1', 1, 'h1'), cached)
+        # 取出即移出：同一堆栈不会同时交给两个执行上下文
+        self.assertFalse(cache.contains('p1'))
+        self.assertIsNone(cache.take('p1', 1, 'h1'))
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses'], cache.stats()['bytes']), (1, 1, 0))
+
+    def test_version_or_hash_mismatch_is_stale(self):
+        cache = ContextStackCache(max_entries=4, max_bytes=100)
+        cache.put('p1', entry(version=1, context_hash='h1'))
+        cache.put('p2', entry(version=1, context_hash='h1'))
+        self.assertIsNone(cache.take('p1', 2, 'h2'))
+        self.assertIsNone(cache.take('p2', 1, 'other'))
+        stats = cache.stats()
+        self.assertEqual((stats['stale'], stats['misses'], stats['size'], stats['bytes']), (2, 2, 0, 0))
+
+    def test_evicts_least_recently_put_by_entries(self):
+        cache = ContextStackCache(max_entries=2, max_bytes=100)
+        cache.put('p1', entry())
+        cache.put('p2', entry())
+        # 重新放回的条目移到队尾
+        cache.put('p1', entry(version=2))
+        cache.put('p3', entry())
+        self.assertEqual([cache.contains(key) for key in ('p1', 'p2', 'p3')], [True, False, True])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_bytes(self):
+        cache = ContextStackCache(max_entries=10, max_bytes=25)
+        cache.put('p1', entry(size=10))
+        cache.put('p2', entry(size=10))
+        cache.put('p3', entry(size=10))
+        self.assertEqual([cache.contains(key) for key in ('p1', 'p2', 'p3')], [False, True, True])
+        self.assertEqual(cache.stats()['bytes'], 20)
+
+        # 单个条目超出上限时不缓存
+        cache.put('p2', entry(size=30))
+        self.assertFalse(cache.contains('p2'))
+        self.assertEqual(cache.stats()['bytes'], 10)
+
+    def test_disabled_cache_keeps_nothing(self):
+        cache = ContextStackCache(max_entries=0, max_bytes=100)
+        cache.put('p1', entry())
+        self.assertFalse(cache.contains('p1'))
+
+class ExecutionContextCacheTests(TestCase):
+    def setUp(self):
+        context_stack_cache.clear()
+
+    def test_next_execution_reuses_cached_stack(self):
+        process = make_process()
+        with ProcessExecutionContext(process) as frame:
+            frame.local_vars['step'] = 1
+        self.assertTrue(context_stack_cache.contains(process.pk))
+
+        hits = context_stack_cache.hits
+        with ProcessExecutionContext(process) as frame:
+            self.assertEqual(frame.stack.frames[0].local_vars['step'], 1)
+            frame.local_vars['step'] = 2
+        self.assertEqual(context_stack_cache.hits, hits + 1)
+        self.assertEqual(ProcessContextSnapshot.objects.filter(process=process).count(), 2)
+
+    def test_snapshot_written_elsewhere_discards_cached_stack(self):
+        process = make_process()
+        with ProcessExecutionContext(process) as frame:
+            frame.local_vars['step'] = 1
+        # 其它worker写入了更新的快照
+        ProcessContextSnapshot.objects.filter(process=process).update(context_hash='written-elsewhere')
+
+        stale = context_stack_cache.stale
+        with ProcessExecutionContext(process) as frame:
+            self.assertEqual(frame.stack.frames[0].local_vars['step'], 1)
+        self.assertEqual(context_stack_cache.stale, stale + 1)
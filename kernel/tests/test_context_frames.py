@@ -0,0 +1,67 @@
+from django.test import SimpleTestCase
+
+from kernel.sys_lib import ContextStack
+
+from types import SimpleNamespace
+
+def processes(*ids) -> dict:
+    """只需 erpsys_id 的进程替身，帧的分层与序列化不访问数据库"""
+    return {pid: SimpleNamespace(erpsys_id=pid) for pid in ids}
+
+class ContextFrameLayeringTests(SimpleTestCase):
+    def setUp(self):
+        self.processes = processes('root', 'child', 'sibling')
+        self.stack = ContextStack()
+        self.root = self.stack.push(self.processes['root'])
+        self.root.local_vars.update({'patient': '王五', 'dept': '内科'})
+        self.child = self.stack.push(self.processes['child'])
+        self.child.local_vars['dept'] = '外科'
+
+    def test_child_reads_through_parent_chain(self):
+        self.assertIs(self.child.parent_frame, self.root)
+        self.assertEqual(dict(self.child.context), {'patient': '王五', 'dept': '外科'})
+        self.assertEqual(dict(self.child.inherited_context), {'patient': '王五', 'dept': '内科'})
+        self.assertEqual(dict(self.root.inherited_context), {})
+
+    def test_inherited_vars_are_not_copied(self):
+        # 父帧之后的修改对子帧立即可见
+        self.root.local_vars['patient'] = '赵六'
+        self.assertEqual(self.child.context['patient'], '赵六')
+        # 子帧写入只落在本帧
+        self.child.context['visit'] = 2
+        self.assertEqual(self.child.local_vars, {'dept': '外科', 'visit': 2})
+        self.assertNotIn('visit', self.root.local_vars)
+        self.assertEqual(self.root.local_vars['dept'], '内科')
+
+    def test_to_dict_stores_own_vars_and_parent_index(self):
+        sibling = self.stack.push(self.processes['sibling'], parent_frame=self.root)
+        sibling.local_vars['room'] = 3
+        frames = self.stack.to_dict()['frames']
+        self.assertEqual([(frame['process_id'], frame['parent']) for frame in frames], [('root', None), ('child', 0), ('sibling', 0)])
+        self.assertEqual(frames[1]['local_vars'], {'dept': '外科'})
+        self.assertNotIn('inherited_context', frames[1])
+
+        # 只序列化某帧及其祖先，不含兄弟帧
+        lineage = self.stack.lineage_to_dict(sibling)['frames']
+        self.assertEqual([(frame['process_id'], frame['parent']) for frame in lineage], [('root', None), ('sibling', 0)])
+
+    def test_round_trip_relinks_parents(self):
+        self.stack.push(self.processes['sibling'], parent_frame=self.root)
+        restored = ContextStack.from_dict(self.stack.to_dict(), self.processes.__getitem__)
+        root, child, sibling = restored.frames
+        self.assertIsNone(root.parent_frame)
+        self.assertIs(child.parent_frame, root)
+        self.assertIs(sibling.parent_frame, root)
+        self.assertEqual(dict(child.context), {'patient': '王五', 'dept': '外科'})
+        self.assertEqual(restored.to_dict(), self.stack.to_dict())
+
+    def test_legacy_snapshot_links_adjacent_frames(self):
+        # 旧版快照：没有 parent 下标，inherited_context 是父帧变量的副本
+        data = {'frames': [
+            {'process_id': 'root', 'status': 'ACTIVE', 'local_vars': {'patient': '王五'}},
+            {'process_id': 'child', 'status': 'ACTIVE', 'local_vars': {'dept': '外科'},
+             'inherited_context': {'patient': '旧副本'}},
+        ]}
+        root, child = ContextStack.from_dict(data, self.processes.__getitem__).frames
+        self.assertIs(child.parent_frame, root)
+        self.assertEqual(child.context['patient'], '王五')
@@ -0,0 +1,59 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase
+
+from kernel.context_cache import context_stack_cache
+from kernel.models import ProcessContextSnapshot
+from kernel.snapshots import SNAPSHOT_FULL, restore_snapshot
+from kernel.sys_call_outbox import sys_call_outbox
+from kernel.sys_lib import ProcessExecutionContext
+from kernel.tests.factories import make_process
+
+class VersionConflictRetryTests(TestCase):
+    def setUp(self):
+        context_stack_cache.clear()
+        self.process = make_process()
+
+    def write_competing_snapshot(self, version: int):
+        """另一个写入者抢先写入的版本"""
+        ProcessContextSnapshot.objects.create(
+            process=self.process, version=version, context_hash=f'other-{version}',
+            snapshot_type=SNAPSHOT_FULL, context_data={'frames': []},
+        )
+
+    def test_conflicting_version_is_saved_as_next_full_snapshot(self):
+        context = ProcessExecutionContext(self.process)
+        with context as frame:
+            frame.local_vars['step'] = 'mine'
+            self.write_competing_snapshot(1)
+
+        self.assertEqual(context.version, 2)
+        rows = list(ProcessContextSnapshot.objects.filter(process=self.process).order_by('version').values_list('version', 'snapshot_type'))
+        self.assertEqual(rows, [(1, SNAPSHOT_FULL), (2, SNAPSHOT_FULL)])
+        data, version, _ = restore_snapshot(self.process)
+        self.assertEqual(version, 2)
+        self.assertEqual(data['frames'][-1]['local_vars']['step'], 'mine')
+
+    def test_next_save_continues_from_retried_version(self):
+        with ProcessExecutionContext(self.process) as frame:
+            frame.local_vars['step'] = 1
+            self.write_competing_snapshot(1)
+        with ProcessExecutionContext(self.process) as frame:
+            frame.local_vars['step'] = 2
+
+        self.assertEqual(restore_snapshot(self.process)[1], 3)
+        self.assertEqual(restore_snapshot(self.process)[0]['frames'][-1]['local_vars']['step'], 2)
+
+    def test_gives_up_after_max_retries_and_discards_sys_calls(self):
+        context = ProcessExecutionContext(self.process)
+        # 每次重读的最新版本号都已过期：始终冲突
+        with mock.patch.object(ProcessExecutionContext, '_get_last_snapshot_state', return_value=(0, None)):
+            with self.assertRaises(IntegrityError):
+                with context as frame:
+                    frame.local_vars['step'] = 'lost'
+                    sys_call_outbox.publish([['start_service', {'process_id': self.process.erpsys_id}]])
+                    self.write_competing_snapshot(1)
+
+        self.assertEqual(sys_call_outbox._buffers(), [])
+        self.assertEqual(ProcessContextSnapshot.objects.filter(process=self.process).count(), 1)
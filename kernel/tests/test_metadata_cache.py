@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from kernel.metadata_cache import GENERATION_KEY, metadata_cache
+from kernel.models import Service
+from kernel.rule_cache import rule_dispatch_table
+from kernel.tests.factories import make_rule, make_service
+
+@override_settings(KERNEL_METADATA_CHECK_INTERVAL=0)
+class MetadataInvalidationTests(TestCase):
+    def setUp(self):
+        metadata_cache.bump()
+        self.program = make_service('体检流程')
+        self.service = make_service('登记')
+        self.first = make_rule(self.program, self.service, "process_state == 'NEW'", order=1, label='第一')
+
+    def rule_ids(self):
+        return [spec.erpsys_id for spec in rule_dispatch_table.rules_for(self.program.erpsys_id, self.service.id)]
+
+    def test_definition_change_rebuilds_dispatch_table_after_commit(self):
+        self.assertEqual(self.rule_ids(), [self.first.erpsys_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            second = make_rule(self.program, self.service, "process_state == 'READY'", order=2, label='第二')
+        self.assertEqual(self.rule_ids(), [self.first.erpsys_id, second.erpsys_id])
+
+    def test_generation_bumped_elsewhere_invalidates_local_copy(self):
+        self.assertEqual(self.rule_ids(), [self.first.erpsys_id])
+        # 另一个进程写入的定义：本进程未收到提交回调，共享代数未变前沿用本地副本
+        second = make_rule(self.program, self.service, "process_state == 'READY'", order=2, label='第二')
+        self.assertEqual(self.rule_ids(), [self.first.erpsys_id])
+
+        cache.incr(GENERATION_KEY)
+        self.assertEqual(self.rule_ids(), [self.first.erpsys_id, second.erpsys_id])
+
+    def test_lookups_share_one_load_per_generation(self):
+        loads = metadata_cache.loads
+        by_id = metadata_cache.get(Service, erpsys_id=self.service.erpsys_id)
+        by_label = metadata_cache.get(Service, label=self.service.label)
+        self.assertIs(by_id, by_label)
+        self.assertEqual(metadata_cache.loads, loads + 1)
+        with self.assertRaises(Service.DoesNotExist):
+            metadata_cache.get(Service, erpsys_id='missing')
+
+        metadata_cache.bump()
+        metadata_cache.get(Service, pk=self.service.pk)
+        self.assertEqual(metadata_cache.loads, loads + 2)
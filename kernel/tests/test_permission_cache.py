@@ -0,0 +1,83 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from kernel.metadata_cache import GENERATION_KEY as METADATA_GENERATION_KEY, metadata_cache
+from kernel.models import Role
+from kernel.permission_cache import GENERATION_KEY, service_permissions
+from kernel.tests.factories import make_operator, make_service
+
+@override_settings(KERNEL_METADATA_CHECK_INTERVAL=0)
+class ServicePermissionIndexTests(TestCase):
+    def setUp(self):
+        metadata_cache.bump()
+        service_permissions.bump()
+        self.register, self.blood, self.xray = make_service('登记'), make_service('抽血'), make_service('放射')
+        self.nurse = Role.objects.create(label='护士')
+        self.nurse.services.add(self.register, self.blood)
+        self.radiologist = Role.objects.create(label='放射技师')
+        self.radiologist.services.add(self.xray)
+        self.alice = make_operator('张三')
+        self.alice.role.add(self.nurse)
+        self.bob = make_operator('李四')
+        self.bob.role.add(self.nurse, self.radiologist)
+        service_permissions.bump()
+
+    def test_index_in_both_directions(self):
+        self.assertEqual(service_permissions.service_ids_for(self.alice.id), {self.register.id, self.blood.id})
+        self.assertEqual(service_permissions.service_ids_for(self.bob.id), {self.register.id, self.blood.id, self.xray.id})
+        self.assertEqual(service_permissions.operator_ids_for(self.blood.id), {self.alice.id, self.bob.id})
+        self.assertEqual(service_permissions.operator_ids_for(self.xray.id), {self.bob.id})
+        self.assertEqual(service_permissions.operator_ids_for(make_service('空闲').id), frozenset())
+        self.assertEqual(service_permissions.service_ids_for(make_operator('访客').id), frozenset())
+
+    def test_one_build_per_generation(self):
+        builds = service_permissions.builds
+        service_permissions.service_ids_for(self.alice.id)
+        service_permissions.operator_ids_for(self.blood.id)
+        self.assertEqual(service_permissions.builds, builds + 1)
+
+    def test_role_change_rebuilds_both_directions_after_commit(self):
+        self.assertEqual(service_permissions.operator_ids_for(self.xray.id), {self.bob.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.role.add(self.radiologist)
+        self.assertEqual(service_permissions.operator_ids_for(self.xray.id), {self.alice.id, self.bob.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.role.remove(self.nurse)
+        self.assertEqual(service_permissions.service_ids_for(self.bob.id), {self.xray.id})
+        self.assertEqual(service_permissions.operator_ids_for(self.blood.id), {self.alice.id})
+
+    def test_role_services_change_and_role_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.radiologist.services.add(self.blood)
+        self.assertEqual(service_permissions.operator_ids_for(self.blood.id), {self.alice.id, self.bob.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nurse.delete()
+        self.assertEqual(service_permissions.service_ids_for(self.alice.id), frozenset())
+        self.assertEqual(service_permissions.operator_ids_for(self.register.id), frozenset())
+        self.assertEqual(service_permissions.service_ids_for(self.bob.id), {self.blood.id, self.xray.id})
+
+    def test_permission_change_leaves_metadata_generation_alone(self):
+        metadata_generation = cache.get(METADATA_GENERATION_KEY)
+        generation = cache.get(GENERATION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.role.add(self.radiologist)
+        self.assertEqual(cache.get(METADATA_GENERATION_KEY), metadata_generation)
+        self.assertEqual(cache.get(GENERATION_KEY), generation + 1)
+
+    def test_generation_bumped_elsewhere_invalidates_local_index(self):
+        self.assertEqual(service_permissions.service_ids_for(self.alice.id), {self.register.id, self.blood.id})
+        # 另一个进程写入的关联：本进程未收到提交回调，共享代数未变前沿用本地索引
+        self.alice.role.add(self.radiologist)
+        self.assertEqual(service_permissions.service_ids_for(self.alice.id), {self.register.id, self.blood.id})
+
+        cache.incr(GENERATION_KEY)
+        self.assertEqual(service_permissions.service_ids_for(self.alice.id), {self.register.id, self.blood.id, self.xray.id})
+
+    def test_metadata_invalidation_also_drops_index(self):
+        builds = service_permissions.builds
+        service_permissions.service_ids_for(self.alice.id)
+        metadata_cache.bump()
+        service_permissions.service_ids_for(self.alice.id)
+        self.assertEqual(service_permissions.builds, builds + 2)
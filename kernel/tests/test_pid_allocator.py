@@ -0,0 +1,59 @@
+import threading
+import unittest
+
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+
+from kernel.models import Process, SequenceCounter
+from kernel.pid_allocator import PID_COUNTER, next_pid, reserve_pids
+from kernel.tests.factories import make_process
+
+class ReservePidsTests(TestCase):
+    def test_reserved_blocks_do_not_overlap(self):
+        blocks = [reserve_pids(count) for count in (5, 1, 3, 10)]
+        pids = [pid for block in blocks for pid in block]
+        self.assertEqual([len(block) for block in blocks], [5, 1, 3, 10])
+        self.assertEqual(len(set(pids)), len(pids))
+        self.assertNotIn(next_pid(), pids)
+        self.assertEqual(reserve_pids(0), [])
+
+    def test_saved_processes_and_reserved_pids_are_unique(self):
+        processes = [make_process() for _ in range(3)]
+        reserved = reserve_pids(4)
+        processes += [make_process() for _ in range(3)]
+        pids = [process.pid for process in processes] + reserved
+        self.assertEqual(len(set(pids)), len(pids))
+
+    def test_preassigned_pid_is_kept(self):
+        process = make_process(pid=reserve_pids(1)[0] + 100)
+        self.assertEqual(Process.objects.get(pk=process.pk).pid, process.pid)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "PostgreSQL 使用数据库序列")
+    def test_counter_starts_after_existing_max_pid(self):
+        make_process(pid=1000)
+        SequenceCounter.objects.filter(name=PID_COUNTER).delete()
+        self.assertEqual(reserve_pids(2), [1001, 1002])
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "并发预留需要支持并发写入的数据库")
+class ConcurrentReservePidsTests(TransactionTestCase):
+    def test_concurrent_reservations_are_unique(self):
+        results, errors = [], []
+
+        def worker():
+            try:
+                for _ in range(20):
+                    results.extend(reserve_pids(5))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 8 * 20 * 5)
+        self.assertEqual(len(set(results)), len(results))
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from kernel.context_cache import context_stack_cache
+from kernel.metadata_cache import metadata_cache
+from kernel.models import Process, ProcessContextSnapshot
+from kernel.snapshots import restore_snapshot
+from kernel.sys_call_outbox import sys_call_outbox
+from kernel.sys_lib import ProcessCreator
+from kernel.tests.factories import make_operator, make_rule, make_service
+
+ROW_FIELDS = (
+    'name', 'state', 'priority', 'service_id', 'operator_id', 'entity_content_type_id', 'entity_object_id',
+    'program_entrypoint', 'form_url', 'scheduled_time', 'time_window',
+)
+# 每个进程各不相同的上下文变量
+VOLATILE_VARS = ('process_id', 'process_created_at', 'process_updated_at')
+
+def process_row(process) -> dict:
+    row = Process.objects.filter(pk=process.pk).values(*ROW_FIELDS, 'parent_id').get()
+    row['parent_is_self'] = row.pop('parent_id') == process.pk
+    return row
+
+def normalized_snapshot(process) -> tuple:
+    data, version, _ = restore_snapshot(process)
+    frames = []
+    for frame in data['frames']:
+        frame = dict(frame, process_id=None)
+        frame['local_vars'] = {k: v for k, v in frame['local_vars'].items() if k not in VOLATILE_VARS}
+        frame['events_triggered_log'] = [entry['rule_id'] for entry in frame['events_triggered_log']]
+        frames.append(frame)
+    return version, frames
+
+def normalized_calls(calls: list) -> list:
+    return [[name, dict(kwargs, process_id=None)] for name, kwargs in calls]
+
+class BulkCreateParityTests(TestCase):
+    def setUp(self):
+        metadata_cache.bump()
+        context_stack_cache.clear()
+        self.program = make_service('体检流程')
+        self.service = make_service('抽血')
+        self.operator = make_operator()
+        self.rule = make_rule(self.program, self.service, "process_state == 'NEW' and batch == 1")
+        self.creator = ProcessCreator(need_business_record=False)
+        self.common = {'service_rule': self.rule, 'service': self.service, 'entity_content_object': self.operator}
+
+    def create(self, bulk: bool, variants: list) -> tuple:
+        """创建进程，返回 (进程列表, 提交后发布的系统调用批次)"""
+        published = []
+        with mock.patch.object(sys_call_outbox, '_publish', side_effect=published.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                if bulk:
+                    processes = self.creator.create_processes_bulk(self.common, variants)
+                else:
+                    processes = [self.creator.create_process(dict(self.common, **variant)) for variant in variants]
+        return processes, published
+
+    def test_bulk_matches_single_rows_snapshots_and_sys_calls(self):
+        variant = {'operator': self.operator, 'init_params': {'batch': 1}}
+        [single], [single_calls] = self.create(False, [variant])
+        [bulk], [bulk_calls] = self.create(True, [variant])
+
+        self.assertNotEqual(single.pid, bulk.pid)
+        self.assertEqual(process_row(bulk), process_row(single))
+        self.assertEqual(normalized_snapshot(bulk), normalized_snapshot(single))
+        self.assertEqual(normalized_snapshot(bulk)[1][0]['events_triggered_log'], [self.rule.erpsys_id])
+        self.assertEqual(normalized_calls(bulk_calls), normalized_calls(single_calls))
+        self.assertEqual(bulk_calls[0][1]['process_id'], bulk.erpsys_id)
+        self.assertEqual(bulk_calls[0][1]['snapshot_version'], 1)
+
+    def test_each_bulk_child_gets_its_own_initial_snapshot(self):
+        variants = [{'operator': self.operator, 'init_params': {'batch': batch}} for batch in (1, 2, 3)]
+        processes, batches = self.create(True, variants)
+
+        self.assertEqual(len({process.pid for process in processes}), 3)
+        for process, variant in zip(processes, variants):
+            with self.subTest(batch=variant['init_params']['batch']):
+                self.assertEqual(ProcessContextSnapshot.objects.filter(process=process).count(), 1)
+                data, version, _ = restore_snapshot(process)
+                self.assertEqual(version, 1)
+                self.assertEqual([frame['process_id'] for frame in data['frames']], [process.erpsys_id])
+                self.assertEqual(data['frames'][0]['local_vars']['batch'], variant['init_params']['batch'])
+        # 只有 batch == 1 的子进程命中规则，系统调用在提交后作为一个批次发布
+        self.assertEqual([[kwargs['process_id'] for _, kwargs in batch] for batch in batches], [[processes[0].erpsys_id]])
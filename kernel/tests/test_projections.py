@@ -0,0 +1,102 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from kernel.models import Organization, Process
+from kernel.projections import format_field_value, render_work_order
+from kernel.task_stream import ROW_KEY
+from kernel.tests.factories import make_operator, make_process, make_service
+
+def legacy_value(instance, value_expression):
+    """投影计划之前的 get_nested_field_value（逐行逐列递归取值），作为对照"""
+    fields = value_expression.split('.', 1)
+    value = getattr(instance, fields[0], None)
+    if isinstance(value, models.Manager):
+        value = value.all().first()
+    if len(fields) > 1 and value is not None:
+        return legacy_value(value, fields[1])
+    return format_field_value(value)
+
+def legacy_rows(instances, work_order):
+    return [{field['name']: legacy_value(instance, field['value_expression']) for field in work_order} for instance in instances]
+
+def column(name: str, value_expression: str) -> dict:
+    return {'name': name, 'label': name, 'value_expression': value_expression}
+
+PURE_WORK_ORDER = [
+    column('service', 'service.label'),
+    column('organization', 'operator.organization.label'),
+    column('state', 'state'),
+    column('created_at', 'created_at'),
+]
+
+MIXED_WORK_ORDER = PURE_WORK_ORDER + [
+    column('operator', 'operator'),
+    column('child', 'child_instances.name'),
+    column('entity', 'entity_content_object.label'),
+]
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        organization = Organization.objects.create(label='体检中心')
+        self.operators = [make_operator('张三', organization=organization), make_operator('李四')]
+        self.services = [make_service('抽血'), make_service('问诊')]
+        self.operator_type = ContentType.objects.get_for_model(self.operators[0])
+
+    def add_processes(self, count: int):
+        for i in range(count):
+            process = make_process(
+                service=self.services[i % 2],
+                operator=self.operators[i % 2] if i % 3 else None,
+                entity_content_type=self.operator_type if i % 2 else None,
+                entity_object_id=self.operators[i % 2].id if i % 2 else None,
+            )
+            for j in range(i % 3):
+                make_process(name=f'子进程{i}-{j}', parent=process)
+
+    def roots(self):
+        return Process.objects.filter(parent__isnull=True)
+
+    def assert_matches_legacy(self, work_order):
+        rows, head = render_work_order(self.roots(), work_order, key='erpsys_id')
+        expected = legacy_rows(self.roots(), work_order)
+        self.assertEqual([{k: v for k, v in row.items() if k != ROW_KEY} for row in rows], expected)
+        self.assertEqual([row[ROW_KEY] for row in rows], list(self.roots().values_list('erpsys_id', flat=True)))
+        self.assertEqual(head, [{k: v for k, v in item.items() if k != 'value_expression'} for item in work_order])
+        # 已取出的实例列表走实例路径，结果相同
+        rows, _ = render_work_order(list(self.roots()), work_order)
+        self.assertEqual(rows, expected)
+
+    def count_queries(self, instances, work_order) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            render_work_order(instances, work_order)
+        return len(queries)
+
+    def test_pure_columns_match_legacy(self):
+        self.add_processes(6)
+        self.assert_matches_legacy(PURE_WORK_ORDER)
+
+    def test_mixed_columns_match_legacy(self):
+        self.add_processes(6)
+        self.assert_matches_legacy(MIXED_WORK_ORDER)
+
+    def test_pure_columns_use_one_query(self):
+        self.add_processes(6)
+        with self.assertNumQueries(1):
+            render_work_order(self.roots(), PURE_WORK_ORDER)
+
+    def test_query_count_independent_of_rows(self):
+        for work_order in (PURE_WORK_ORDER, MIXED_WORK_ORDER):
+            with self.subTest(columns=len(work_order)):
+                Process.objects.all().delete()
+                self.add_processes(3)
+                # 预热：内容类型缓存等一次性查询不计入
+                self.count_queries(self.roots(), work_order)
+                few = self.count_queries(self.roots(), work_order)
+                few_list = self.count_queries(list(self.roots()), work_order)
+
+                self.add_processes(3)
+                self.assertEqual(self.roots().count(), 6)
+                self.assertEqual(self.count_queries(self.roots(), work_order), few)
+                self.assertEqual(self.count_queries(list(self.roots()), work_order), few_list)
@@ -0,0 +1,100 @@
+from django.test import SimpleTestCase, TestCase
+
+from kernel.models import ResourceCalendar, ResourceRequirement
+from kernel.resource_calendar import IntervalIndex, calendar_index, merge_intervals
+
+from datetime import datetime, timedelta
+import random
+
+BASE = datetime(2024, 1, 1, 8, 0)
+
+def at(minutes: int) -> datetime:
+    return BASE + timedelta(minutes=minutes)
+
+def span(start: int, end: int) -> tuple:
+    return at(start), at(end)
+
+def brute_earliest(merged, after, duration):
+    for start, end in merged:
+        candidate = max(after, start)
+        if end - candidate >= duration:
+            return candidate
+    return None
+
+def brute_slots(merged, start, end):
+    return [(max(s, start), min(e, end)) for s, e in merged if s < end and e > start]
+
+class IntervalIndexTests(SimpleTestCase):
+    def test_merges_overlapping_and_adjacent_intervals(self):
+        merged = merge_intervals([span(60, 90), span(0, 30), span(30, 45), span(20, 40), span(50, 50), span(80, 120)])
+        self.assertEqual(merged, [span(0, 45), span(60, 120)])
+
+    def test_empty_index(self):
+        index = IntervalIndex([])
+        self.assertEqual(len(index), 0)
+        self.assertFalse(index.contains(at(0)))
+        self.assertIsNone(index.earliest_slot(at(0), timedelta(minutes=1)))
+        self.assertEqual(index.slots(at(0), at(60)), [])
+
+    def test_earliest_slot_takes_first_long_enough_interval(self):
+        index = IntervalIndex([span(0, 10), span(20, 50), span(60, 70), span(80, 200)])
+        # 不是最长的时段，而是 after 之后第一个足够长的时段
+        self.assertEqual(index.earliest_slot(at(0), timedelta(minutes=30)), at(20))
+        self.assertEqual(index.earliest_slot(at(25), timedelta(minutes=25)), at(25))
+        self.assertEqual(index.earliest_slot(at(25), timedelta(minutes=26)), at(80))
+        self.assertEqual(index.earliest_slot(at(5), timedelta(minutes=5)), at(5))
+        self.assertIsNone(index.earliest_slot(at(0), timedelta(minutes=121)))
+        self.assertIsNone(index.earliest_slot(at(200), timedelta(minutes=1)))
+
+    def test_slots_are_clipped_to_range(self):
+        index = IntervalIndex([span(0, 10), span(20, 50), span(60, 70)])
+        self.assertEqual(index.slots(at(5), at(65)), [span(5, 10), span(20, 50), span(60, 65)])
+        self.assertEqual(index.slots(at(10), at(20)), [])
+        self.assertEqual(index.slots(at(-10), at(100)), [span(0, 10), span(20, 50), span(60, 70)])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(22)
+        for _ in range(200):
+            intervals = []
+            for _ in range(rng.randint(0, 12)):
+                start = rng.randint(0, 300)
+                intervals.append(span(start, start + rng.randint(0, 40)))
+            merged = merge_intervals(intervals)
+            index = IntervalIndex(intervals)
+            self.assertEqual(list(zip(index.starts, index.ends)), merged)
+
+            for _ in range(20):
+                t = at(rng.randint(-20, 360))
+                duration = timedelta(minutes=rng.randint(1, 60))
+                end = t + timedelta(minutes=rng.randint(0, 120))
+                self.assertEqual(index.contains(t), any(s <= t < e for s, e in merged))
+                self.assertEqual(index.earliest_slot(t, duration), brute_earliest(merged, t, duration))
+                self.assertEqual(index.slots(t, end), brute_slots(merged, t, end))
+
+class CalendarIndexTests(TestCase):
+    def test_calendar_change_invalidates_index_on_commit(self):
+        resource = ResourceRequirement.objects.create(label='采血椅', resource_type='设备')
+        ResourceCalendar.objects.create(label='上午', resource=resource, start_time=at(0), end_time=at(240))
+        calendar_index.invalidate(resource.id)
+        self.assertTrue(calendar_index.is_available(resource.id, at(60)))
+        self.assertFalse(calendar_index.is_available(resource.id, at(300)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ResourceCalendar.objects.create(label='下午', resource=resource, start_time=at(240), end_time=at(480))
+        self.assertTrue(calendar_index.is_available(resource.id, at(300)))
+        self.assertEqual(calendar_index.free_slots([resource.id], at(200), at(500)), {resource.id: [span(200, 480)]})
+
+    def test_moving_calendar_invalidates_previous_resource(self):
+        chair = ResourceRequirement.objects.create(label='采血椅', resource_type='设备')
+        bed = ResourceRequirement.objects.create(label='检查床', resource_type='设备')
+        calendar = ResourceCalendar.objects.create(label='上午', resource=chair, start_time=at(0), end_time=at(240))
+        calendar_index.invalidate(chair.id)
+        calendar_index.invalidate(bed.id)
+        self.assertTrue(calendar_index.is_available(chair.id, at(60)))
+        self.assertFalse(calendar_index.is_available(bed.id, at(60)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            calendar.resource = bed
+            calendar.save()
+        self.assertFalse(calendar_index.is_available(chair.id, at(60)))
+        self.assertTrue(calendar_index.is_available(bed.id, at(60)))
@@ -0,0 +1,74 @@
+from django.test import TestCase
+
+from kernel.models import Resource, ResourceAllocation, ResourceStatus
+from kernel.resource_manage import allocate_for_process, process_requirements, release_for_process, try_acquire
+from kernel.tests.factories import make_process, make_service
+
+class ProcessAllocationTests(TestCase):
+    def setUp(self):
+        self.chair = ResourceStatus.objects.create(label='采血椅', resource=Resource.objects.create(label='采血椅'), capacity=1)
+        self.room = ResourceStatus.objects.create(label='诊室', resource=Resource.objects.create(label='诊室'), capacity=2)
+        self.requirements = {self.chair.id: 1, self.room.id: 2}
+
+    def usage(self) -> tuple:
+        return tuple(ResourceStatus.objects.filter(pk__in=[self.chair.pk, self.room.pk]).order_by('pk').values_list('current_usage', flat=True))
+
+    def test_insufficient_capacity_allocates_nothing(self):
+        process = make_process()
+        self.assertFalse(allocate_for_process(process, {self.chair.id: 1, self.room.id: 3}))
+        # 采血椅先被占用，诊室不足后整体回滚
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertFalse(ResourceAllocation.objects.filter(process=process).exists())
+
+    def test_allocation_is_all_or_nothing_across_processes(self):
+        first, second = make_process(), make_process()
+        self.assertTrue(allocate_for_process(first, self.requirements))
+        self.assertEqual(self.usage(), (1, 2))
+        self.assertEqual(
+            dict(ResourceAllocation.objects.filter(process=first).values_list('resource_id', 'units')),
+            self.requirements,
+        )
+
+        self.assertFalse(allocate_for_process(second, self.requirements))
+        self.assertEqual(self.usage(), (1, 2))
+        self.assertFalse(ResourceAllocation.objects.filter(process=second).exists())
+
+    def test_allocation_is_idempotent(self):
+        process = make_process()
+        self.assertTrue(allocate_for_process(process, self.requirements))
+        self.assertTrue(allocate_for_process(process, self.requirements))
+        self.assertEqual(self.usage(), (1, 2))
+        self.assertEqual(ResourceAllocation.objects.filter(process=process).count(), 2)
+
+    def test_release_is_idempotent(self):
+        first, second = make_process(), make_process()
+        allocate_for_process(first, self.requirements)
+        self.assertEqual(release_for_process(first), 2)
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertEqual(release_for_process(first), 0)
+        self.assertEqual(self.usage(), (0, 0))
+        # 归还的容量可再分配
+        self.assertTrue(allocate_for_process(second, self.requirements))
+        self.assertEqual(self.usage(), (1, 2))
+
+    def test_try_acquire_respects_capacity(self):
+        self.assertTrue(try_acquire(self.room.id, 2))
+        self.assertFalse(try_acquire(self.room.id, 1))
+        self.assertEqual(self.usage(), (0, 2))
+
+    def test_requirements_resolve_through_resource(self):
+        uncontrolled = Resource.objects.create(label='血压计')
+        service = make_service('抽血', config={
+            'equipment_requirements': [
+                {'erpsys_id': self.chair.resource.erpsys_id, 'quantity': 1},
+                {'erpsys_id': uncontrolled.erpsys_id, 'quantity': 1},
+            ],
+            'material_requirements': [{'erpsys_id': self.room.resource.erpsys_id}],
+            'device_requirements': [{'erpsys_id': self.room.resource.erpsys_id, 'quantity': 1}],
+        })
+        process = make_process(service=service)
+        # 资源状态自身的 erpsys_id 与资源不同，需求按资源的 erpsys_id 对应；没有资源状态的资源不受控
+        self.assertEqual(process_requirements(process), {self.chair.id: 1, self.room.id: 2})
+        self.assertTrue(allocate_for_process(process))
+        self.assertEqual(self.usage(), (1, 2))
+        self.assertEqual(process_requirements(make_process()), {})
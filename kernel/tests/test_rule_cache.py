@@ -0,0 +1,116 @@
+from django.test import SimpleTestCase, TestCase
+
+from kernel.metadata_cache import metadata_cache
+from kernel.rule_cache import CompiledExpressionCache, ExpressionError, compile_expression, rule_dispatch_table
+from kernel.tests.factories import make_rule, make_service
+
+class CompileExpressionTests(SimpleTestCase):
+    def test_allows_comparisons_and_whitelisted_builtins(self):
+        cache = CompiledExpressionCache()
+        context = {'process_state': 'NEW', 'items': [1, 2, 3]}
+        self.assertTrue(cache.evaluate(1, "process_state == 'NEW' and len(items) > 2", context))
+        self.assertEqual(cache.evaluate(2, "max(items) + abs(-1)", context), 4)
+        self.assertEqual(cache.evaluate(3, "items[0] if process_state in ('NEW', 'READY') else 0", context), 1)
+
+    def test_rejects_dunder_attributes(self):
+        for expression in (
+            "process_state.__class__",
+            "().__class__.__bases__[0].__subclasses__()",
+            "items.__len__",
+        ):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ExpressionError):
+                    compile_expression(expression)
+
+    def test_rejects_underscore_names(self):
+        for expression in ("__import__", "_secret == 1", "__builtins__"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ExpressionError):
+                    compile_expression(expression)
+
+    def test_rejects_non_builtin_calls(self):
+        for expression in (
+            "open('/etc/passwd')",
+            "getattr(process_state, 'upper')",
+            "eval('1 + 1')",
+            "process_state.upper()",
+            "items.pop()",
+        ):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ExpressionError):
+                    compile_expression(expression)
+
+    def test_rejects_disallowed_syntax(self):
+        for expression in (
+            "(lambda: 1)()",
+            "[x for x in items]",
+            "(y := 1)",
+            "process_state ==",
+        ):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ExpressionError):
+                    compile_expression(expression)
+
+    def test_unlisted_builtins_are_not_reachable(self):
+        cache = CompiledExpressionCache()
+        with self.assertRaises(NameError):
+            cache.evaluate(1, "open", {})
+
+    def test_cache_hits_and_evicts_per_event(self):
+        cache = CompiledExpressionCache()
+        cache.get(1, "1 + 1")
+        cache.get(1, "1 + 1")
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+        # 表达式变更后自然失配
+        cache.get(1, "2 + 2")
+        self.assertEqual(cache.stats()['misses'], 2)
+
+        cache.evict(1)
+        self.assertEqual(cache.stats()['size'], 0)
+        cache.get(1, "1 + 1")
+        self.assertEqual(cache.stats()['misses'], 3)
+
+class RuleDispatchTableTests(TestCase):
+    def setUp(self):
+        metadata_cache.bump()
+        self.program = make_service('体检流程')
+        self.service = make_service('登记')
+
+    def rule_ids(self, specs):
+        return [spec.erpsys_id for spec in specs]
+
+    def test_rules_are_grouped_by_program_and_service_in_rule_order(self):
+        second = make_rule(self.program, self.service, "process_state == 'READY'", order=2, label='第二')
+        first = make_rule(self.program, self.service, "process_state == 'NEW'", order=1, label='第一')
+        other = make_rule(self.program, make_service('抽血'), "process_state == 'NEW'", label='其它')
+
+        specs = rule_dispatch_table.rules_for(self.program.erpsys_id, self.service.id)
+        self.assertEqual(self.rule_ids(specs), [first.erpsys_id, second.erpsys_id])
+        self.assertEqual(specs[0].expression, "process_state == 'NEW'")
+        self.assertEqual(specs[0].sys_call, 'start_service')
+        self.assertEqual(self.rule_ids(rule_dispatch_table.rules_for(self.program.erpsys_id, other.service_id)), [other.erpsys_id])
+        self.assertEqual(rule_dispatch_table.rules_for(self.program.erpsys_id, -1), ())
+
+    def test_timer_rules_are_indexed_separately(self):
+        regular = make_rule(self.program, self.service, "process_state == 'NEW'", label='一般')
+        timer = make_rule(self.program, self.service, "timer == 'scheduled'", is_timer=True, label='定时')
+
+        key = (self.program.erpsys_id, self.service.id)
+        self.assertEqual(self.rule_ids(rule_dispatch_table.rules_for(*key)), [regular.erpsys_id])
+        self.assertEqual(self.rule_ids(rule_dispatch_table.timer_rules_for(*key)), [timer.erpsys_id])
+
+    def test_rules_without_expression_are_skipped(self):
+        make_rule(self.program, self.service, '', label='空表达式')
+        self.assertEqual(rule_dispatch_table.rules_for(self.program.erpsys_id, self.service.id), ())
+
+    def test_table_is_built_once_until_invalidated(self):
+        make_rule(self.program, self.service, "process_state == 'NEW'")
+        builds = rule_dispatch_table.builds
+        for _ in range(3):
+            rule_dispatch_table.rules_for(self.program.erpsys_id, self.service.id)
+        self.assertEqual(rule_dispatch_table.builds, builds + 1)
+
+        rule_dispatch_table.invalidate()
+        rule_dispatch_table.rules_for(self.program.erpsys_id, self.service.id)
+        self.assertEqual(rule_dispatch_table.builds, builds + 2)
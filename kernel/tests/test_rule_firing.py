@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from kernel.context_cache import context_stack_cache
+from kernel.metadata_cache import metadata_cache
+from kernel.models import Process, RuleFiring
+from kernel.sys_call_outbox import sys_call_outbox
+from kernel.sys_lib import ProcessExecutionContext, RuleEvaluator
+from kernel.tests.factories import make_process, make_rule, make_service
+
+class RuleFiringDedupTests(TestCase):
+    def setUp(self):
+        metadata_cache.bump()
+        context_stack_cache.clear()
+        self.program = make_service('体检流程')
+        self.service = make_service('抽血')
+        self.rule = make_rule(self.program, self.service, "process_state in ('READY', 'RUNNING')")
+        self.sent = []
+        patcher = mock.patch.object(sys_call_outbox, '_publish', side_effect=self.sent.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_process(self, state: str = 'READY') -> Process:
+        return make_process(service=self.service, program_entrypoint=self.program.erpsys_id, state=state)
+
+    def sweep(self, *processes) -> int:
+        with self.captureOnCommitCallbacks(execute=True):
+            return RuleEvaluator().evaluate_rules_batch(list(processes))
+
+    def evaluate_in_context(self, process) -> list:
+        """上下文内评估（如表单保存后），返回本帧记录的命中"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with ProcessExecutionContext(process) as frame:
+                RuleEvaluator().evaluate_rules(frame)
+        return [entry['rule_id'] for entry in frame.events_triggered_log]
+
+    def sent_process_ids(self) -> list:
+        return [[kwargs['process_id'] for _, kwargs in batch] for batch in self.sent]
+
+    def test_repeated_sweep_does_not_refire(self):
+        first, second = self.make_process(), self.make_process()
+        self.assertEqual(self.sweep(first, second), 2)
+        # 两个进程的系统调用作为一个批次发布
+        self.assertEqual(self.sent_process_ids(), [[first.erpsys_id, second.erpsys_id]])
+
+        self.assertEqual(self.sweep(first, second), 0)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_state_change_fires_again(self):
+        process = self.make_process()
+        self.assertEqual(self.sweep(process), 1)
+        Process.objects.filter(pk=process.pk).update(state='RUNNING')
+        process.refresh_from_db()
+        self.assertEqual(self.sweep(process), 1)
+        self.assertEqual(self.sweep(process), 0)
+        self.assertEqual(
+            set(RuleFiring.objects.filter(process=process).values_list('process_state', flat=True)),
+            {'READY', 'RUNNING'},
+        )
+
+    def test_sweep_skips_rule_fired_in_context(self):
+        process = self.make_process()
+        self.assertEqual(self.evaluate_in_context(process), [self.rule.erpsys_id])
+        # 上下文内命中按保存的版本号记录，其后的批量评估读到同一版本、同一状态
+        self.assertTrue(RuleFiring.objects.filter(process=process, rule=self.rule.erpsys_id, snapshot_version=1).exists())
+        self.assertEqual(self.sweep(process), 0)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_context_skips_rule_fired_by_sweep(self):
+        process = self.make_process()
+        with ProcessExecutionContext(process):
+            pass
+        self.assertEqual(self.sweep(process), 1)
+
+        # 基于同一快照版本、同一状态的上下文内评估不再发出
+        self.assertEqual(self.evaluate_in_context(process), [])
+        self.assertEqual(len(self.sent), 1)
+
+        # 状态变化后可再次命中
+        process.state = 'RUNNING'
+        process.save()
+        self.assertEqual(self.evaluate_in_context(process), [self.rule.erpsys_id])
+        self.assertEqual(len(self.sent), 2)
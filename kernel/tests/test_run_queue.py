@@ -0,0 +1,144 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from kernel.models import Process
+from kernel.run_queue import PriorityAgingPolicy, RunQueue, StrictPriorityPolicy
+from kernel.tests.factories import make_operator, make_process
+
+from datetime import timedelta
+import random
+
+def ready(priority: int = 0, waited: float = 0, **kwargs) -> Process:
+    """就绪进程，waited 为已等待秒数"""
+    process = make_process(state='READY', priority=priority, **kwargs)
+    process.created_at = timezone.now() - timedelta(seconds=waited)
+    Process.objects.filter(pk=process.pk).update(created_at=process.created_at)
+    return process
+
+def ready_queue():
+    return Process.objects.filter(state='READY')
+
+def brute_aging(aging_step: float, limit: int) -> list:
+    """参照实现：对全部就绪进程计算有效优先级后排序"""
+    now = timezone.now()
+    rows = list(ready_queue().values_list('id', 'priority', 'created_at'))
+    rows.sort(key=lambda row: (-(row[1] + max((now - row[2]).total_seconds(), 0) / aging_step), row[0]))
+    return [row[0] for row in rows[:limit]]
+
+class DispatchPolicyTests(TestCase):
+    def test_strict_priority_then_arrival(self):
+        low = ready(priority=1, waited=100)
+        high_late = ready(priority=5, waited=1)
+        high_early = ready(priority=5, waited=10)
+        self.assertEqual(StrictPriorityPolicy().candidates(ready_queue(), 10), [high_early.id, high_late.id, low.id])
+        self.assertEqual(StrictPriorityPolicy().candidates(ready_queue(), 1), [high_early.id])
+
+    def test_levels_are_enumerated_in_descending_order(self):
+        for priority in (3, 0, 7, 3, 7, 1):
+            ready(priority=priority)
+        make_process(state='RUNNING', priority=9)
+        self.assertEqual(PriorityAgingPolicy.levels(ready_queue()), [7, 3, 1, 0])
+        self.assertEqual(PriorityAgingPolicy.levels(ready_queue().filter(priority__lt=3)), [1, 0])
+        self.assertEqual(PriorityAgingPolicy.levels(ready_queue().none()), [])
+
+    def test_aging_lets_long_waiting_low_priority_through(self):
+        policy = PriorityAgingPolicy(aging_step=10)
+        starving = ready(priority=0, waited=100)   # 有效优先级约 10
+        fresh = ready(priority=5, waited=0)        # 有效优先级约 5
+        self.assertEqual(policy.candidates(ready_queue(), 2), [starving.id, fresh.id])
+        self.assertEqual(policy.candidates(ready_queue(), 0), [])
+
+    def test_aging_matches_brute_force(self):
+        rng = random.Random(19)
+        for _ in range(60):
+            ready(priority=rng.choice([0, 1, 2, 5, 9]), waited=rng.randint(0, 600))
+        policy = PriorityAgingPolicy(aging_step=60)
+        for limit in (1, 3, 7, 20, 100):
+            with self.subTest(limit=limit):
+                self.assertEqual(policy.candidates(ready_queue(), limit), brute_aging(60, limit))
+
+    def test_aging_fetches_bounded_heads(self):
+        # 一个优先级独占前列：只按块续取该级，其它级只取首块
+        for _ in range(40):
+            ready(priority=9, waited=0)
+        for priority in (0, 1, 2, 3):
+            for _ in range(40):
+                ready(priority=priority, waited=0)
+        policy = PriorityAgingPolicy(aging_step=60)
+        with CaptureQueriesContext(connection) as queries:
+            ids = policy.candidates(ready_queue(), 10)
+        self.assertEqual(ids, brute_aging(60, 10))
+        # 5 级 + 末尾 1 次枚举，5 个首块，优先级 9 续取 4 块（块大小 2）
+        self.assertEqual(len(queries), 6 + 5 + 4)
+
+class RunQueueDispatchTests(TestCase):
+    def run_queue(self, **kwargs) -> RunQueue:
+        kwargs.setdefault('policy', StrictPriorityPolicy())
+        kwargs.setdefault('batch_size', 2)
+        kwargs.setdefault('max_batches', 10)
+        return RunQueue(**kwargs)
+
+    def states(self, *processes) -> list:
+        return [Process.objects.get(pk=process.pk).state for process in processes]
+
+    def test_dispatches_in_policy_order_across_batches(self):
+        processes = [ready(priority=priority) for priority in (1, 4, 2, 5, 3)]
+        changed = self.run_queue().dispatch()
+        self.assertEqual([process.priority for process in changed], [5, 4, 3, 2, 1])
+        self.assertEqual(self.states(*processes), ['RUNNING'] * 5)
+        self.assertTrue(all(process.start_time for process in changed))
+
+    def test_max_batches_bounds_one_tick(self):
+        for _ in range(5):
+            ready()
+        self.assertEqual(len(self.run_queue(max_batches=2).dispatch()), 4)
+        self.assertEqual(ready_queue().count(), 1)
+
+    def test_unallocated_process_waits_or_stays_ready(self):
+        unassigned = ready(priority=2)
+        assigned = ready(priority=1, operator=make_operator())
+        attempts = []
+
+        def refuse(process):
+            attempts.append(process.id)
+            return False
+
+        with mock.patch('kernel.run_queue.attempt_resource_allocation', side_effect=refuse):
+            changed = self.run_queue(batch_size=1).dispatch()
+        # 无操作员的进入 WAITING；已指定操作员的留在就绪队列，本次不再重复认领
+        self.assertEqual([process.id for process in changed], [unassigned.id])
+        self.assertEqual(self.states(unassigned, assigned), ['WAITING', 'READY'])
+        self.assertEqual(attempts, [unassigned.id, assigned.id])
+
+    def test_skipped_candidates_are_not_retried(self):
+        locked = ready(priority=9)
+        others = [ready(priority=1) for _ in range(3)]
+        claim = RunQueue._claim
+        candidate_batches = []
+
+        def claim_skipping_locked(queue, ids):
+            # 模拟 SKIP LOCKED：该进程被其它调度者锁定
+            candidate_batches.append(list(ids))
+            return [process for process in claim(queue, ids) if process.id != locked.id]
+
+        with mock.patch.object(RunQueue, '_claim', claim_skipping_locked):
+            changed = self.run_queue().dispatch()
+        self.assertEqual({process.id for process in changed}, {process.id for process in others})
+        self.assertEqual(self.states(locked), ['READY'])
+        self.assertEqual(sum(batch.count(locked.id) for batch in candidate_batches), 1)
+
+    def test_claim_keeps_candidate_order_and_drops_non_ready(self):
+        first, second, third = ready(), ready(), ready()
+        Process.objects.filter(pk=second.pk).update(state='RUNNING')
+        claimed = RunQueue()._claim([third.id, second.id, first.id])
+        self.assertEqual([process.id for process in claimed], [third.id, first.id])
+
+    def test_queryset_limits_dispatch_scope(self):
+        inside, outside = ready(), ready()
+        changed = self.run_queue(queryset=Process.objects.filter(pk=inside.pk)).dispatch()
+        self.assertEqual([process.id for process in changed], [inside.id])
+        self.assertEqual(self.states(outside), ['READY'])
@@ -0,0 +1,111 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from kernel.models import Organization, SchedulerLease
+from kernel.scheduler_cluster import (
+    LEADER_LEASE, MEMBER_PREFIX, SchedulerWorker, assign_partitions, partition_queryset,
+)
+from kernel.tests.factories import make_operator, make_process
+
+from datetime import timedelta
+
+class AssignPartitionsTests(SimpleTestCase):
+    def test_round_robin_over_sorted_members(self):
+        self.assertEqual(assign_partitions(['b', 'a', 'c'], 7), {'a': [0, 3, 6], 'b': [1, 4], 'c': [2, 5]})
+
+    def test_more_members_than_partitions(self):
+        self.assertEqual(assign_partitions(['a', 'b', 'c'], 2), {'a': [0], 'b': [1], 'c': []})
+
+    def test_no_members(self):
+        self.assertEqual(assign_partitions([], 4), {})
+
+@override_settings(KERNEL_SCHEDULER_PARTITIONS=4)
+class SchedulerClusterTests(TestCase):
+    def setUp(self):
+        self.first = SchedulerWorker(worker_id='scheduler-a')
+        self.second = SchedulerWorker(worker_id='scheduler-b')
+
+    def expire(self, name: str):
+        SchedulerLease.objects.filter(name=name).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_leader_lease_taken_over_after_expiry(self):
+        self.assertTrue(self.first.try_lead())
+        self.assertFalse(self.second.try_lead())
+        # 续租
+        self.assertTrue(self.first.try_lead())
+
+        self.expire(LEADER_LEASE)
+        self.assertTrue(self.second.try_lead())
+        self.assertFalse(self.first.try_lead())
+        self.assertEqual(SchedulerLease.objects.get(name=LEADER_LEASE).owner, 'scheduler-b')
+
+    def test_resign_releases_leader_lease(self):
+        self.first.heartbeat()
+        self.assertTrue(self.first.try_lead())
+        self.first.resign()
+        self.assertFalse(SchedulerLease.objects.filter(name=f'{MEMBER_PREFIX}scheduler-a').exists())
+        self.assertTrue(self.second.try_lead())
+
+    def test_rebalance_splits_partitions_among_live_members(self):
+        self.first.heartbeat()
+        self.second.heartbeat()
+        self.assertTrue(self.first.try_lead())
+
+        data = self.first.rebalance()
+        self.assertEqual(data['epoch'], 1)
+        self.assertEqual(self.first.partitions(), [0, 2])
+        self.assertEqual(self.second.partitions(), [1, 3])
+        # 分配不变时 epoch 不变
+        self.assertEqual(self.first.rebalance()['epoch'], 1)
+
+        # 成员租约过期后被清理，分区全部归存活成员
+        self.expire(f'{MEMBER_PREFIX}scheduler-b')
+        data = self.first.rebalance()
+        self.assertEqual(data['epoch'], 2)
+        self.assertEqual(self.first.partitions(), [0, 1, 2, 3])
+        self.assertEqual(self.second.partitions(), [])
+        self.assertFalse(SchedulerLease.objects.filter(name=f'{MEMBER_PREFIX}scheduler-b').exists())
+
+    def test_partition_count_change_waits_for_rebalance(self):
+        self.first.heartbeat()
+        self.first.try_lead()
+        self.first.rebalance()
+        with self.settings(KERNEL_SCHEDULER_PARTITIONS=8):
+            self.assertEqual(self.first.partitions(), [])
+            self.first.rebalance()
+            self.assertEqual(self.first.partitions(), list(range(8)))
+
+    def test_tick_without_partitions_returns_nothing(self):
+        self.first.heartbeat()
+        self.assertTrue(self.first.try_lead())
+        self.first.rebalance()
+        self.assertEqual(self.second.tick(), [])
+
+class PartitionQuerysetTests(TestCase):
+    def test_partition_by_id(self):
+        processes = [make_process() for _ in range(6)]
+        for partition in range(3):
+            with self.subTest(partition=partition):
+                ids = set(partition_queryset([partition], 3, 'id').values_list('id', flat=True))
+                self.assertEqual(ids, {process.id for process in processes if process.id % 3 == partition})
+
+    def test_partition_by_organization(self):
+        organizations = [Organization.objects.create(label=f'科室{i}') for i in range(2)]
+        with_organization = [make_process(operator=make_operator(f'员工{i}', organization=organization))
+                             for i, organization in enumerate(organizations)]
+        without_organization = make_process(operator=make_operator('访客'))
+        unassigned = make_process()
+
+        for partition in range(2):
+            with self.subTest(partition=partition):
+                expected = {process.id for process, organization in zip(with_organization, organizations)
+                            if organization.id % 2 == partition}
+                if partition == 0:
+                    # 无组织的进程归入分区0
+                    expected |= {without_organization.id, unassigned.id}
+                ids = set(partition_queryset([partition], 2, 'organization').values_list('id', flat=True))
+                self.assertEqual(ids, expected)
+
+    def test_unknown_partition_key(self):
+        with self.assertRaises(ValueError):
+            partition_queryset([0], 2, 'service')
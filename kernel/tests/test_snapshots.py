@@ -0,0 +1,184 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from jsonschema import ValidationError
+
+from kernel.models import Process, ProcessContextSnapshot, RuleFiring
+from kernel.snapshots import (
+    SNAPSHOT_DELTA, SNAPSHOT_FULL, compact_snapshots, encode_snapshot, load_latest_context_data, restore_snapshot,
+    serialize_context,
+)
+from kernel.sys_lib import ProcessExecutionContext
+from kernel.types import CanonicalJSON, CanonicalJSONEncoder, ProcessState
+from kernel.tests.factories import make_process
+
+import hashlib
+import json
+
+def context_versions(process, count: int) -> list:
+    """同一进程逐版本变化的上下文：局部变量递增、列表增长，另有不变的大字段使增量小于全量"""
+    return [
+        {'frames': [{
+            'process_id': process.erpsys_id,
+            'status': 'ACTIVE',
+            'parent': None,
+            'local_vars': {'step': version, 'history': list(range(version)), 'note': '备注' * 100},
+            'return_value': None,
+            'error_info': None,
+            'events_triggered_log': [{'rule_id': f'rule-{i}'} for i in range(version // 2)],
+        }]}
+        for version in range(1, count + 1)
+    ]
+
+def write_snapshots(process, contexts: list):
+    """按保存上下文时的方式逐版本写入快照"""
+    base = None
+    for version, data in enumerate(contexts, start=1):
+        canonical_text, context_hash = serialize_context(data)
+        ProcessContextSnapshot.objects.create(
+            process=process, version=version, context_hash=context_hash,
+            **encode_snapshot(version, data, base, canonical_text)
+        )
+        base = data
+
+def snapshot_types(process) -> list:
+    return list(ProcessContextSnapshot.objects.filter(process=process).order_by('version').values_list('snapshot_type', flat=True))
+
+class SerializeContextTests(SimpleTestCase):
+    def test_text_and_hash_come_from_one_canonical_encoding(self):
+        data = {'frames': [{'local_vars': {'b': 2, 'a': '中文', 'c': [3, {'z': None, 'y': 1.5}]}, 'status': 'ACTIVE'}]}
+        text, context_hash = serialize_context(data)
+        self.assertEqual(text, json.dumps(data, sort_keys=True))
+        # 哈希格式不变：与此前的 sort_keys 序列化后 sha256 一致，既有快照仍可比对
+        self.assertEqual(context_hash, hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest())
+        self.assertEqual(json.loads(text), data)
+
+    def test_key_order_does_not_change_hash(self):
+        first = {'frames': [{'a': 1, 'b': {'x': 1, 'y': 2}}]}
+        second = {'frames': [{'b': {'y': 2, 'x': 1}, 'a': 1}]}
+        self.assertEqual(serialize_context(first), serialize_context(second))
+        self.assertNotEqual(serialize_context(first)[1], serialize_context({'frames': [{'a': 2, 'b': {'x': 1, 'y': 2}}]})[1])
+
+    def test_validation_is_opt_in(self):
+        with self.assertRaises(ValidationError):
+            serialize_context({'stack': []}, validate=True)
+        # 可信写入方跳过校验
+        self.assertEqual(serialize_context({'stack': []})[0], '{"stack": []}')
+
+    def test_full_snapshot_stores_canonical_text_verbatim(self):
+        data = {'frames': [{'b': 1, 'a': 2}]}
+        text, _ = serialize_context(data)
+        fields = encode_snapshot(1, data, canonical_text=text)
+        self.assertEqual(fields['snapshot_type'], SNAPSHOT_FULL)
+        self.assertIsInstance(fields['context_data'], CanonicalJSON)
+        self.assertEqual(CanonicalJSONEncoder().encode(fields['context_data']), text)
+        # 其它值照常编码
+        self.assertEqual(CanonicalJSONEncoder().encode({'a': 1}), '{"a": 1}')
+
+class StoredContextHashTests(TestCase):
+    def test_saved_context_matches_its_hash(self):
+        process = make_process()
+        with ProcessExecutionContext(process) as frame:
+            frame.local_vars['note'] = '备注'
+        snapshot = ProcessContextSnapshot.objects.get(process=process)
+        self.assertEqual(snapshot.snapshot_type, SNAPSHOT_FULL)
+        self.assertEqual(snapshot.context_data['frames'][-1]['local_vars']['note'], '备注')
+        self.assertEqual(serialize_context(snapshot.context_data)[1], snapshot.context_hash)
+
+@override_settings(KERNEL_SNAPSHOT_KEYFRAME_INTERVAL=3)
+class DeltaSnapshotTests(TestCase):
+    def setUp(self):
+        self.process = make_process()
+        self.contexts = context_versions(self.process, 8)
+        write_snapshots(self.process, self.contexts)
+
+    def test_keyframe_every_interval_versions(self):
+        F, D = SNAPSHOT_FULL, SNAPSHOT_DELTA
+        self.assertEqual(snapshot_types(self.process), [F, D, D, F, D, D, F, D])
+
+    def test_every_version_restores_across_keyframe_boundaries(self):
+        for version, expected in enumerate(self.contexts, start=1):
+            with self.subTest(version=version):
+                data, restored_version, context_hash = restore_snapshot(self.process, version)
+                self.assertEqual(data, expected)
+                self.assertEqual(restored_version, version)
+                self.assertEqual(context_hash, serialize_context(expected)[1])
+
+        data, version, _ = restore_snapshot(self.process)
+        self.assertEqual((data, version), (self.contexts[-1], 8))
+        self.assertIsNone(restore_snapshot(self.process, 9))
+
+    def test_restore_after_keyframe_interval_changes(self):
+        # 间隔调小后最近的若干行里可能没有关键帧，回退为按关键帧查询
+        with self.settings(KERNEL_SNAPSHOT_KEYFRAME_INTERVAL=2):
+            for version, expected in enumerate(self.contexts, start=1):
+                with self.subTest(version=version):
+                    self.assertEqual(restore_snapshot(self.process, version)[0], expected)
+
+    def test_batch_load_returns_latest_versions(self):
+        other = make_process(name='另一进程')
+        other_contexts = context_versions(other, 5)
+        write_snapshots(other, other_contexts)
+        empty = make_process(name='无快照')
+
+        data, versions = load_latest_context_data([self.process.id, other.id, empty.id], with_versions=True)
+        self.assertEqual(data, {self.process.id: self.contexts[-1], other.id: other_contexts[-1]})
+        self.assertEqual(versions, {self.process.id: 8, other.id: 5})
+        self.assertEqual(load_latest_context_data([other.id]), {other.id: other_contexts[-1]})
+
+@override_settings(KERNEL_SNAPSHOT_KEYFRAME_INTERVAL=3)
+class CompactSnapshotTests(TestCase):
+    def setUp(self):
+        self.process = make_process()
+        self.contexts = context_versions(self.process, 8)
+        write_snapshots(self.process, self.contexts)
+
+    def versions(self, process) -> list:
+        return list(ProcessContextSnapshot.objects.filter(process=process).order_by('version').values_list('version', flat=True))
+
+    def test_keeps_latest_versions_restorable(self):
+        report = compact_snapshots(retain_versions=4)
+
+        self.assertEqual(report['processes'], 1)
+        self.assertEqual(report['rows_deleted'], 4)
+        self.assertGreater(report['bytes_reclaimed'], 0)
+        self.assertEqual(self.versions(self.process), [5, 6, 7, 8])
+        # 保留的最旧版本原为增量，改写为全量关键帧
+        self.assertEqual(snapshot_types(self.process)[0], SNAPSHOT_FULL)
+        for version in range(5, 9):
+            with self.subTest(version=version):
+                self.assertEqual(restore_snapshot(self.process, version)[0], self.contexts[version - 1])
+
+    def test_terminated_process_keeps_only_final_version(self):
+        Process.objects.filter(pk=self.process.pk).update(state=ProcessState.TERMINATED.name)
+        compact_snapshots(retain_versions=4)
+
+        self.assertEqual(self.versions(self.process), [8])
+        self.assertEqual(snapshot_types(self.process), [SNAPSHOT_FULL])
+        self.assertEqual(restore_snapshot(self.process)[0], self.contexts[-1])
+
+    def test_processes_within_retention_are_untouched(self):
+        report = compact_snapshots(retain_versions=8)
+        self.assertEqual(report, {'processes': 0, 'rows_deleted': 0, 'bytes_reclaimed': 0, 'firings_deleted': 0})
+        self.assertEqual(self.versions(self.process), list(range(1, 9)))
+
+        # 重复压缩是幂等的
+        compact_snapshots(retain_versions=4)
+        self.assertEqual(compact_snapshots(retain_versions=4)['rows_deleted'], 0)
+        self.assertEqual(self.versions(self.process), [5, 6, 7, 8])
+
+    def test_prunes_rule_firings_with_snapshots(self):
+        other = make_process(name='另一进程')
+        for process in (self.process, other):
+            RuleFiring.objects.bulk_create([
+                RuleFiring(process=process, rule='rule-1', snapshot_version=version, process_state='READY')
+                for version in range(1, 9)
+            ])
+        Process.objects.filter(pk=other.pk).update(state=ProcessState.TERMINATED.name)
+
+        report = compact_snapshots(retain_versions=4)
+        # 未终止进程保留与保留版本对应的命中记录；已终止进程（即使没有可压缩的快照）全部删除
+        self.assertEqual(
+            list(RuleFiring.objects.filter(process=self.process).order_by('snapshot_version').values_list('snapshot_version', flat=True)),
+            [5, 6, 7, 8],
+        )
+        self.assertFalse(RuleFiring.objects.filter(process=other).exists())
+        self.assertEqual(report['firings_deleted'], 12)
@@ -0,0 +1,205 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from kernel.sys_call_outbox import SYS_CALL_MODE_ASYNC, SYS_CALL_MODE_INLINE, sys_call_outbox
+from kernel.sys_lib import CALL_REGISTRY
+
+def call(name: str, process_id: str = 'p1') -> list:
+    return [name, {'process_id': process_id}]
+
+class Rollback(Exception):
+    pass
+
+class OutboxTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.sent = []
+        patcher = mock.patch.object(sys_call_outbox, '_publish', side_effect=self.sent.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def names(self) -> list:
+        return [[name for name, _ in batch] for batch in self.sent]
+
+class OutboxOutsideTransactionTests(OutboxTestMixin, SimpleTestCase):
+    def test_publishes_immediately(self):
+        sys_call_outbox.publish([call('a'), call('b')])
+        sys_call_outbox.publish([])
+        self.assertEqual(self.names(), [['a', 'b']])
+
+class OutboxTransactionTests(OutboxTestMixin, TestCase):
+    def test_one_message_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                sys_call_outbox.publish([call('a')])
+                sys_call_outbox.publish([call('b'), call('c')])
+                self.assertEqual(self.sent, [])
+        self.assertEqual(self.names(), [['a', 'b', 'c']])
+
+    def test_rolled_back_savepoint_drops_its_calls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                sys_call_outbox.publish([call('a')])
+                try:
+                    with transaction.atomic():
+                        sys_call_outbox.publish([call('b')])
+                        raise Rollback()
+                except Rollback:
+                    pass
+                sys_call_outbox.publish([call('c')])
+        self.assertEqual(self.names(), [['a', 'c']])
+
+    def test_released_savepoint_keeps_its_calls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                sys_call_outbox.publish([call('a')])
+                with transaction.atomic():
+                    sys_call_outbox.publish([call('b')])
+                sys_call_outbox.publish([call('c')])
+        # 已释放保存点的消息与外层合并为一条消息
+        self.assertEqual(self.names(), [['a', 'b', 'c']])
+
+    def test_trailing_rolled_back_savepoint_still_flushes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                sys_call_outbox.publish([call('a')])
+                with transaction.atomic():
+                    sys_call_outbox.publish([call('b')])
+                try:
+                    with transaction.atomic():
+                        sys_call_outbox.publish([call('c')])
+                        raise Rollback()
+                except Rollback:
+                    pass
+        self.assertEqual(self.names(), [['a', 'b']])
+
+    def test_rolled_back_transaction_sends_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    sys_call_outbox.publish([call('a')])
+                    raise Rollback()
+            except Rollback:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.sent, [])
+
+        # 回滚事务的消息不会混入下一个事务
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                sys_call_outbox.publish([call('b')])
+        self.assertEqual(self.names(), [['b']])
+
+    def test_end_stamps_snapshot_version_for_own_process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer = sys_call_outbox.begin()
+            sys_call_outbox.publish([call('a', 'p1'), call('b', 'p2'), ['c', {'process_id': 'p1', 'snapshot_version': 2}]])
+            self.assertEqual(self.sent, [])
+            sys_call_outbox.end(buffer, process_id='p1', snapshot_version=3)
+        self.assertEqual(self.sent, [[
+            ['a', {'process_id': 'p1', 'snapshot_version': 3}],
+            ['b', {'process_id': 'p2'}],
+            ['c', {'process_id': 'p1', 'snapshot_version': 2}],
+        ]])
+        self.assertEqual(sys_call_outbox._buffers(), [])
+
+    def test_nested_context_hands_calls_to_outer_buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            outer = sys_call_outbox.begin()
+            inner = sys_call_outbox.begin()
+            sys_call_outbox.publish([call('a', 'p2')])
+            sys_call_outbox.end(inner, process_id='p2', snapshot_version=5)
+            self.assertEqual(outer, [['a', {'process_id': 'p2', 'snapshot_version': 5}]])
+            sys_call_outbox.end(outer, process_id='p1', snapshot_version=1)
+        self.assertEqual(self.names(), [['a']])
+
+    def test_discard_drops_buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer = sys_call_outbox.begin()
+            sys_call_outbox.publish([call('a')])
+            sys_call_outbox.discard(buffer)
+            sys_call_outbox.publish([call('b')])
+        self.assertEqual(self.names(), [['b']])
+        self.assertEqual(sys_call_outbox._buffers(), [])
+
+class AsyncCall:
+    """声明为总是异步执行的系统调用"""
+    run_async = True
+
+@override_settings(KERNEL_SYS_CALL_MODE=SYS_CALL_MODE_INLINE, KERNEL_SYS_CALL_INLINE_DEPTH=3, KERNEL_SYS_CALL_INLINE_BUDGET=0.5)
+class InlineExecutionTests(OutboxTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ran = []
+        patcher = mock.patch('kernel.sys_lib.run_sys_calls', side_effect=self.run_calls)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.follow_up = None
+
+    def run_calls(self, calls):
+        """内联执行：记录调用与当时的嵌套深度，按需产生后续调用"""
+        for name, _ in calls:
+            self.ran.append((name, sys_call_outbox._local.depth))
+            if self.follow_up:
+                sys_call_outbox.publish(self.follow_up(name))
+        return []
+
+    def test_runs_inline_only_inside_chain(self):
+        sys_call_outbox.publish([call('start_service')])
+        self.assertEqual(self.names(), [['start_service']])
+        self.assertEqual(self.ran, [])
+
+        inline_calls = sys_call_outbox.inline_calls
+        with sys_call_outbox.inline_chain():
+            sys_call_outbox.publish([call('start_service')])
+        self.assertEqual(self.ran, [('start_service', 1)])
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(sys_call_outbox.inline_calls, inline_calls + 1)
+
+    def test_async_mode_never_runs_inline(self):
+        with self.settings(KERNEL_SYS_CALL_MODE=SYS_CALL_MODE_ASYNC):
+            with sys_call_outbox.inline_chain():
+                sys_call_outbox.publish([call('start_service')])
+        self.assertEqual(self.names(), [['start_service']])
+        self.assertEqual(self.ran, [])
+
+    def test_depth_limit_hands_rest_to_celery(self):
+        # 每个内联调用产生下一步调用：a0 -> a1 -> a2 -> a3
+        self.follow_up = lambda name: [call(f'a{int(name[1:]) + 1}')]
+        with sys_call_outbox.inline_chain():
+            sys_call_outbox.publish([call('a0')])
+        self.assertEqual(self.ran, [('a0', 1), ('a1', 2), ('a2', 3)])
+        self.assertEqual(self.names(), [['a3']])
+        self.assertEqual(sys_call_outbox._local.depth, 0)
+
+    def test_time_budget_cutoff(self):
+        clock = [100.0]
+        with mock.patch('kernel.sys_call_outbox.time') as fake_time:
+            fake_time.monotonic.side_effect = lambda: clock[0]
+            with sys_call_outbox.inline_chain():
+                sys_call_outbox.publish([call('a')])
+                clock[0] += 0.4
+                sys_call_outbox.publish([call('b')])
+                clock[0] += 0.2
+                sys_call_outbox.publish([call('c')])
+            # 链路结束后重新开始计时
+            with sys_call_outbox.inline_chain():
+                sys_call_outbox.publish([call('d')])
+        self.assertEqual([name for name, _ in self.ran], ['a', 'b', 'd'])
+        self.assertEqual(self.names(), [['c']])
+
+    def test_run_async_calls_go_to_celery(self):
+        with mock.patch.dict(CALL_REGISTRY, {'notify': AsyncCall}):
+            with sys_call_outbox.inline_chain():
+                sys_call_outbox.publish([
+                    call('start_service'),
+                    call('notify'),
+                    ['start_service', {'process_id': 'p2', 'run_async': True}],
+                ])
+        self.assertEqual(self.ran, [('start_service', 1)])
+        self.assertEqual(self.sent, [[
+            ['notify', {'process_id': 'p1'}],
+            ['start_service', {'process_id': 'p2', 'run_async': True}],
+        ]])
@@ -0,0 +1,303 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from kernel import task_stream
+from kernel.task_stream import ROW_KEY, ROW_SERVICE, FilteredStreamView, TaskListStream
+
+import copy
+import random
+import threading
+import time
+
+def make_lists(*rows_per_list, title='待办任务') -> list:
+    """构造任务列表：每个列表的行以 (键, 值) 给出"""
+    return [
+        {'title': f'{title}{i}', 'task_list': [{ROW_KEY: key, 'value': value} for key, value in rows]}
+        for i, rows in enumerate(rows_per_list)
+    ]
+
+def apply_delta(lists: list, message: dict) -> list:
+    """按客户端（static/js/task_list_stream.js）相同的顺序应用增量：删除、原位更新、按下标插入、整体排序"""
+    lists = copy.deepcopy(lists)
+    for change in message['lists']:
+        removed = set(change['remove'])
+        rows = [row for row in lists[change['list']]['task_list'] if row[ROW_KEY] not in removed]
+        for item in change['upsert']:
+            keys = [row[ROW_KEY] for row in rows]
+            if item['row'][ROW_KEY] in keys:
+                rows[keys.index(item['row'][ROW_KEY])] = item['row']
+            else:
+                rows.insert(item['index'], item['row'])
+        if 'order' in change:
+            by_key = {row[ROW_KEY]: row for row in rows}
+            rows = [by_key[key] for key in change['order'] if key in by_key]
+        lists[change['list']]['task_list'] = rows
+    return lists
+
+class TaskListDiffTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = TaskListStream('test_operator_1', 'send_task_list')
+
+    def test_first_publish_is_snapshot(self):
+        lists = make_lists([('a', 1), ('b', 2)])
+        snapshot = self.stream.publish(lists)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['seq'], 1)
+        self.assertEqual(snapshot['lists'], lists)
+
+    def test_unchanged_publish_keeps_seq(self):
+        lists = make_lists([('a', 1), ('b', 2)])
+        first = self.stream.publish(lists)
+        second = self.stream.publish(copy.deepcopy(lists))
+        self.assertEqual((second['epoch'], second['seq']), (first['epoch'], first['seq']))
+        self.assertEqual(self.stream.missed_since(f"{first['epoch']}:{first['seq']}"), [])
+
+    def test_delta_carries_only_changed_rows(self):
+        snapshot = self.stream.publish(make_lists([('a', 1), ('b', 2), ('c', 3)], [('x', 1)]))
+        self.stream.publish(make_lists([('a', 1), ('b', 20), ('d', 4)], [('x', 1)]))
+        [delta] = self.stream.missed_since(f"{snapshot['epoch']}:{snapshot['seq']}")
+
+        self.assertEqual((delta['type'], delta['seq'], delta['base']), ('delta', 2, 1))
+        # 未变化的第二个列表不出现在增量中
+        self.assertEqual(delta['lists'], [{
+            'list': 0,
+            'upsert': [{'index': 1, 'row': {ROW_KEY: 'b', 'value': 20}}, {'index': 2, 'row': {ROW_KEY: 'd', 'value': 4}}],
+            'remove': ['c'],
+        }])
+
+    def test_order_sent_only_when_relative_order_changes(self):
+        snapshot = self.stream.publish(make_lists([('a', 1), ('b', 2), ('c', 3)]))
+        self.stream.publish(make_lists([('c', 3), ('a', 1), ('b', 2)]))
+        [delta] = self.stream.missed_since(f"{snapshot['epoch']}:{snapshot['seq']}")
+        self.assertEqual(delta['lists'], [{'list': 0, 'upsert': [], 'remove': [], 'order': ['c', 'a', 'b']}])
+
+    def test_client_replay_matches_published_lists(self):
+        rng = random.Random(13)
+        keys = [f'p{i}' for i in range(12)]
+        current = make_lists([(key, 0) for key in keys[:5]], [(key, 0) for key in keys[5:8]])
+        snapshot = self.stream.publish(current)
+        client, token = snapshot['lists'], f"{snapshot['epoch']}:{snapshot['seq']}"
+
+        for _ in range(40):
+            rows_per_list = []
+            for task_list in current:
+                rows = [(row[ROW_KEY], row['value']) for row in task_list['task_list']]
+                rows = [(key, rng.randint(0, 2) if rng.random() < 0.3 else value) for key, value in rows if rng.random() > 0.15]
+                for key in rng.sample(keys, 2):
+                    if key not in dict(rows):
+                        rows.insert(rng.randint(0, len(rows)), (key, 0))
+                if rng.random() < 0.3:
+                    rng.shuffle(rows)
+                rows_per_list.append(rows)
+            current = make_lists(*rows_per_list)
+            self.stream.publish(current)
+
+            for message in self.stream.missed_since(token):
+                client = apply_delta(client, message)
+                token = f"{message['epoch']}:{message['seq']}"
+            self.assertEqual(client, current)
+
+    def test_structure_change_publishes_snapshot(self):
+        first = self.stream.publish(make_lists([('a', 1)]))
+        second = self.stream.publish(make_lists([('a', 1)], title='已办任务'))
+        self.assertEqual(second['epoch'], first['epoch'])
+        self.assertEqual(second['seq'], first['seq'] + 1)
+        # 全量之后旧序号无法衔接
+        self.assertIsNone(self.stream.missed_since(f"{first['epoch']}:{first['seq']}"))
+
+class ResumeTokenTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = TaskListStream('test_operator_2', 'send_task_list')
+
+    def publish_values(self, *values) -> list:
+        """依次发布只改变一行值的列表，返回各次发布后的续传令牌"""
+        tokens = []
+        for value in values:
+            snapshot = self.stream.publish(make_lists([('a', value), ('b', 0)]))
+            tokens.append(f"{snapshot['epoch']}:{snapshot['seq']}")
+        return tokens
+
+    def test_returns_missed_deltas_in_order(self):
+        tokens = self.publish_values(0, 1, 2, 3)
+        missed = self.stream.missed_since(tokens[0])
+        self.assertEqual([(message['base'], message['seq']) for message in missed], [(1, 2), (2, 3), (3, 4)])
+        self.assertEqual([message['lists'][0]['upsert'][0]['row']['value'] for message in missed], [1, 2, 3])
+        self.assertEqual([message['seq'] for message in self.stream.missed_since(tokens[2])], [4])
+
+    def test_current_token_returns_empty_list(self):
+        tokens = self.publish_values(0, 1)
+        self.assertEqual(self.stream.missed_since(tokens[-1]), [])
+
+    @override_settings(KERNEL_TASK_STREAM_BUFFER=2)
+    def test_buffer_overflow_falls_back_to_snapshot(self):
+        tokens = self.publish_values(0, 1, 2, 3)
+        # 缓冲只保留最后两条增量（seq 3、4）
+        self.assertIsNone(self.stream.missed_since(tokens[0]))
+        self.assertEqual([message['seq'] for message in self.stream.missed_since(tokens[1])], [3, 4])
+
+    def test_snapshot_in_between_falls_back_to_snapshot(self):
+        tokens = self.publish_values(0, 1)
+        self.stream.publish(make_lists([('a', 1), ('b', 0)], title='已办任务'))
+        self.stream.publish(make_lists([('a', 2), ('b', 0)], title='已办任务'))
+        self.assertIsNone(self.stream.missed_since(tokens[0]))
+        self.assertIsNone(self.stream.missed_since(tokens[1]))
+
+    def test_invalid_tokens(self):
+        [token] = self.publish_values(0)
+        epoch, seq = token.rsplit(':', 1)
+        for bad in (None, '', 'no-seq', f'{epoch}:x', f'other:{seq}', f'{epoch}:{int(seq) + 1}'):
+            with self.subTest(token=bad):
+                self.assertIsNone(self.stream.missed_since(bad))
+
+    def test_unknown_stream_returns_none(self):
+        [token] = self.publish_values(0)
+        self.assertIsNone(TaskListStream('test_operator_3', 'send_task_list').missed_since(token))
+
+class SlowStateCache:
+    """读取流状态后稍作停顿，放大并发发布者读-改-写之间的竞争窗口"""
+    def __init__(self, inner):
+        self.inner = inner
+
+    def get(self, key, *args, **kwargs):
+        value = self.inner.get(key, *args, **kwargs)
+        time.sleep(0.05)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+class ConcurrentPublishTests(SimpleTestCase):
+    def test_racing_publishers_get_distinct_seqs(self):
+        stream = TaskListStream('test_operator_4', 'send_task_list')
+        base = stream.publish(make_lists([('a', 0), ('b', 0)]))
+        variants = [make_lists([('a', 1), ('b', 0)]), make_lists([('a', 0), ('b', 2), ('c', 3)])]
+
+        results = [None] * len(variants)
+        barrier = threading.Barrier(len(variants))
+
+        def publish(i):
+            barrier.wait()
+            results[i] = TaskListStream('test_operator_4', 'send_task_list').publish(variants[i])
+
+        with mock.patch.object(task_stream, 'cache', SlowStateCache(cache)):
+            threads = [threading.Thread(target=publish, args=(i,)) for i in range(len(variants))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # 两次发布串行：序号各不相同且前后衔接
+        self.assertEqual(sorted(result['seq'] for result in results), [2, 3])
+        missed = stream.missed_since(f"{base['epoch']}:{base['seq']}")
+        self.assertEqual([(message['base'], message['seq']) for message in missed], [(1, 2), (2, 3)])
+
+        # 按序应用两条增量的客户端与最后一次发布的列表一致
+        client = base['lists']
+        for message in missed:
+            client = apply_delta(client, message)
+        last = max(range(len(variants)), key=lambda i: results[i]['seq'])
+        self.assertEqual(client, variants[last])
+
+def service_lists(*rows_per_list) -> list:
+    """公共任务列表：每行以 (键, 服务id, 值) 给出"""
+    return [
+        {'title': f'公共任务{i}', 'task_list': [{ROW_KEY: key, ROW_SERVICE: service, 'value': value} for key, service, value in rows]}
+        for i, rows in enumerate(rows_per_list)
+    ]
+
+def visible_to(services: set):
+    return lambda row: row.get(ROW_SERVICE) in services
+
+def filter_lists(lists: list, visible) -> list:
+    return [dict(task_list, task_list=[row for row in task_list['task_list'] if visible(row)]) for task_list in lists]
+
+class FilteredStreamViewTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = TaskListStream('test_public', 'send_public_task_list', keep_snapshot=True)
+
+    def test_each_subscriber_replays_its_filtered_lists(self):
+        rng = random.Random(18)
+        keys = [f'p{i}' for i in range(14)]
+        current = service_lists([(key, rng.randint(1, 3), 0) for key in keys[:6]], [(key, 1, 0) for key in keys[6:9]])
+        snapshot = self.stream.publish(current)
+        token = f"{snapshot['epoch']}:{snapshot['seq']}"
+
+        subscribers = []
+        for services in ({1}, {1, 2}, {3}, set()):
+            view = FilteredStreamView(visible_to(services))
+            subscribers.append((services, view, view.apply(snapshot)['lists']))
+
+        for _ in range(50):
+            rows_per_list = []
+            for task_list in current:
+                rows = [(row[ROW_KEY], row[ROW_SERVICE], row['value']) for row in task_list['task_list'] if rng.random() > 0.15]
+                # 改值或改派服务（可见性随之翻转）
+                rows = [
+                    (key, rng.randint(1, 3) if rng.random() < 0.2 else service, rng.randint(0, 2) if rng.random() < 0.3 else value)
+                    for key, service, value in rows
+                ]
+                present = {key for key, _, _ in rows}
+                for key in rng.sample(keys, 2):
+                    if key not in present:
+                        rows.insert(rng.randint(0, len(rows)), (key, rng.randint(1, 3), 0))
+                if rng.random() < 0.3:
+                    rng.shuffle(rows)
+                rows_per_list.append(rows)
+            current = service_lists(*rows_per_list)
+            self.stream.publish(current)
+
+            missed = self.stream.missed_since(token)
+            for message in missed:
+                token = f"{message['epoch']}:{message['seq']}"
+            for i, (services, view, client) in enumerate(subscribers):
+                for message in missed:
+                    filtered = view.apply(message)
+                    # 过滤后无变化也下发（可能为空），保持序号连续
+                    self.assertEqual((filtered['seq'], filtered['base']), (message['seq'], message['base']))
+                    client = apply_delta(client, filtered)
+                subscribers[i] = (services, view, client)
+                self.assertEqual(client, filter_lists(current, visible_to(services)), services)
+
+    def test_invisible_change_is_sent_empty(self):
+        snapshot = self.stream.publish(service_lists([('a', 1, 0), ('b', 2, 0)]))
+        view = FilteredStreamView(visible_to({1}))
+        self.assertEqual(view.apply(snapshot)['lists'], service_lists([('a', 1, 0)]))
+
+        self.stream.publish(service_lists([('a', 1, 0), ('b', 2, 5)]))
+        [delta] = self.stream.missed_since(f"{snapshot['epoch']}:{snapshot['seq']}")
+        filtered = view.apply(delta)
+        self.assertEqual((filtered['seq'], filtered['lists']), (delta['seq'], []))
+        self.assertEqual(view.seq, delta['seq'])
+
+    def test_reassigned_row_appears_and_disappears(self):
+        snapshot = self.stream.publish(service_lists([('a', 1, 0), ('b', 2, 0), ('c', 1, 0)]))
+        view = FilteredStreamView(visible_to({1}))
+        client = view.apply(snapshot)['lists']
+
+        self.stream.publish(service_lists([('a', 2, 0), ('b', 1, 0), ('c', 1, 0)]))
+        [delta] = self.stream.missed_since(f"{snapshot['epoch']}:{snapshot['seq']}")
+        filtered = view.apply(delta)
+        self.assertEqual(filtered['lists'], [{
+            'list': 0,
+            'upsert': [{'index': 0, 'row': {ROW_KEY: 'b', ROW_SERVICE: 1, 'value': 0}}],
+            'remove': ['a'],
+        }])
+        self.assertEqual(apply_delta(client, filtered), service_lists([('b', 1, 0), ('c', 1, 0)]))
+
+    def test_stale_and_out_of_sync_messages(self):
+        snapshot = self.stream.publish(service_lists([('a', 1, 0)]))
+        view = FilteredStreamView(visible_to({1}))
+        view.apply(snapshot)
+        self.stream.publish(service_lists([('a', 1, 1)]))
+        self.stream.publish(service_lists([('a', 1, 2)]))
+        first, second = self.stream.missed_since(f"{snapshot['epoch']}:{snapshot['seq']}")
+
+        # 跳过一条增量：视图失步，下发空增量，客户端据 base 请求全量
+        self.assertEqual(view.apply(second)['lists'], [])
+        self.assertIsNone(view.seq)
+        self.assertEqual(view.apply(first)['lists'], [])
+
+        view.apply(self.stream.snapshot())
+        self.assertIsNone(view.apply(second))
@@ -0,0 +1,164 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from kernel.models import SchedulerLease
+from kernel.sys_call_outbox import sys_call_outbox
+from kernel.sys_lib import ProcessCreator, RuleEvaluator
+from kernel.tests.factories import make_operator, make_process, make_rule, make_service
+from kernel.timer_wheel import (
+    GENERATION_KEY, TIMER_LEASE, TIMER_SCHEDULED, TimerQueue, TimerWheelWorker, notify_timer_changed,
+)
+
+from datetime import datetime, timedelta
+import random
+
+BASE = datetime(2024, 1, 1, 8, 0)
+
+def at(seconds: float) -> datetime:
+    return BASE + timedelta(seconds=seconds)
+
+class TimerQueueTests(SimpleTestCase):
+    def test_pop_due_in_order_after_reschedule_and_cancel(self):
+        rng = random.Random(23)
+        queue, expected = TimerQueue(), {}
+        for _ in range(2000):
+            key = rng.randrange(200)
+            if rng.random() < 0.2:
+                queue.cancel(key)
+                expected.pop(key, None)
+            else:
+                due = at(rng.randint(0, 100))
+                queue.schedule(key, due)
+                expected[key] = due
+        self.assertEqual(len(queue), len(expected))
+
+        now = at(60)
+        batches = []
+        while True:
+            batch = queue.pop_due(now, limit=25)
+            if not batch:
+                break
+            batches.append(batch)
+        popped = [item for batch in batches for item in batch]
+
+        self.assertEqual([due for _, due in popped], sorted(due for _, due in popped))
+        self.assertEqual(len({key for key, _ in popped}), len(popped))
+        self.assertEqual(dict(popped), {key: due for key, due in expected.items() if due <= now})
+        # 同一时刻到期的定时器不跨批次
+        for previous, following in zip(batches, batches[1:]):
+            self.assertLess(previous[-1][1], following[0][1])
+
+        remaining = {key: due for key, due in expected.items() if due > now}
+        self.assertEqual(len(queue), len(remaining))
+        self.assertEqual(queue.next_due(), min(remaining.values()))
+
+    def test_equal_due_group_is_popped_together(self):
+        queue = TimerQueue()
+        for key in range(5):
+            queue.schedule(('early', key), at(1))
+        for key in range(30):
+            queue.schedule(('group', key), at(2))
+        queue.schedule('late', at(3))
+
+        batch = queue.pop_due(at(10), limit=10)
+        self.assertEqual(len(batch), 35)
+        self.assertEqual(queue.pop_due(at(10), limit=10), [('late', at(3))])
+        self.assertIsNone(queue.next_due())
+
+class TimerWheelWorkerTests(TestCase):
+    def setUp(self):
+        self.worker = TimerWheelWorker(worker_id='test-timer-wheel')
+        self.fired = []
+        patcher = mock.patch.object(RuleEvaluator, 'evaluate_timers', side_effect=self.record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, timers) -> int:
+        self.fired.append([(process.id, extra['timer']) for process, extra in timers])
+        return 0
+
+    def stored_watermark(self):
+        return parse_datetime(SchedulerLease.objects.get(name=TIMER_LEASE).data['watermark'])
+
+    def test_watermark_and_late_timers(self):
+        self.assertTrue(self.worker.acquire())
+        t0 = self.worker.watermark
+        p1 = make_process(scheduled_time=t0 + timedelta(seconds=1))
+        p2 = make_process(scheduled_time=t0 + timedelta(seconds=3))
+        self.worker.reload(t0)
+
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=2)), 1)
+        self.assertEqual(self.fired, [[(p1.id, TIMER_SCHEDULED)]])
+        self.assertEqual(self.worker.watermark, p1.scheduled_time)
+        self.assertEqual(self.stored_watermark(), p1.scheduled_time)
+
+        # 同步时已过期：晚于补发下界的立即补发，早于下界的不再补发
+        p3 = make_process(scheduled_time=t0 + timedelta(seconds=0.5))
+        make_process(scheduled_time=t0 - timedelta(seconds=10))
+        notify_timer_changed()
+        self.worker.sync()
+
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=2)), 1)
+        self.assertEqual(self.fired[-1], [(p3.id, TIMER_SCHEDULED)])
+        # 补发的定时器早于水位线，水位线不回退
+        self.assertEqual(self.worker.watermark, p1.scheduled_time)
+
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=4)), 1)
+        self.assertEqual(self.fired[-1], [(p2.id, TIMER_SCHEDULED)])
+        self.assertEqual(self.worker.watermark, p2.scheduled_time)
+
+        # 重新装载与同步都不会再次触发已触发的定时器
+        notify_timer_changed()
+        self.worker.sync()
+        self.worker.reload(t0 + timedelta(seconds=4))
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=4)), 0)
+        self.assertEqual(len(self.fired), 3)
+
+    def test_rescheduled_timer_fires_at_new_time(self):
+        self.assertTrue(self.worker.acquire())
+        t0 = self.worker.watermark
+        process = make_process(scheduled_time=t0 + timedelta(seconds=1))
+        self.worker.reload(t0)
+
+        process.scheduled_time = t0 + timedelta(seconds=5)
+        process.save()
+        notify_timer_changed()
+        self.worker.sync()
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=2)), 0)
+        self.assertEqual(self.worker.fire_due(t0 + timedelta(seconds=6)), 1)
+
+    def test_steps_down_when_lease_taken_over(self):
+        worker = TimerWheelWorker(worker_id='test-timer-wheel', batch_size=1)
+        self.assertTrue(worker.acquire())
+        t0 = worker.watermark
+        p1 = make_process(scheduled_time=t0 + timedelta(seconds=1))
+        make_process(scheduled_time=t0 + timedelta(seconds=2))
+        worker.reload(t0)
+
+        # 租约过期后被其它实例接任，本实例尚未察觉
+        SchedulerLease.objects.filter(name=TIMER_LEASE).update(owner='other-timer-wheel')
+        self.assertEqual(worker.fire_due(t0 + timedelta(seconds=3)), 1)
+        self.assertEqual(self.fired, [[(p1.id, TIMER_SCHEDULED)]])
+        self.assertFalse(worker.is_leader)
+        self.assertEqual(len(worker.queue), 0)
+        self.assertEqual(worker.watermark, t0)
+        self.assertNotIn('watermark', SchedulerLease.objects.get(name=TIMER_LEASE).data or {})
+
+class BulkCreateTimerTests(TestCase):
+    def test_bulk_create_with_scheduled_time_notifies_on_commit(self):
+        program, service, operator = make_service('体检流程'), make_service('复诊'), make_operator()
+        rule = make_rule(program, service, "process_state == 'TERMINATED'")
+        common = {'service_rule': rule, 'service': service}
+        variants = [{'operator': operator, 'scheduled_time': timezone.now() + timedelta(days=i)} for i in (1, 2)]
+
+        generation = cache.get(GENERATION_KEY, 0)
+        with mock.patch.object(sys_call_outbox, '_publish'):
+            with self.captureOnCommitCallbacks(execute=True):
+                processes = ProcessCreator(need_business_record=False).create_processes_bulk(common, variants)
+                self.assertEqual(cache.get(GENERATION_KEY, 0), generation)
+        self.assertEqual(cache.get(GENERATION_KEY, 0), generation + 1)
+        self.assertEqual([process.scheduled_time for process in processes], [variant['scheduled_time'] for variant in variants])
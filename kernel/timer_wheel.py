@@ -0,0 +1,362 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, List, Optional, Tuple
+import heapq
+import os
+import socket
+import time
+import uuid
+
+from kernel.models import Process, SchedulerLease
+from kernel.types import ProcessState
+from kernel.sys_lib import RuleEvaluator
+from kernel.scheduler_cluster import try_acquire_lease
+
+# ================ 定时器引擎 ================
+# 进程的定时器由其计划时间派生：
+#   - scheduled：到达 Process.scheduled_time；
+#   - window_end：时间窗结束，即 scheduled_time + time_window。
+# 定时器到期时以定时事件（Event.is_timer）的规则评估该进程，表达式可访问 timer、timer_due、timer_fired_at。
+# 引擎运行在独立的工作进程（manage.py run_timer_wheel）中，只有持有租约 'timer:wheel' 的一个实例触发：
+#   - 内存中只装载未来 KERNEL_TIMER_HORIZON 秒内到期的定时器（按计划时间索引范围查询），随时间推进续装；
+#   - 最小堆按到期时间排列，睡眠到最早的到期时间，同一时刻到期的定时器合批评估；
+#   - 进程计划时间变更后递增共享代数，引擎按更新时间增量同步；触发前再按数据库中的当前计划复核；
+#   - 装载或同步到时已过期（不晚于水位线）且未触发过的定时器立即补发，补发期限为 KERNEL_TIMER_LATE_LIMIT 秒；
+#     本实例触发过的定时器记在内存中，期限内重复装载不会再次触发；接任时水位线之前的定时器视为已由前任处理；
+#   - 已触发的水位线保存在租约的 data 中，重启或接任后从水位线重新装载，期间错过的定时器随即补发。
+# 定时器不再对应 Celery beat 的 PeriodicTask 行，数十万个待触发定时器只占用装载窗口内的内存。
+TIMER_LEASE = 'timer:wheel'
+GENERATION_KEY = 'kernel:timer_wheel:generation'
+# 定时器租约抢占的PostgreSQL咨询锁键
+TIMER_ADVISORY_LOCK = 0x74696d72  # 'timr'
+
+TIMER_SCHEDULED = 'scheduled'
+TIMER_WINDOW_END = 'window_end'
+
+# 增量同步按更新时间回看的余量，覆盖保存后稍晚提交的事务
+SYNC_SLACK = timedelta(seconds=5)
+
+TimerKey = Tuple[int, str]  # (进程id, 定时器类型)
+
+def process_deadlines(scheduled_time: Optional[datetime], time_window: Optional[timedelta]) -> Dict[str, datetime]:
+    """由计划时间与时间窗派生进程的定时器：{定时器类型: 到期时间}"""
+    if scheduled_time is None:
+        return {}
+    deadlines = {TIMER_SCHEDULED: scheduled_time}
+    if time_window:
+        deadlines[TIMER_WINDOW_END] = scheduled_time + time_window
+    return deadlines
+
+class TimerQueue:
+    """
+    定时器队列：最小堆 + 当前到期时间表。
+    改期或取消只更新到期时间表，堆中的旧条目在弹出时按表比对后丢弃（惰性删除）；
+    过期条目超过有效条目时整体重建堆，内存与有效定时器数成正比。
+    """
+    def __init__(self):
+        self._heap = []
+        self._deadlines: Dict[Hashable, datetime] = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def clear(self):
+        self._heap = []
+        self._deadlines = {}
+
+    def schedule(self, key, due: datetime):
+        """设置定时器的到期时间（新增或改期）"""
+        if self._deadlines.get(key) == due:
+            return
+        self._deadlines[key] = due
+        heapq.heappush(self._heap, (due, key))
+        self._compact()
+
+    def cancel(self, key):
+        if self._deadlines.pop(key, None) is not None:
+            self._compact()
+
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(due, key) for key, due in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def _discard_stale(self):
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def next_due(self) -> Optional[datetime]:
+        """最早的到期时间，队列为空时返回 None"""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime, limit: int = None) -> List[Tuple[Hashable, datetime]]:
+        """
+        按到期时间顺序弹出不晚于 now 的定时器，最多约 limit 个；
+        与最后一个同一时刻到期的定时器一并弹出，保证水位线之前的定时器都已弹出。
+        """
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            if limit is not None and len(due) >= limit and self._heap[0][0] != due[-1][1]:
+                break
+            when, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append((key, when))
+        return due
+
+def pending_timer_queryset():
+    """可能有待触发定时器的进程：已设置计划时间且未终止"""
+    return Process.objects.filter(scheduled_time__isnull=False).exclude(state=ProcessState.TERMINATED.name)
+
+class TimerWheelWorker:
+    """定时器引擎工作者：持有租约时装载、同步并触发定时器"""
+    def __init__(self, worker_id: str = None, horizon: float = None, batch_size: int = None, poll_interval: float = None):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.horizon = timedelta(seconds=horizon or getattr(settings, 'KERNEL_TIMER_HORIZON', 300))
+        self.batch_size = batch_size or getattr(settings, 'KERNEL_TIMER_BATCH_SIZE', 500)
+        self.poll_interval = poll_interval or getattr(settings, 'KERNEL_TIMER_POLL_INTERVAL', 0.1)
+        self.lease_ttl = timedelta(seconds=getattr(settings, 'KERNEL_TIMER_LEASE_TTL', 30))
+        self.reload_interval = timedelta(seconds=getattr(settings, 'KERNEL_TIMER_RELOAD_INTERVAL', 60))
+        self.queue = TimerQueue()
+        self.is_leader = False
+        self.late_limit = timedelta(seconds=getattr(settings, 'KERNEL_TIMER_LATE_LIMIT', 3600))
+        self.watermark = None     # 已触发的最晚到期时间
+        self.loaded_until = None  # 已装载的到期时间上界
+        self.late_floor = None    # 补发下界：不晚于此的过期定时器不再补发
+        self.max_window = None    # 待触发进程的最长时间窗，限定时间窗结束定时器的范围查询
+        self.fired_timers: Dict[TimerKey, datetime] = {}  # 本实例触发过的、晚于补发下界的定时器
+        self.generation = None
+        self.synced_at = None
+        self.reloaded_at = None
+        self.lease_renewed_at = None
+        self.fired = 0
+        self.calls = 0
+
+    # ---------- 租约 ----------
+    def acquire(self) -> bool:
+        """抢占或续租定时器租约；新取得租约时从水位线重新装载"""
+        was_leader = self.is_leader
+        self.is_leader = try_acquire_lease(TIMER_LEASE, self.worker_id, self.lease_ttl, TIMER_ADVISORY_LOCK)
+        self.lease_renewed_at = timezone.now()
+        if self.is_leader and not was_leader:
+            self.restore()
+        elif was_leader and not self.is_leader:
+            print(f"[TimerWheel] {self.worker_id} 失去定时器租约")
+            self.queue.clear()
+        return self.is_leader
+
+    def resign(self):
+        """退出：让出定时器租约"""
+        SchedulerLease.objects.filter(name=TIMER_LEASE, owner=self.worker_id).update(expires_at=None)
+        self.is_leader = False
+        self.queue.clear()
+
+    def _save_watermark(self, watermark: datetime) -> bool:
+        """持久化水位线；租约已不属于本实例（已被其它实例接任）时让出领导并返回 False"""
+        # 补发的过期定时器早于水位线，水位线不回退
+        if self.watermark is not None and watermark <= self.watermark:
+            return True
+        updated = SchedulerLease.objects.filter(name=TIMER_LEASE, owner=self.worker_id).update(
+            data={'watermark': watermark.isoformat()}
+        )
+        if not updated:
+            print(f"[TimerWheel] {self.worker_id} 租约已被接任，停止触发")
+            self.is_leader = False
+            self.queue.clear()
+            return False
+        self.watermark = watermark
+        return True
+
+    # ---------- 装载 ----------
+    def restore(self):
+        """自持久化的水位线重新装载定时器（首次运行时从当前时刻开始）"""
+        now = timezone.now()
+        data = SchedulerLease.objects.filter(name=TIMER_LEASE).values_list('data', flat=True).first() or {}
+        watermark = parse_datetime(data['watermark']) if data.get('watermark') else None
+        self.queue.clear()
+        self.watermark = watermark or now
+        self.loaded_until = self.watermark
+        self.late_floor = self.watermark
+        self.fired_timers.clear()
+        self.max_window = self._max_window()
+        self.generation = cache.get(GENERATION_KEY, 0)
+        self.synced_at = now
+        self.extend(now)
+        self.reloaded_at = now
+        print(f"[TimerWheel] {self.worker_id} 自 {self.watermark.isoformat()} 装载定时器 {len(self.queue)} 个")
+
+    def _max_window(self) -> Optional[timedelta]:
+        return pending_timer_queryset().aggregate(max_window=Max('time_window'))['max_window']
+
+    def _schedule_process(self, process_id, state, scheduled_time, time_window):
+        """
+        按进程当前计划设置其定时器：(水位线, 装载上界] 内的按到期时间排队；
+        已过期但晚于补发下界、且本实例未触发过的，按原到期时间排队，随即补发；其余取消。
+        """
+        if time_window and (self.max_window is None or time_window > self.max_window):
+            self.max_window = time_window
+        deadlines = process_deadlines(scheduled_time, time_window) if state != ProcessState.TERMINATED.name else {}
+        for kind in (TIMER_SCHEDULED, TIMER_WINDOW_END):
+            key, due = (process_id, kind), deadlines.get(kind)
+            if due is not None and self.watermark < due <= self.loaded_until:
+                self.queue.schedule(key, due)
+            elif due is not None and self.late_floor < due <= self.watermark and self.fired_timers.get(key) != due:
+                self.queue.schedule(key, due)
+            else:
+                self.queue.cancel(key)
+
+    def extend(self, now: datetime) -> int:
+        """
+        装载窗口推进到 now + horizon：一次计划时间索引范围查询取出新进入窗口的定时器。
+        计划时间落在 (start, until] 的进程，以及时间窗结束落在 (start, until] 的进程各只读入一次；
+        后者的计划时间不早于 start - 最长时间窗，范围查询以此为下界。
+        """
+        start, until = self.loaded_until, now + self.horizon
+        if until <= start:
+            return 0
+        rows = pending_timer_queryset().filter(scheduled_time__lte=until)
+        if self.max_window:
+            rows = rows.filter(scheduled_time__gt=start - self.max_window).annotate(
+                window_end=F('scheduled_time') + F('time_window')
+            ).filter(
+                Q(scheduled_time__gt=start) | Q(window_end__gt=start, window_end__lte=until)
+            )
+        else:
+            rows = rows.filter(scheduled_time__gt=start)
+        rows = rows.values_list('id', 'state', 'scheduled_time', 'time_window')
+        self.loaded_until = until
+        count = 0
+        for row in rows.iterator(chunk_size=2000):
+            self._schedule_process(*row)
+            count += 1
+        return count
+
+    def reload(self, now: datetime):
+        """重新装载整个窗口，兜底增量同步可能遗漏的变更；同时推进补发下界、清理触发记录"""
+        self.late_floor = max(self.late_floor, now - self.late_limit)
+        self.fired_timers = {key: due for key, due in self.fired_timers.items() if due > self.late_floor}
+        self.max_window = self._max_window()
+        self.loaded_until = self.watermark
+        self.extend(now)
+        self.reloaded_at = now
+
+    def sync(self) -> int:
+        """共享代数变化时，按更新时间增量同步计划有变化的进程"""
+        generation = cache.get(GENERATION_KEY, 0)
+        if generation == self.generation:
+            return 0
+        started = timezone.now()
+        rows = Process.objects.filter(
+            scheduled_time__isnull=False, updated_at__gte=self.synced_at - SYNC_SLACK
+        ).values_list('id', 'state', 'scheduled_time', 'time_window')
+        count = 0
+        for row in rows.iterator(chunk_size=2000):
+            self._schedule_process(*row)
+            count += 1
+        self.generation = generation
+        self.synced_at = started
+        return count
+
+    # ---------- 触发 ----------
+    def fire_due(self, now: datetime = None) -> int:
+        """分批触发已到期的定时器，每批之后推进水位线，返回触发的定时器数；租约被接任时立即停止"""
+        now = now or timezone.now()
+        fired = 0
+        while True:
+            due = self.queue.pop_due(now, self.batch_size)
+            if not due:
+                break
+            fired += self._fire(due)
+            if not self._save_watermark(due[-1][1]):
+                break
+        return fired
+
+    def _fire(self, due: List[Tuple[TimerKey, datetime]]) -> int:
+        """按数据库中进程的当前计划复核后，以定时事件规则批量评估"""
+        processes = Process.objects.select_related('service', 'operator').in_bulk({key[0] for key, _ in due})
+        fired_at = timezone.now().isoformat()
+        timers = []
+        for (process_id, kind), when in due:
+            process = processes.get(process_id)
+            if process is None or process.state == ProcessState.TERMINATED.name:
+                continue
+            if process_deadlines(process.scheduled_time, process.time_window).get(kind) != when:
+                # 已改期，新的到期时间由增量同步装载
+                continue
+            self.fired_timers[(process_id, kind)] = when
+            timers.append((process, {'timer': kind, 'timer_due': when.isoformat(), 'timer_fired_at': fired_at}))
+        if timers:
+            self.calls += RuleEvaluator().evaluate_timers(timers)
+        self.fired += len(timers)
+        return len(timers)
+
+    # ---------- 主循环 ----------
+    def step(self) -> float:
+        """一次循环：续租、同步、装载、触发，返回下一次循环前应睡眠的秒数"""
+        now = timezone.now()
+        if self.lease_renewed_at is None or now - self.lease_renewed_at >= self.lease_ttl / 3:
+            self.acquire()
+        if not self.is_leader:
+            return self.poll_interval
+
+        self.sync()
+        if now - self.reloaded_at >= self.reload_interval:
+            self.reload(now)
+        else:
+            self.extend(now)
+        self.fire_due(now)
+
+        next_due = self.queue.next_due()
+        if next_due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max((next_due - timezone.now()).total_seconds(), 0))
+
+    def run(self, stop=None):
+        """持续运行直到 stop（threading.Event）被置位或进程中断，退出时让出租约"""
+        print(f"[TimerWheel] {self.worker_id} 启动")
+        try:
+            while stop is None or not stop.is_set():
+                time.sleep(self.step())
+        finally:
+            self.resign()
+            print(f"[TimerWheel] {self.worker_id} 退出，共触发定时器 {self.fired} 个，发出系统调用 {self.calls} 个")
+
+    def stats(self) -> dict:
+        return {
+            'worker_id': self.worker_id,
+            'is_leader': self.is_leader,
+            'pending': len(self.queue),
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+            'loaded_until': self.loaded_until.isoformat() if self.loaded_until else None,
+            'late_floor': self.late_floor.isoformat() if self.late_floor else None,
+            'fired': self.fired,
+            'calls': self.calls,
+        }
+
+def notify_timer_changed():
+    """递增定时器共享代数，通知定时器引擎增量同步"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+def on_process_timer_changed(sender, instance: Process, **kwargs):
+    """设置了计划时间的进程保存提交后通知定时器引擎"""
+    if instance.scheduled_time is not None:
+        transaction.on_commit(notify_timer_changed)
+
+post_save.connect(on_process_timer_changed, sender=Process, dispatch_uid="notify_timer_wheel_on_process_save")
@@ -1,4 +1,6 @@
 from enum import Enum, auto
+import json
+import jsonschema
 
 class ProcessState(Enum):
     """进程状态枚举"""
@@ -40,8 +42,9 @@ CONTEXT_SCHEMA = {
                 "properties": {
                     "process_id": {"type": "string"},
                     "status": {"type": "string"},
+                    "parent": {"type": ["integer", "null"]},  # 父帧在栈中的下标
                     "local_vars": {"type": "object"},
-                    "inherited_context": {"type": "object"},
+                    "inherited_context": {"type": "object"},  # 旧版快照：父帧变量的副本
                     "return_value": {},
                     "error_info": {},
                     "program_pointer": {},
@@ -51,10 +54,27 @@ CONTEXT_SCHEMA = {
                     "scheduling_info": {"type": "object"},
                     "events_triggered_log": {"type": "array", "items": {"type": "object"}}
                 },
-                "required": ["process_id", "status", "local_vars", "inherited_context"]
+                "required": ["process_id", "status", "local_vars"]
             }
         },
         # "timestamp": {"type": "string", "format": "date-time"}
     },
     "required": ["frames"]
-}
\ No newline at end of file
+}
+
+# 预编译的上下文校验器，避免每次校验时重新解析和检查schema
+CONTEXT_VALIDATOR = jsonschema.validators.validator_for(CONTEXT_SCHEMA)(CONTEXT_SCHEMA)
+
+class CanonicalJSON:
+    """已序列化的规范JSON文本，写入JSONField时直接使用该文本而不再重新序列化"""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+class CanonicalJSONEncoder(json.JSONEncoder):
+    """JSONField编码器：遇到CanonicalJSON时原样输出其文本"""
+    def encode(self, o):
+        if isinstance(o, CanonicalJSON):
+            return o.text
+        return super().encode(o)
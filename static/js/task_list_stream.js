@@ -0,0 +1,96 @@
+// 任务列表增量推送客户端（服务端见 kernel/task_stream.py）
+// 连接后先收到全量 snapshot，此后只收到 delta；序号不连续时发送 resync 请求重新取得全量。
+// 连接意外断开后自动重连，并携带续传令牌 resume=epoch:seq，只补收错过的增量。
+class TaskListStream {
+    constructor(url, onChange) {
+        this.url = url;
+        this.onChange = onChange;   // 列表变化回调，参数为最新的列表数组
+        this.epoch = null;          // 服务端流状态标识，状态重置后变化
+        this.seq = null;            // 当前已应用的序号，null 表示尚未取得全量
+        this.lists = [];
+        this.socket = null;
+        this.closed = false;
+        this.retryDelay = 1000;
+    }
+
+    open() {
+        let url = this.url;
+        if (this.epoch !== null && this.seq !== null) {
+            url += (url.includes('?') ? '&' : '?') + 'resume=' + encodeURIComponent(this.epoch + ':' + this.seq);
+        }
+        this.socket = new WebSocket(url);
+        this.socket.onopen = () => {
+            this.retryDelay = 1000;
+        };
+        this.socket.onmessage = (event) => this.handle(JSON.parse(event.data));
+        this.socket.onclose = () => {
+            if (this.closed) return;
+            // 指数退避重连，最长30秒
+            setTimeout(() => this.open(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        };
+        return this;
+    }
+
+    close() {
+        this.closed = true;
+        if (this.socket) this.socket.close();
+    }
+
+    resync() {
+        this.seq = null;
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify({action: 'resync'}));
+        }
+    }
+
+    handle(message) {
+        if (message.type === 'snapshot') {
+            // 新连接的全量可能晚于同序号的组内增量到达，旧于当前状态的全量忽略
+            if (this.epoch === message.epoch && this.seq !== null && message.seq < this.seq) return;
+            this.epoch = message.epoch;
+            this.seq = message.seq;
+            this.lists = message.lists;
+            this.onChange(this.lists);
+            return;
+        }
+        if (message.type !== 'delta' || this.seq === null) return;
+        if (message.epoch !== this.epoch) {
+            this.resync();
+            return;
+        }
+        if (message.seq <= this.seq) return;
+        if (message.base !== this.seq) {
+            this.resync();
+            return;
+        }
+
+        const lists = this.lists.slice();
+        for (const change of message.lists) {
+            const current = lists[change.list];
+            if (!current) {
+                this.resync();
+                return;
+            }
+            const removed = new Set(change.remove);
+            let rows = current.task_list.filter(row => !removed.has(row._key));
+            // 已有行原位更新，新行按下标（升序）插入
+            for (const {index, row} of change.upsert) {
+                const position = rows.findIndex(item => item._key === row._key);
+                if (position >= 0) {
+                    rows[position] = row;
+                } else {
+                    rows.splice(index, 0, row);
+                }
+            }
+            if (change.order) {
+                const byKey = new Map(rows.map(row => [row._key, row]));
+                rows = change.order.map(key => byKey.get(key)).filter(row => row !== undefined);
+            }
+            lists[change.list] = Object.assign({}, current, {task_list: rows});
+        }
+        this.seq = message.seq;
+        this.lists = lists;
+        this.onChange(this.lists);
+    }
+}